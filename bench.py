@@ -0,0 +1,718 @@
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+
+import numba
+
+from numba import get_num_threads, set_num_threads, parallel_chunksize, config
+from settings import *
+from terrain_gen import generate_chunks, get_column_cache
+from noise import noise2, noise3, noise2_grid, noise3_block
+from meshes.chunk_mesh_builder import MESH_BUILDERS, get_vertex_scratch, get_face_neighbour, get_padded_segment
+from voxel_handler import VoxelHandler
+from chunk_storage import ChunkStorage, PaletteVoxels, encode_voxels
+from region_store import RegionStore
+from mesh_cache import MeshCache
+from jit_kernels import get_kernels, compile_kernel
+from meshes.chunk_mesh import build_sections
+from mobile import Mobile
+from frustum import Frustum
+from headless import HeadlessApp
+
+
+def get_region(size):
+    # chunk positions of a size x size column block around the world center
+    x0 = z0 = (WORLD_W - size) // 2
+    return [(x, y, z) for x in range(x0, x0 + size) for y in range(WORLD_H) for z in range(z0, z0 + size)]
+
+
+def get_chunk_index(position):
+    x, y, z = position
+    return x + WORLD_W * z + WORLD_AREA * y
+
+
+def get_chunk_columns(positions):
+    return np.array(sorted({(x, z) for x, _, z in positions}), dtype='int64')
+
+
+def generate_voxels(positions):
+    # dense voxels of the region, indexed by chunk index
+    chunk_columns = get_chunk_columns(positions)
+    chunk_voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+    with parallel_chunksize(1):
+        generate_chunks(chunk_voxels, chunk_columns)
+
+    voxels = np.zeros([WORLD_VOL, CHUNK_VOL], dtype='uint8')
+    for i, (x, z) in enumerate(chunk_columns):
+        for y in range(WORLD_H):
+            voxels[get_chunk_index((x, y, z))] = chunk_voxels[i * WORLD_H + y]
+    return voxels
+
+
+@njit
+def get_world_chunk_index(world_voxel_pos):
+    wx, wy, wz = world_voxel_pos
+    cx = wx // CHUNK_SIZE
+    cy = wy // CHUNK_SIZE
+    cz = wz // CHUNK_SIZE
+    if not (0 <= cx < WORLD_W and 0 <= cy < WORLD_H and 0 <= cz < WORLD_D):
+        return -1
+    return cx + WORLD_W * cz + WORLD_AREA * cy
+
+
+@njit
+def get_voxel_id(local_voxel_pos, world_voxel_pos, world_voxels):
+    # voxel of the dense world, -1 outside of it, the lookup the meshers used before padded voxels
+    chunk_index = get_world_chunk_index(world_voxel_pos)
+    if chunk_index == -1:
+        return -1
+    chunk_voxels = world_voxels[chunk_index]
+
+    x, y, z = local_voxel_pos
+    voxel_index = x % CHUNK_SIZE + z % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE * CHUNK_AREA
+    return chunk_voxels[voxel_index]
+
+
+@njit
+def get_padded_voxels(chunk_voxels, chunk_pos, world_voxels):
+    # ChunkStorage.get_padded_voxels of the dense world, indexed as [y, z, x], voxels outside the world are left empty
+    padded_voxels = np.zeros((PADDED_CHUNK_SIZE, PADDED_CHUNK_SIZE, PADDED_CHUNK_SIZE), dtype='uint8')
+    padded_voxels[1:-1, 1:-1, 1:-1] = chunk_voxels.reshape((CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+
+    cx, cy, cz = chunk_pos
+    for dx in range(-1, 2):
+        x0, x1, sx = get_padded_segment(dx)
+        for dy in range(-1, 2):
+            y0, y1, sy = get_padded_segment(dy)
+            for dz in range(-1, 2):
+                if dx == 0 and dy == 0 and dz == 0:
+                    continue
+                z0, z1, sz = get_padded_segment(dz)
+
+                neigh_index = get_world_chunk_index(
+                    ((cx + dx) * CHUNK_SIZE, (cy + dy) * CHUNK_SIZE, (cz + dz) * CHUNK_SIZE))
+                if neigh_index == -1:
+                    continue
+                neigh_voxels = world_voxels[neigh_index].reshape((CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+                padded_voxels[y0:y1, z0:z1, x0:x1] = neigh_voxels[
+                    sy:sy + y1 - y0, sz:sz + z1 - z0, sx:sx + x1 - x0
+                ]
+    return padded_voxels
+
+
+def get_section_positions():
+    n = SECTIONS_PER_AXIS
+    return [(x, y, z) for y in range(n) for z in range(n) for x in range(n)]
+
+
+def mesh_sections(builder, position, voxels, section_positions):
+    padded_voxels = get_padded_voxels(voxels[get_chunk_index(position)], position, voxels)
+    vertices = 0
+    for section_pos in section_positions:
+        solid, see_through = builder(
+            padded_voxels=padded_voxels,
+            format_size=1,
+            section_pos=section_pos,
+            block_flags=BLOCK_FLAGS,
+            vertex_scratch=get_vertex_scratch(1)
+        )
+        vertices += len(solid) + len(see_through)
+    return vertices
+
+
+def time_meshing(builder, positions, voxels):
+    vertices, start = 0, time.perf_counter()
+    for position in positions:
+        vertices += mesh_sections(builder, position, voxels, get_section_positions())
+    return vertices, time.perf_counter() - start
+
+
+def bench_meshing(args):
+    positions = get_region(args.size)
+    voxels = generate_voxels(positions)
+
+    results = {}
+    for name, builder in MESH_BUILDERS.items():
+        # first call compiles
+        time_meshing(builder, positions[:1], voxels)
+        vertices, elapsed = time_meshing(builder, positions, voxels)
+        results[name] = {'vertices': vertices, 'chunk_ms': elapsed / len(positions) * 1000}
+        print(f'{name:>10}: {vertices:10d} vertices {vertices * 4 / 2 ** 20:8.1f} MB'
+              f' {elapsed / len(positions) * 1000:8.2f} ms/chunk')
+    return results
+
+
+@njit
+def read_neighbours_world(chunk_voxels, chunk_pos, world_voxels):
+    # face and ao neighbour reads of every solid voxel through world lookups
+    cx, cy, cz = chunk_pos
+    total = 0
+    for x in range(CHUNK_SIZE):
+        for y in range(CHUNK_SIZE):
+            for z in range(CHUNK_SIZE):
+                if not chunk_voxels[x + CHUNK_SIZE * z + CHUNK_AREA * y]:
+                    continue
+                for face_id in range(6):
+                    nx, ny, nz = get_face_neighbour(face_id, x, y, z)
+                    for i in range(-1, 2):
+                        for j in range(-1, 2):
+                            lx, ly, lz = (nx, ny + i, nz + j) if face_id < 2 else (nx + i, ny, nz + j)
+                            total += get_voxel_id((lx, ly, lz), (lx + cx * CHUNK_SIZE, ly + cy * CHUNK_SIZE,
+                                                                 lz + cz * CHUNK_SIZE), world_voxels)
+    return total
+
+
+@njit
+def read_neighbours_padded(chunk_voxels, chunk_pos, world_voxels):
+    # same reads as read_neighbours_world through the padded chunk
+    padded_voxels = get_padded_voxels(chunk_voxels, chunk_pos, world_voxels)
+    total = 0
+    for x in range(CHUNK_SIZE):
+        for y in range(CHUNK_SIZE):
+            for z in range(CHUNK_SIZE):
+                if not padded_voxels[y + 1, z + 1, x + 1]:
+                    continue
+                for face_id in range(6):
+                    nx, ny, nz = get_face_neighbour(face_id, x + 1, y + 1, z + 1)
+                    for i in range(-1, 2):
+                        for j in range(-1, 2):
+                            lx, ly, lz = (nx, ny + i, nz + j) if face_id < 2 else (nx + i, ny, nz + j)
+                            total += padded_voxels[ly, lz, lx]
+    return total
+
+
+def bench_neighbours(args):
+    positions = get_region(args.size)
+    voxels = generate_voxels(positions)
+
+    results = {}
+    for name, reader in (('world', read_neighbours_world), ('padded', read_neighbours_padded)):
+        reader(voxels[0], (0, 0, 0), voxels)
+        start = time.perf_counter()
+        for position in positions:
+            reader(voxels[get_chunk_index(position)], position, voxels)
+        elapsed = time.perf_counter() - start
+        results[name] = {'chunk_ms': elapsed / len(positions) * 1000}
+        print(f'{name:>10}: {elapsed / len(positions) * 1000:8.2f} ms/chunk')
+    return results
+
+
+def get_surface_edits(positions, voxels, count, seed=SEED):
+    # world positions of the top voxel of random columns in the region
+    rng = np.random.default_rng(seed)
+    edits = []
+    while len(edits) < count:
+        cx, _, cz = positions[rng.integers(len(positions))]
+        x, z = rng.integers(CHUNK_SIZE, size=2)
+        for cy in reversed(range(WORLD_H)):
+            column = voxels[get_chunk_index((cx, cy, cz))].reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[:, z, x]
+            solid = np.flatnonzero(column)
+            if len(solid):
+                edits.append(glm.ivec3(cx * CHUNK_SIZE + x, cy * CHUNK_SIZE + solid[-1], cz * CHUNK_SIZE + z))
+                break
+    return edits
+
+
+def bench_edit(args):
+    # cpu side of edit to visible: remeshing after removing a surface voxel, the gpu upload is not included
+    positions = get_region(args.size)
+    voxels = generate_voxels(positions)
+    builder = MESH_BUILDERS[MESH_BUILDER]
+    mesh_sections(builder, positions[0], voxels, get_section_positions())
+
+    def rebuild_chunk(voxel_world_pos):
+        mesh_sections(builder, tuple(voxel_world_pos // CHUNK_SIZE), voxels, get_section_positions())
+
+    def rebuild_sections(voxel_world_pos):
+        for chunk_index, section_indices in VoxelHandler.get_touched_sections(voxel_world_pos).items():
+            y, rest = divmod(chunk_index, WORLD_AREA)
+            z, x = divmod(rest, WORLD_W)
+            section_positions = get_section_positions()
+            mesh_sections(builder, (x, y, z), voxels, [section_positions[i] for i in section_indices])
+
+    edits = get_surface_edits(positions, voxels, args.edits)
+    results = {}
+    for name, rebuild in (('chunk', rebuild_chunk), ('sections', rebuild_sections)):
+        latencies = []
+        for voxel_world_pos in edits:
+            start = time.perf_counter()
+            rebuild(voxel_world_pos)
+            latencies.append(time.perf_counter() - start)
+        latencies = np.array(latencies) * 1000
+        results[name] = {'mean_ms': float(latencies.mean()), 'p95_ms': float(np.percentile(latencies, 95)),
+                         'max_ms': float(latencies.max())}
+        print(f'{name:>10}: mean {latencies.mean():7.2f} ms  p95 {np.percentile(latencies, 95):7.2f} ms'
+              f'  max {latencies.max():7.2f} ms')
+    return results
+
+
+def bench_terrain(args):
+    # generation of the region on 1, 2, 4 ... threads, the output must not depend on the thread count
+    positions = get_region(args.size)
+    chunk_columns = get_chunk_columns(positions)
+    generate_voxels(positions[:1])
+
+    thread_counts = sorted({min(2 ** i, config.NUMBA_NUM_THREADS) for i in range(8)})
+    default_threads = get_num_threads()
+    reference, base_time = None, None
+    results = {}
+    for threads in thread_counts:
+        set_num_threads(threads)
+        voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+        start = time.perf_counter()
+        with parallel_chunksize(1):
+            generate_chunks(voxels, chunk_columns)
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference, base_time = voxels, elapsed
+        results[threads] = {'chunk_ms': elapsed / len(positions) * 1000, 'speedup': base_time / elapsed,
+                            'identical': bool(np.array_equal(voxels, reference))}
+        print(f'{threads:>4} threads: {elapsed / len(positions) * 1000:8.2f} ms/chunk'
+              f'  speedup {base_time / elapsed:5.2f}x  identical {results[threads]["identical"]}')
+    set_num_threads(default_threads)
+    return results
+
+
+@njit
+def sample_noise2(xs, ys):
+    # one call per point, the way terrain generation sampled before the grid api
+    out = np.empty((len(xs), len(ys)))
+    for i in range(len(xs)):
+        for j in range(len(ys)):
+            out[i, j] = noise2(xs[i], ys[j])
+    return out
+
+
+@njit
+def sample_noise3(xs, ys, zs):
+    out = np.empty((len(xs), len(ys), len(zs)))
+    for i in range(len(xs)):
+        for j in range(len(ys)):
+            for k in range(len(zs)):
+                out[i, j, k] = noise3(xs[i], ys[j], zs[k])
+    return out
+
+
+def time_samples(sampler, *coords):
+    sampler(*(c[:2] for c in coords))
+    start = time.perf_counter()
+    sampler(*coords)
+    samples = np.prod([len(c) for c in coords])
+    return samples / (time.perf_counter() - start)
+
+
+def bench_noise(args):
+    # noise samples per second of point and grid evaluation, then the column cache over the whole world
+    coords2 = [np.arange(args.size * CHUNK_SIZE) * 0.005] * 2
+    coords3 = [np.arange(CHUNK_SIZE) * 0.09] * 3
+    results = {}
+    for name, sampler, coords in (('noise2 point', sample_noise2, coords2), ('noise2 grid', noise2_grid, coords2),
+                                  ('noise3 point', sample_noise3, coords3), ('noise3 block', noise3_block, coords3)):
+        results[name] = {'samples_per_s': float(time_samples(sampler, *coords))}
+        print(f'{name:>14}: {results[name]["samples_per_s"] / 1e6:8.2f} M samples/s')
+
+    get_column_cache(0, 0)
+    start = time.perf_counter()
+    for x in range(WORLD_W):
+        for z in range(WORLD_D):
+            get_column_cache(x * CHUNK_SIZE, z * CHUNK_SIZE)
+    elapsed = time.perf_counter() - start
+    results['column cache'] = {'columns_per_s': WORLD_AREA * CHUNK_AREA / elapsed}
+    print(f'{"column cache":>14}: {WORLD_AREA * CHUNK_AREA / elapsed / 1e6:8.2f} M columns/s')
+    return results
+
+
+def bench_caves(args):
+    # interpolated cave density against the exact noise3 of every voxel, fails above CAVE_NOISE_MAX_ERROR
+    positions = get_region(args.size)
+    chunk_columns = get_chunk_columns(positions)
+
+    voxels_by_step, results = {}, {}
+    for cave_step in (1, args.cave_step):
+        voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+        generate_chunks(voxels, chunk_columns[:1], cave_step)
+        start = time.perf_counter()
+        with parallel_chunksize(1):
+            generate_chunks(voxels, chunk_columns, cave_step)
+        elapsed = time.perf_counter() - start
+        voxels_by_step[cave_step] = voxels
+        results[f'step {cave_step}'] = {'chunk_ms': elapsed / len(positions) * 1000}
+        print(f'step {cave_step:>3}: {elapsed / len(positions) * 1000:8.2f} ms/chunk')
+
+    error = np.count_nonzero(voxels_by_step[1] != voxels_by_step[args.cave_step]) / voxels_by_step[1].size
+    results['error'] = {'differing_voxels': error, 'bound': CAVE_NOISE_MAX_ERROR}
+    print(f'differing voxels: {error:.4f}  bound {CAVE_NOISE_MAX_ERROR:.4f}')
+    if error > CAVE_NOISE_MAX_ERROR:
+        raise SystemExit('interpolated caves exceed CAVE_NOISE_MAX_ERROR')
+    return results
+
+
+def bench_storage(args):
+    # memory of the encoded region against dense voxels, padded voxels through the storage and the dense array
+    positions = get_region(args.size)
+    voxels = generate_voxels(positions)
+
+    storage = ChunkStorage()
+    storage.set_voxels(0, voxels[get_chunk_index(positions[0])])
+    start = time.perf_counter()
+    for position in positions:
+        storage.set_voxels(get_chunk_index(position), voxels[get_chunk_index(position)])
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for position in positions:
+        kind = type(storage.chunks[get_chunk_index(position)]).__name__
+        counts[kind] = counts.get(kind, 0) + 1
+    nbytes = sum(storage.chunks[get_chunk_index(position)].nbytes for position in positions)
+    results = {'encoded': {'chunks': counts, 'nbytes': nbytes, 'dense_nbytes': len(positions) * CHUNK_VOL,
+                           'chunk_ms': elapsed / len(positions) * 1000}}
+    print(f'{len(positions)} chunks {counts}')
+    print(f'{"encoded":>10}: {nbytes / 2 ** 20:8.1f} MB  dense {len(positions) * CHUNK_VOL / 2 ** 20:8.1f} MB'
+          f'  encode {elapsed / len(positions) * 1000:6.2f} ms/chunk')
+
+    for name, get_padded in (('dense', lambda p: get_padded_voxels(voxels[get_chunk_index(p)], p, voxels)),
+                             ('storage', storage.get_padded_voxels)):
+        get_padded(positions[0])
+        start = time.perf_counter()
+        for position in positions:
+            get_padded(position)
+        elapsed = time.perf_counter() - start
+        results[name] = {'chunk_ms': elapsed / len(positions) * 1000}
+        print(f'{name:>10}: {elapsed / len(positions) * 1000:8.2f} ms/padded chunk')
+    return results
+
+
+def bench_region(args):
+    # cold start generating and encoding the region against warm loads of its saved region files
+    positions = get_region(args.size)
+    chunk_columns = get_chunk_columns(positions)
+    generate_voxels(positions[:1])
+
+    start = time.perf_counter()
+    storage = ChunkStorage()
+    chunk_voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+    with parallel_chunksize(1):
+        is_empty = generate_chunks(chunk_voxels, chunk_columns)
+    for i, (x, z) in enumerate(chunk_columns):
+        for y in range(WORLD_H):
+            if not is_empty[i * WORLD_H + y]:
+                storage.set_voxels(get_chunk_index((x, y, z)), chunk_voxels[i * WORLD_H + y])
+    results = {'cold': {'ms': (time.perf_counter() - start) * 1000}}
+    print(f'{"cold":>14}: {results["cold"]["ms"]:8.1f} ms')
+    storage.get_voxels(get_chunk_index(positions[0]))
+
+    for compressed in (True, False):
+        with tempfile.TemporaryDirectory() as path:
+            RegionStore(path, compressed).save(storage)
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+            start = time.perf_counter()
+            loaded_storage = ChunkStorage()
+            RegionStore(path, compressed).load(loaded_storage)
+            loaded = time.perf_counter() - start
+            for position in positions:
+                loaded_storage.get_voxels(get_chunk_index(position))
+            decoded = time.perf_counter() - start
+
+            name = 'warm zlib' if compressed else 'warm mmap'
+            results[name] = {'ms': loaded * 1000, 'decoded_ms': decoded * 1000, 'nbytes': size}
+            print(f'{name:>14}: {loaded * 1000:8.1f} ms  with every chunk decoded {decoded * 1000:8.1f} ms'
+                  f'  {size / 2 ** 20:6.1f} MB on disk')
+    return results
+
+
+def bench_mesh_cache(args):
+    # meshing every section of the region against loading them from a cold and a warm mesh cache
+    positions = get_region(args.size)
+    storage = ChunkStorage()
+    voxels = generate_voxels(positions)
+    for position in positions:
+        storage.set_voxels(get_chunk_index(position), voxels[get_chunk_index(position)])
+    builder, section_positions = MESH_BUILDERS[MESH_BUILDER], get_section_positions()
+    mesh_sections(builder, positions[0], voxels, section_positions[:1])
+
+    def build(padded_voxels):
+        return [builder(padded_voxels=padded_voxels, format_size=1, section_pos=section_pos,
+                        block_flags=BLOCK_FLAGS, vertex_scratch=get_vertex_scratch(1))
+                for section_pos in section_positions]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as path:
+        for name in ('cold', 'warm'):
+            start = time.perf_counter()
+            mesh_cache = MeshCache(path)
+            hashing = 0
+            for position in positions:
+                padded_voxels = storage.get_padded_voxels(position)
+                hash_start = time.perf_counter()
+                key = mesh_cache.get_key(padded_voxels)
+                hashing += time.perf_counter() - hash_start
+                if mesh_cache.get(key) is None:
+                    mesh_cache.put(key, build(padded_voxels))
+            total = time.perf_counter() - start
+            mesh_cache.save()
+
+            metrics = mesh_cache.get_metrics()
+            results[name] = {'ms': total * 1000, 'hashing_ms': hashing * 1000, **metrics}
+            print(f'{name:>6}: {total * 1000:8.1f} ms  hashing {hashing * 1000:6.1f} ms'
+                  f'  hits {metrics["hits"]:5}  misses {metrics["misses"]:5}'
+                  f'  {metrics["nbytes"] / 2 ** 20:6.1f} MB cached')
+    return results
+
+
+def get_kernel_samples(positions):
+    # arguments of a call of every signature of the entry kernels, taken from the first palette chunk of the region
+    voxels = generate_voxels(positions)
+    storage = ChunkStorage()
+    for position in positions:
+        storage.set_voxels(get_chunk_index(position), voxels[get_chunk_index(position)])
+    position = next(position for position in positions
+                    if isinstance(storage.chunks[get_chunk_index(position)], PaletteVoxels))
+    chunk = storage.chunks[get_chunk_index(position)]
+    chunk_voxels = np.empty([WORLD_H, CHUNK_VOL], dtype='uint8')
+    chunk_columns = get_chunk_columns([position])
+
+    lookup = np.zeros(256, dtype='uint8')
+    lookup[chunk.palette] = np.arange(len(chunk.palette))
+    box = 0, CHUNK_SIZE, 0, CHUNK_SIZE, 0, 1
+    dense_voxels = voxels[get_chunk_index(position)]
+
+    return {
+        'generate_chunks': [(chunk_voxels, chunk_columns)],
+        'count_voxel_ids': [(dense_voxels,)],
+        'pack_indices': [(dense_voxels, lookup, chunk.bits)],
+        'unpack_indices': [(chunk.packed, chunk.palette, chunk.bits)],
+        'unpack_box': [(chunk.packed, chunk.palette, chunk.bits, *box)],
+        'get_padded_segment': [(-1,)],
+        MESH_BUILDERS[MESH_BUILDER].__name__: [
+            (storage.get_padded_voxels(position), 1, (0, 0, 0), BLOCK_FLAGS, get_vertex_scratch(1))],
+    }
+
+
+def time_call(function, call_args, repeat=5):
+    # seconds of the first and of the fastest of the following calls
+    start = time.perf_counter()
+    function(*call_args)
+    first = time.perf_counter() - start
+    best = first
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*call_args)
+        best = min(best, time.perf_counter() - start)
+    return first, best
+
+
+def bench_jit(args):
+    # compile or disk cache load time of every entry kernel signature against the time of a call,
+    # run it twice to see a cold cache and a warm one
+    start = time.perf_counter()
+    timings = {name: [(signature, *compile_kernel(dispatcher, signature)) for signature in signatures]
+               for _, name, dispatcher, signatures in get_kernels()}
+    results = {'warmup': {'ms': (time.perf_counter() - start) * 1000}}
+    print(f'jit cache {JIT_CACHE_DIR}  warmup {results["warmup"]["ms"]:8.1f} ms')
+
+    samples = get_kernel_samples(get_region(args.size))
+    for _, name, dispatcher, _ in get_kernels():
+        results[name] = []
+        for i, (signature, seconds, how) in enumerate(timings[name]):
+            first, best = time_call(dispatcher, samples[name][i])
+            results[name].append({'signature': str(signature), 'how': how, 'ms': seconds * 1000,
+                                  'first_call_ms': first * 1000, 'call_ms': best * 1000})
+            print(f'{name:>32}: {how:>8} {seconds * 1000:8.1f} ms  first call {first * 1000:8.3f} ms'
+                  f'  call {best * 1000:8.3f} ms')
+    return results
+
+
+def time_calls(function, warmup_calls, calls):
+    # seconds of every call, the warmup calls before them are not timed, they compile the kernels and warm the caches
+    for call_args in warmup_calls:
+        function(*call_args)
+    seconds = []
+    for call_args in calls:
+        start = time.perf_counter()
+        function(*call_args)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def get_stats(seconds, units=1):
+    # ms per call, units is the work done by a call, chunks or columns
+    ms = np.array(seconds) * 1000
+    return {
+        'calls': len(ms),
+        'units': units,
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'min_ms': float(ms.min()),
+        'unit_ms': float(ms.mean() / units),
+    }
+
+
+def get_poses(rng, count):
+    # players spread over the world above the water, looking down so most rays hit
+    poses = []
+    for _ in range(count):
+        location = glm.vec3(rng.uniform(0, WORLD_W * CHUNK_SIZE), rng.uniform(WATER_LINE, WORLD_H * CHUNK_SIZE),
+                            rng.uniform(0, WORLD_D * CHUNK_SIZE))
+        pose = Mobile(location, rng.uniform(0, 2 * math.pi), rng.uniform(-PITCH_MAX, 0))
+        pose.update()
+        poses.append(pose)
+    return poses
+
+
+def get_surface_voxels(world, chunk_columns, count, rng):
+    # world positions of the top voxel of distinct random voxel columns of the region
+    surface = []
+    for column in rng.permutation(len(chunk_columns) * CHUNK_AREA):
+        (cx, cz), (z, x) = chunk_columns[column // CHUNK_AREA], divmod(column % CHUNK_AREA, CHUNK_SIZE)
+        for cy in reversed(range(WORLD_H)):
+            voxels = world.storage.get_voxels(cx + WORLD_W * cz + WORLD_AREA * cy)
+            solid = np.flatnonzero(voxels.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[:, z, x])
+            if len(solid):
+                surface.append(glm.ivec3(cx * CHUNK_SIZE + x, cy * CHUNK_SIZE + solid[-1], cz * CHUNK_SIZE + z))
+                break
+        if len(surface) == count:
+            break
+    return surface
+
+
+def bench_hot_paths(args):
+    # the hot paths of the engine on a fresh world of the seed, without a window, the warmup calls keep jit
+    # compilation out, edits change the voxels and the journal but remesh nothing as the chunks have no meshes
+    rng = np.random.default_rng(args.seed)
+    positions = get_region(args.size)
+    chunk_columns = get_chunk_columns(positions)
+    warmup, repeat = args.warmup, args.repeat
+    results = {}
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        start = time.perf_counter()
+        app = HeadlessApp(save_dir)
+        world, voxel_handler = app.world, app.world.voxel_handler
+        print(f'world of {len(world.chunks)} chunks built in {time.perf_counter() - start:.2f} s')
+
+        chunk_voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+
+        def generate():
+            with parallel_chunksize(1):
+                generate_chunks(chunk_voxels, chunk_columns)
+
+        results['generate_chunks'] = get_stats(time_calls(generate, [()] * warmup, [()] * repeat), len(positions))
+
+        columns = [(x * CHUNK_SIZE, z * CHUNK_SIZE) for x, z in chunk_columns]
+        results['get_column_cache'] = get_stats(time_calls(get_column_cache, columns * warmup, columns * repeat))
+
+        padded = [(world.storage.get_padded_voxels(position),) for position in positions
+                  if not world.storage.is_empty(get_chunk_index(position))]
+        results['build_sections'] = get_stats(time_calls(build_sections, padded * warmup, padded * repeat))
+
+        poses = [(pose,) for pose in get_poses(rng, args.poses)]
+        player = app.player
+
+        def ray_cast(pose):
+            player.position = pose
+            voxel_handler.ray_cast()
+
+        results['ray_cast'] = get_stats(time_calls(ray_cast, poses * warmup, poses * repeat))
+
+        frustums = [(Frustum(pose),) for pose, in poses]
+        chunks = list(world.chunks.values())
+
+        def cull(frustum):
+            return [chunk for chunk in chunks if frustum.is_on_frustum(chunk)]
+
+        results['is_on_frustum'] = get_stats(time_calls(cull, frustums * warmup, frustums * repeat), len(chunks))
+
+        surface = get_surface_voxels(world, chunk_columns, 2 * (args.edits + warmup), rng)
+
+        def remove_voxel(voxel_world_pos):
+            # aims at the voxel the way a ray cast does, then removes it
+            voxel_handler.voxel_id, voxel_handler.voxel_index, _, voxel_handler.chunk = \
+                voxel_handler.get_voxel_id(voxel_world_pos)
+            voxel_handler.voxel_world_pos = voxel_world_pos
+            voxel_handler.remove_voxel()
+
+        edits = [(voxel_world_pos,) for voxel_world_pos in surface[:args.edits + warmup]]
+        results['remove_voxel'] = get_stats(time_calls(remove_voxel, edits[:warmup], edits[warmup:]))
+
+        spheres = [(voxel_world_pos, args.radius, 0) for voxel_world_pos in surface[args.edits + warmup:]]
+        results['fill_sphere'] = get_stats(time_calls(voxel_handler.fill_sphere, spheres[:warmup], spheres[warmup:]))
+
+        world.journal.close()
+        app.shutdown()
+
+    for name, stats in results.items():
+        print(f'{name:>18}: mean {stats["mean_ms"]:9.3f} ms  p50 {stats["p50_ms"]:9.3f} ms'
+              f'  p95 {stats["p95_ms"]:9.3f} ms  {stats["unit_ms"]:9.4f} ms/unit  {stats["calls"]:5} calls')
+    return results
+
+
+def get_commit():
+    # commit of the benchmarked tree, None outside a git checkout
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(path, args, results):
+    # results with what they depend on, to compare runs across commits and thread counts
+    with open(path, 'w') as file:
+        json.dump({
+            'benchmark': args.benchmark,
+            'commit': get_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numba': numba.__version__,
+            'cpu_count': os.cpu_count(),
+            'threads': get_num_threads(),
+            'threading_layer': numba.threading_layer(),
+            'seed': SEED,
+            'world_size': [WORLD_W, WORLD_H, WORLD_D, CHUNK_SIZE],
+            'mesh_builder': MESH_BUILDER,
+            'args': vars(args),
+            'results': results,
+        }, file, indent=2)
+    print(f'results saved to {path}')
+
+
+BENCHMARKS = {
+    'meshing': bench_meshing,
+    'neighbours': bench_neighbours,
+    'edit': bench_edit,
+    'terrain': bench_terrain,
+    'noise': bench_noise,
+    'caves': bench_caves,
+    'storage': bench_storage,
+    'region': bench_region,
+    'mesh_cache': bench_mesh_cache,
+    'jit': bench_jit,
+    'hot_paths': bench_hot_paths,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='headless benchmarks of the engine hot paths')
+    parser.add_argument('benchmark', choices=BENCHMARKS)
+    parser.add_argument('--size', type=int, default=4, help='side of the benchmarked block of chunk columns')
+    parser.add_argument('--edits', type=int, default=200, help='number of voxel edits')
+    parser.add_argument('--poses', type=int, default=100, help='number of player poses ray cast and culled from')
+    parser.add_argument('--radius', type=int, default=4, help='radius of the bulk edit spheres')
+    parser.add_argument('--cave-step', type=int, default=4, help='interpolated cave step compared to exact caves')
+    parser.add_argument('--seed', type=int, default=SEED, help='seed of the sampled poses and edits')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed passes over the calls, untimed edits')
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes over the calls')
+    parser.add_argument('--threads', type=int, help='numba threads, all of them by default')
+    parser.add_argument('--json', help='path of a json file the results are saved to')
+    args = parser.parse_args()
+    if args.threads is not None:
+        set_num_threads(args.threads)
+    results = BENCHMARKS[args.benchmark](args)
+    if args.json:
+        save_results(args.json, args, results)
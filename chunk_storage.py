@@ -0,0 +1,248 @@
+import threading
+from contextlib import contextmanager
+
+from settings import *
+from meshes.chunk_mesh_builder import get_padded_segment
+
+
+@njit(nogil=True)
+def count_voxel_ids(voxels):
+    counts = np.zeros(256, dtype=np.int64)
+    for i in range(len(voxels)):
+        counts[voxels[i]] += 1
+    return counts
+
+
+@njit(nogil=True)
+def pack_indices(voxels, lookup, bits):
+    # palette index of every voxel, bits wide, the first voxel in the low bits of a byte
+    per_byte = 8 // bits
+    packed = np.empty(CHUNK_VOL // per_byte, dtype=np.uint8)
+    for j in range(len(packed)):
+        byte = 0
+        for k in range(per_byte):
+            byte |= lookup[voxels[j * per_byte + k]] << (k * bits)
+        packed[j] = byte
+    return packed
+
+
+@njit
+def unpack_indices(packed, palette, bits):
+    per_byte = 8 // bits
+    mask = (1 << bits) - 1
+    voxels = np.empty(CHUNK_VOL, dtype=np.uint8)
+    for j in range(len(packed)):
+        byte = packed[j]
+        for k in range(per_byte):
+            voxels[j * per_byte + k] = palette[(byte >> (k * bits)) & mask]
+    return voxels
+
+
+@njit
+def unpack_box(packed, palette, bits, y0, y1, z0, z1, x0, x1):
+    # voxels of the local box, indexed as [y, z, x] from its corner
+    per_byte = 8 // bits
+    mask = (1 << bits) - 1
+    box = np.empty((y1 - y0, z1 - z0, x1 - x0), dtype=np.uint8)
+    for y in range(y0, y1):
+        for z in range(z0, z1):
+            for x in range(x0, x1):
+                i = x + CHUNK_SIZE * z + CHUNK_AREA * y
+                box[y - y0, z - z0, x - x0] = palette[(packed[i // per_byte] >> (i % per_byte * bits)) & mask]
+    return box
+
+
+class SingleVoxels:
+    """Chunk made of a single voxel id"""
+    def __init__(self, voxel_id):
+        self.voxel_id = voxel_id
+        self.nbytes = 1
+
+    def get(self, voxel_index):
+        return self.voxel_id
+
+    def decode(self):
+        return np.full(CHUNK_VOL, self.voxel_id, dtype='uint8')
+
+    def read_box(self, y0, y1, z0, z1, x0, x1):
+        return self.voxel_id
+
+
+class PaletteVoxels:
+    """Chunk of a few voxel ids, bit packed indices into their palette"""
+    def __init__(self, palette, bits, packed):
+        self.palette = palette
+        self.bits = bits
+        self.packed = packed
+        self.nbytes = palette.nbytes + packed.nbytes
+
+    def get(self, voxel_index):
+        per_byte = 8 // self.bits
+        byte = int(self.packed[voxel_index // per_byte])
+        return self.palette[(byte >> (voxel_index % per_byte * self.bits)) & ((1 << self.bits) - 1)]
+
+    def decode(self):
+        return unpack_indices(self.packed, self.palette, self.bits)
+
+    def read_box(self, y0, y1, z0, z1, x0, x1):
+        return unpack_box(self.packed, self.palette, self.bits, y0, y1, z0, z1, x0, x1)
+
+
+class DenseVoxels:
+    """Chunk with a byte per voxel"""
+    def __init__(self, voxels):
+        self.voxels = voxels
+        self.nbytes = voxels.nbytes
+
+    def get(self, voxel_index):
+        return self.voxels[voxel_index]
+
+    def decode(self):
+        # the stored array, written in place by ChunkStorage.edit only, and only while no snapshot holds it
+        return self.voxels
+
+    def read_box(self, y0, y1, z0, z1, x0, x1):
+        return self.voxels.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[y0:y1, z0:z1, x0:x1]
+
+
+def encode_voxels(voxels, copy=True):
+    # smallest representation of the chunk voxels, dense chunks keep the array unless copy is set
+    palette = np.flatnonzero(count_voxel_ids(voxels)).astype('uint8')
+    if len(palette) == 1:
+        return SingleVoxels(int(palette[0]))
+
+    for bits in CHUNK_PALETTE_BITS:
+        if len(palette) <= 1 << bits:
+            lookup = np.zeros(256, dtype='uint8')
+            lookup[palette] = np.arange(len(palette))
+            return PaletteVoxels(palette, bits, pack_indices(voxels, lookup, bits))
+
+    return DenseVoxels(voxels.copy() if copy else voxels)
+
+
+class ChunkSnapshot:
+    """Read only voxels of a chunk at one storage version, for readers on other threads"""
+    def __init__(self, chunk_index, version, chunk):
+        self.chunk_index = chunk_index
+        self.version = version
+        # the encoded chunk, never written again once pinned, edits of a pinned dense chunk copy it
+        self.chunk = chunk
+
+    def is_empty(self):
+        return isinstance(self.chunk, SingleVoxels) and not self.chunk.voxel_id
+
+    def read_box(self, y0, y1, z0, z1, x0, x1):
+        return self.chunk.read_box(y0, y1, z0, z1, x0, x1)
+
+
+class ChunkStorage:
+    """Voxels of every chunk as single value, palette or dense, versioned and snapshotted for other threads"""
+    def __init__(self):
+        self.chunks = [SingleVoxels(0) for _ in range(WORLD_VOL)]
+        # bumped on every edit of a chunk
+        self.versions = np.zeros(WORLD_VOL, dtype='uint64')
+        # {chunk index: snapshot of the current version}, dropped by the next edit
+        self.snapshots: dict[int, ChunkSnapshot] = {}
+        # writers hold it while changing a chunk, pin while taking a snapshot
+        self.lock = threading.Lock()
+
+        # metrics
+        self.copies = 0
+        self.pins = 0
+
+    def get_version(self, chunk_index):
+        return int(self.versions[chunk_index])
+
+    def get_voxel(self, chunk_index, voxel_index):
+        return self.chunks[chunk_index].get(voxel_index)
+
+    def read_box(self, chunk_index, y0, y1, z0, z1, x0, x1):
+        # voxels of the local box as [y, z, x], a single voxel id for single value chunks, not to be written
+        return self.chunks[chunk_index].read_box(y0, y1, z0, z1, x0, x1)
+
+    def get_voxels(self, chunk_index):
+        # flat voxels of the chunk, not to be written
+        return self.chunks[chunk_index].decode()
+
+    def is_empty(self, chunk_index):
+        chunk = self.chunks[chunk_index]
+        return isinstance(chunk, SingleVoxels) and not chunk.voxel_id
+
+    def set_voxels(self, chunk_index, voxels):
+        # replaces the chunk, voxels is copied if it stays dense
+        with self.lock:
+            self.chunks[chunk_index] = encode_voxels(voxels)
+            self.versions[chunk_index] += 1
+            self.snapshots.pop(chunk_index, None)
+
+    def set_chunk(self, chunk_index, chunk):
+        # replaces the chunk with an already encoded one, as loaded from disk
+        with self.lock:
+            self.chunks[chunk_index] = chunk
+            self.versions[chunk_index] += 1
+            self.snapshots.pop(chunk_index, None)
+
+    def pin(self, chunk_index):
+        # shared by every reader of the version, costs nothing until the chunk is edited
+        with self.lock:
+            self.pins += 1
+            snapshot = self.snapshots.get(chunk_index)
+            if snapshot is None:
+                snapshot = ChunkSnapshot(chunk_index, self.get_version(chunk_index), self.chunks[chunk_index])
+                self.snapshots[chunk_index] = snapshot
+            return snapshot
+
+    @contextmanager
+    def edit(self, chunk_index):
+        # yields the writable flat voxels, the chunk is encoded again afterwards so it
+        # moves between single value, palette and dense, a pinned dense chunk is copied first
+        with self.lock:
+            chunk = self.chunks[chunk_index]
+            voxels = chunk.decode()
+            if isinstance(chunk, DenseVoxels) and chunk_index in self.snapshots:
+                voxels = voxels.copy()
+                self.copies += 1
+            try:
+                yield voxels
+            finally:
+                self.chunks[chunk_index] = encode_voxels(voxels, copy=False)
+                self.versions[chunk_index] += 1
+                self.snapshots.pop(chunk_index, None)
+
+    def get_padded_voxels(self, chunk_pos, snapshots=None):
+        # chunk voxels plus a one voxel border from the neighbour chunks, indexed as [y, z, x],
+        # only the border boxes of the neighbours are decoded, voxels outside the world are left empty,
+        # other threads read them from snapshots, {chunk index: pinned snapshot} of the chunk and its neighbours
+        chunks = self.chunks if snapshots is None else snapshots
+        padded_voxels = np.zeros((PADDED_CHUNK_SIZE, PADDED_CHUNK_SIZE, PADDED_CHUNK_SIZE), dtype='uint8')
+
+        cx, cy, cz = chunk_pos
+        for dx in range(-1, 2):
+            x0, x1, sx = get_padded_segment(dx)
+            for dy in range(-1, 2):
+                y0, y1, sy = get_padded_segment(dy)
+                for dz in range(-1, 2):
+                    z0, z1, sz = get_padded_segment(dz)
+
+                    nx, ny, nz = cx + dx, cy + dy, cz + dz
+                    if not (0 <= nx < WORLD_W and 0 <= ny < WORLD_H and 0 <= nz < WORLD_D):
+                        continue
+                    chunk = chunks[nx + WORLD_W * nz + WORLD_AREA * ny]
+                    padded_voxels[y0:y1, z0:z1, x0:x1] = chunk.read_box(
+                        sy, sy + y1 - y0, sz, sz + z1 - z0, sx, sx + x1 - x0
+                    )
+        return padded_voxels
+
+    def get_metrics(self):
+        counts = {SingleVoxels: 0, PaletteVoxels: 0, DenseVoxels: 0}
+        for chunk in self.chunks:
+            counts[type(chunk)] += 1
+        return {
+            'single_chunks': counts[SingleVoxels],
+            'palette_chunks': counts[PaletteVoxels],
+            'dense_chunks': counts[DenseVoxels],
+            'nbytes': sum(chunk.nbytes for chunk in self.chunks),
+            'dense_nbytes': WORLD_VOL * CHUNK_VOL,
+            'pins': self.pins,
+            'copies': self.copies,
+        }
@@ -0,0 +1,257 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from numba import get_num_threads
+
+from settings import *
+from chunk_storage import SingleVoxels
+from world_objects.chunk import Chunk
+from meshes.chunk_mesh import build_sections
+from tracer import tracer
+
+# bounding sphere of a full height chunk column
+COLUMN_HALF_HEIGHT = WORLD_H * H_CHUNK_SIZE
+COLUMN_SPHERE_RADIUS = math.sqrt(2 * H_CHUNK_SIZE ** 2 + COLUMN_HALF_HEIGHT ** 2)
+
+
+class ChunkStreamer:
+    """Generates and meshes the chunk columns around the player on worker threads, nearest and visible first,
+    uploads them as they arrive and evicts the columns left behind"""
+    def __init__(self, world, radius=None):
+        self.world = world
+        self.chunks = world.chunks
+        self.storage = world.storage
+        self.frustum = world.app.player.camera.frustum
+        # columns within radius of the player are loaded, None loads the whole world and evicts nothing
+        self.radius = radius
+
+        # generation runs parallel within a batch, one batch at a time, meshing shares the remesh workers,
+        # the threading layer is started on the main thread as tbb hangs at exit once the thread that started it is gone
+        get_num_threads()
+        self.generator = ThreadPoolExecutor(max_workers=1, thread_name_prefix='generator')
+        self.mesher = world.remesh_scheduler.executor
+
+        # (x, z) of the columns with their voxels in the storage and of those also meshed
+        self.generated: set[tuple[int, int]] = set()
+        self.meshed: set[tuple[int, int]] = set()
+        # chunk indices loaded from region files, not generated again
+        self.loaded: set[int] = set()
+        # columns wanted around the player, found again when the player changes column
+        self.center = None
+        self.wanted: set[tuple[int, int]] = set()
+
+        self.generating = None  # (columns, future) of the batch on the generator thread
+        # {column: future} of the columns on the mesh workers
+        self.meshing: dict[tuple[int, int], object] = {}
+        self.ready = deque()  # (column, storage versions, sections of every chunk) waiting for upload
+
+        # metrics
+        self.generated_columns = 0
+        self.evicted_columns = 0
+        self.dropped_columns = 0
+        self.full_world_time = None  # perf_counter when every wanted column was first uploaded
+
+    def get_location(self):
+        # player position in chunk units on the xz plane
+        location = self.world.app.player.position.location
+        return location.x / CHUNK_SIZE, location.z / CHUNK_SIZE
+
+    @staticmethod
+    def get_distance(column, location):
+        return math.hypot(column[0] + 0.5 - location[0], column[1] + 0.5 - location[1])
+
+    @staticmethod
+    def get_neighbours(column):
+        # the column and the columns around it within the world
+        x, z = column
+        return [(nx, nz) for nx in range(max(x - 1, 0), min(x + 2, WORLD_W))
+                for nz in range(max(z - 1, 0), min(z + 2, WORLD_D))]
+
+    @staticmethod
+    def get_chunk_indices(columns):
+        return [x + WORLD_W * z + WORLD_AREA * y for x, z in columns for y in range(WORLD_H)]
+
+    def get_versions(self, column):
+        # storage versions of every chunk the column meshes are built from
+        return self.storage.versions[self.get_chunk_indices(self.get_neighbours(column))]
+
+    def get_wanted(self, location):
+        if self.radius is None:
+            return {(x, z) for x in range(WORLD_W) for z in range(WORLD_D)}
+        r = self.radius
+        px, pz = int(location[0]), int(location[1])
+        return {
+            (x, z) for x in range(max(px - r, 0), min(px + r + 1, WORLD_W))
+            for z in range(max(pz - r, 0), min(pz + r + 1, WORLD_D))
+            if self.get_distance((x, z), location) <= r
+        }
+
+    def get_priority(self, column, location):
+        # columns in view first, then by distance
+        center = glm.vec3(column[0] + 0.5, 0, column[1] + 0.5) * CHUNK_SIZE
+        center.y = COLUMN_HALF_HEIGHT
+        is_visible = self.frustum.is_sphere_on_frustum(center, COLUMN_SPHERE_RADIUS)
+        return not is_visible, self.get_distance(column, location)
+
+    @property
+    def pending(self):
+        # wanted columns not meshed nor on their way
+        ready = {column for column, _, _ in self.ready}
+        return self.wanted - self.meshed - self.meshing.keys() - ready
+
+    @property
+    def is_complete(self):
+        return self.wanted <= self.meshed
+
+    def update(self, budget_ms=STREAM_BUDGET_MS):
+        # no budget uploads every finished column
+        location = self.get_location()
+        center = int(location[0]), int(location[1])
+        if center != self.center:
+            self.center = center
+            self.wanted = self.get_wanted(location)
+            if self.radius is not None:
+                self.evict(location)
+
+        self.collect()
+        pending = self.pending
+        if pending:
+            self.dispatch(sorted(pending, key=lambda column: self.get_priority(column, location)))
+        self.upload(budget_ms)
+        if self.world.mesh_cache is not None:
+            # the meshes the workers added are written to disk here, off the worker threads
+            self.world.mesh_cache.update()
+
+        if self.full_world_time is None and self.is_complete:
+            self.full_world_time = time.perf_counter()
+            tracer.instant('full world')
+
+    def finish(self):
+        # blocks until every wanted column is uploaded, for loading without a frame loop,
+        # the first update finds the wanted columns
+        self.update(budget_ms=None)
+        while not self.is_complete:
+            self.update(budget_ms=None)
+            time.sleep(0.001)
+
+    def dispatch(self, columns):
+        # one generation batch at a time, made of the missing neighbours of the first columns
+        if self.generating is None:
+            batch = []
+            for column in columns:
+                batch += [n for n in self.get_neighbours(column) if n not in self.generated and n not in batch]
+                if len(batch) >= STREAM_GENERATE_COLUMNS:
+                    break
+            if batch:
+                self.generating = batch, self.generator.submit(self.generate, batch)
+
+        # a column is meshed once its neighbours are generated, their voxels make up the mesh borders
+        for column in columns:
+            if len(self.meshing) >= STREAM_MESH_JOBS:
+                break
+            if all(n in self.generated for n in self.get_neighbours(column)):
+                self.meshing[column] = self.mesher.submit(self.build_column, column)
+
+    def generate(self, chunk_columns):
+        # runs on the generator thread, the chunks are not used before the batch is added
+        self.world.generate_columns(np.array(chunk_columns, dtype='int64'), self.loaded)
+
+    def build_column(self, column):
+        # runs on a mesh worker, reads pinned snapshots of the chunks, returns their versions with the sections,
+        # edits made meanwhile change the storage versions and drop the result
+        x, z = column
+        chunk_indices = self.get_chunk_indices(self.get_neighbours(column))
+        snapshots = {chunk_index: self.storage.pin(chunk_index) for chunk_index in chunk_indices}
+        versions = np.array([snapshots[chunk_index].version for chunk_index in chunk_indices], dtype='uint64')
+
+        sections = []
+        for y in range(WORLD_H):
+            if snapshots[x + WORLD_W * z + WORLD_AREA * y].is_empty():
+                # nothing to draw whatever the neighbours hold
+                empty = np.zeros(0, dtype='uint32')
+                sections.append([(empty, empty)] * SECTIONS_PER_CHUNK)
+                continue
+            with tracer.span('mesh chunk', 'chunk', position=(x, y, z)):
+                padded_voxels = self.storage.get_padded_voxels((x, y, z), snapshots)
+                sections.append(build_sections(padded_voxels, self.world.mesh_cache))
+        return versions, sections
+
+    def add_columns(self, chunk_columns):
+        # columns with their voxels in the storage, the player edits are applied on top,
+        # including the ones made before the column was last evicted
+        for x, z in chunk_columns:
+            for y in range(WORLD_H):
+                chunk = Chunk(self.world, position=(x, y, z))
+                self.chunks[chunk.index] = chunk
+
+        self.world.journal.apply(self.storage, self.get_chunk_indices(chunk_columns))
+
+        self.generated.update(chunk_columns)
+
+    def collect(self):
+        if self.generating is not None and self.generating[1].done():
+            batch, future = self.generating
+            self.generating = None
+            future.result()
+            self.add_columns(batch)
+            self.generated_columns += len(batch)
+
+        for column, future in list(self.meshing.items()):
+            if future.done():
+                del self.meshing[column]
+                self.ready.append((column, *future.result()))
+
+    def upload(self, budget_ms):
+        start = time.perf_counter()
+        while self.ready:
+            column, versions, sections = self.ready.popleft()
+            if column not in self.wanted:
+                # left behind while it was meshed
+                continue
+            if not np.array_equal(versions, self.get_versions(column)):
+                # edited or evicted while it was meshed, pending again
+                self.dropped_columns += 1
+                continue
+
+            x, z = column
+            with tracer.span('upload column', 'chunk', column=column):
+                for y in range(WORLD_H):
+                    self.chunks[x + WORLD_W * z + WORLD_AREA * y].build_mesh(sections[y])
+            self.meshed.add(column)
+
+            if budget_ms is not None and (time.perf_counter() - start) * 1000 > budget_ms:
+                break
+
+    def evict(self, location):
+        # meshes are released past the margin, voxels once no meshed column could need them as a border
+        for column in [column for column in self.meshed
+                       if self.get_distance(column, location) > self.radius + STREAM_UNLOAD_MARGIN]:
+            for chunk_index in self.get_chunk_indices([column]):
+                self.chunks[chunk_index].release_mesh()
+                self.world.remesh_scheduler.forget(chunk_index)
+            self.meshed.discard(column)
+
+        for column in [column for column in self.generated
+                       if self.get_distance(column, location) > self.radius + STREAM_UNLOAD_MARGIN + 2]:
+            for chunk_index in self.get_chunk_indices([column]):
+                del self.chunks[chunk_index]
+                self.storage.set_chunk(chunk_index, SingleVoxels(0))
+            self.generated.discard(column)
+            self.evicted_columns += 1
+
+    def shutdown(self):
+        self.generator.shutdown(wait=False, cancel_futures=True)
+
+    def get_metrics(self):
+        return {
+            'wanted_columns': len(self.wanted),
+            'generated_columns': len(self.generated),
+            'meshed_columns': len(self.meshed),
+            'meshing_columns': len(self.meshing),
+            'ready_columns': len(self.ready),
+            'streamed_columns': self.generated_columns,
+            'evicted_columns': self.evicted_columns,
+            'dropped_columns': self.dropped_columns,
+            'storage_nbytes': self.storage.get_metrics()['nbytes'],
+        }
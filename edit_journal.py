@@ -0,0 +1,164 @@
+import os
+
+from settings import *
+
+JOURNAL_MAGIC = b'VXJL'
+JOURNAL_HEADER = np.dtype([
+    ('magic', 'S4'), ('version', '<u2'), ('terrain_version', '<u2'), ('cave_step', '<u2'), ('reserved', '<u2'),
+    ('seed', '<i8'),
+])
+# one voxel edit, world position, voxel id before and after
+JOURNAL_RECORD = np.dtype([('x', '<i4'), ('y', '<i4'), ('z', '<i4'), ('old', 'u1'), ('new', 'u1')])
+JOURNAL_FORMAT_VERSION = 2
+
+
+def get_voxel_keys(x, y, z):
+    # chunk index * CHUNK_VOL + voxel index of world positions
+    cx, cy, cz = x // CHUNK_SIZE, y // CHUNK_SIZE, z // CHUNK_SIZE
+    lx, ly, lz = x % CHUNK_SIZE, y % CHUNK_SIZE, z % CHUNK_SIZE
+    chunk_index = cx + WORLD_W * cz + WORLD_AREA * cy
+    return chunk_index.astype('int64') * CHUNK_VOL + lx + CHUNK_SIZE * lz + CHUNK_AREA * ly
+
+
+class EditJournal:
+    """Voxel edits as deltas against the generated world, appended to a journal and compacted into per chunk sets"""
+    def __init__(self, path=WORLD_SAVE_DIR):
+        self.journal_path = os.path.join(path, 'journal.bin')
+        self.deltas_path = os.path.join(path, 'deltas.npz')
+        self.file = None
+        self.records = 0  # records in the journal file
+
+        # compacted deltas sorted by key, old is the generated voxel id
+        self.keys = np.zeros(0, dtype='int64')
+        self.old_ids = np.zeros(0, dtype='uint8')
+        self.new_ids = np.zeros(0, dtype='uint8')
+
+        # called with every appended record array, the journal as a stream
+        self.listeners = []
+
+    def load_deltas(self):
+        # the saved deltas, with the journal left by a crash merged into them
+        if os.path.exists(self.deltas_path):
+            deltas = np.load(self.deltas_path)
+            if (deltas['seed'] == SEED and deltas['world_size'].tolist() == [WORLD_W, WORLD_H, WORLD_D, CHUNK_SIZE] and
+                    'terrain' in deltas and deltas['terrain'].tolist() == [TERRAIN_VERSION, CAVE_NOISE_STEP]):
+                self.keys, self.old_ids, self.new_ids = deltas['keys'], deltas['old_ids'], deltas['new_ids']
+
+        records = self.read_journal()
+        if len(records):
+            self.merge(records)
+            self.compact()
+
+    def is_journal_valid(self):
+        # the journal of another world, format or terrain is ignored and started over
+        if not os.path.exists(self.journal_path):
+            return False
+        header = np.fromfile(self.journal_path, dtype=JOURNAL_HEADER, count=1)
+        if not len(header):
+            return False
+        header = header[0]
+        return (header['magic'] == JOURNAL_MAGIC and header['version'] == JOURNAL_FORMAT_VERSION and
+                header['seed'] == SEED and header['terrain_version'] == TERRAIN_VERSION and
+                header['cave_step'] == CAVE_NOISE_STEP)
+
+    def read_journal(self):
+        if not self.is_journal_valid():
+            return np.zeros(0, dtype=JOURNAL_RECORD)
+        # a record cut short by a crash is dropped
+        size = os.path.getsize(self.journal_path) - JOURNAL_HEADER.itemsize
+        return np.fromfile(self.journal_path, dtype=JOURNAL_RECORD, count=size // JOURNAL_RECORD.itemsize,
+                           offset=JOURNAL_HEADER.itemsize)
+
+    def apply(self, storage, chunk_indices=None):
+        # writes the deltas of the chunks, every chunk with deltas by default, returns the number of changed voxels
+        if chunk_indices is None:
+            chunk_indices = np.unique(self.keys // CHUNK_VOL)
+        chunk_indices = np.asarray(chunk_indices, dtype='int64')
+        starts = np.searchsorted(self.keys, chunk_indices * CHUNK_VOL)
+        ends = np.searchsorted(self.keys, (chunk_indices + 1) * CHUNK_VOL)
+
+        changed = 0
+        for chunk_index, start, end in zip(chunk_indices, starts, ends):
+            if start == end:
+                continue
+            voxel_indices, new_ids = self.keys[start:end] % CHUNK_VOL, self.new_ids[start:end]
+            differs = storage.get_voxels(chunk_index)[voxel_indices] != new_ids
+            if differs.any():
+                # chunks loaded from regions saved after the edits already hold them
+                with storage.edit(chunk_index) as voxels:
+                    voxels[voxel_indices] = new_ids
+                changed += int(np.count_nonzero(differs))
+        return changed
+
+    def record(self, x, y, z, old_ids, new_ids):
+        # appends the edits of world positions, flushed to the os so a crash of the game loses none
+        records = np.empty(len(old_ids), dtype=JOURNAL_RECORD)
+        records['x'], records['y'], records['z'] = x, y, z
+        records['old'], records['new'] = old_ids, new_ids
+
+        if self.file is None:
+            self.open()
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.records += len(records)
+        # the deltas in memory always hold every edit, chunks generated again get them from apply
+        self.merge(records)
+
+        for listener in self.listeners:
+            listener(records)
+
+        if self.records >= JOURNAL_COMPACT_RECORDS:
+            self.compact()
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        if self.is_journal_valid():
+            self.file = open(self.journal_path, 'ab')
+            self.records = (os.path.getsize(self.journal_path) - JOURNAL_HEADER.itemsize) // JOURNAL_RECORD.itemsize
+            return
+        self.file = open(self.journal_path, 'wb')
+        header = np.zeros(1, dtype=JOURNAL_HEADER)
+        header[0] = (JOURNAL_MAGIC, JOURNAL_FORMAT_VERSION, TERRAIN_VERSION, CAVE_NOISE_STEP, 0, SEED)
+        self.file.write(header.tobytes())
+        self.records = 0
+
+    def merge(self, records):
+        # merges records into the deltas in memory, keeping the first old and the last new id of every
+        # voxel and dropping voxels back at their generated id, every record is merged once
+        keys = np.concatenate([self.keys, get_voxel_keys(records['x'], records['y'], records['z'])])
+        old_ids = np.concatenate([self.old_ids, records['old']])
+        new_ids = np.concatenate([self.new_ids, records['new']])
+
+        unique_keys, first = np.unique(keys, return_index=True)
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+
+        kept = old_ids[first] != new_ids[last]
+        self.keys, self.old_ids, self.new_ids = unique_keys[kept], old_ids[first][kept], new_ids[last][kept]
+
+    def compact(self):
+        # saves the deltas, which hold the journal records, then starts an empty journal,
+        # the deltas are swapped in before the journal is cleared, a crash in between replays it again
+        self.save_deltas()
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.records = 0
+
+    def save_deltas(self):
+        os.makedirs(os.path.dirname(self.deltas_path), exist_ok=True)
+        tmp_path = self.deltas_path + '.tmp.npz'
+        np.savez(tmp_path, seed=SEED, world_size=[WORLD_W, WORLD_H, WORLD_D, CHUNK_SIZE],
+                 terrain=[TERRAIN_VERSION, CAVE_NOISE_STEP],
+                 keys=self.keys, old_ids=self.old_ids, new_ids=self.new_ids)
+        os.replace(tmp_path, self.deltas_path)
+
+    def close(self):
+        if self.records:
+            self.compact()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,169 @@
+import json
+import time
+from contextlib import contextmanager
+
+import moderngl as mgl
+import pygame as pg
+
+from settings import *
+from meshes.base_mesh import render_stats
+from meshes.overlay_mesh import OverlayMesh
+
+FRAME_PHASES = ('player', 'raycast', 'culling', 'draw', 'flip')
+FRAME_COUNTERS = ('visible_chunks', 'culled_chunks', 'draw_calls', 'triangles', 'vbo_bytes', 'remeshes')
+FRAME_COLUMNS = ('frame_ms', *[f'{phase}_ms' for phase in FRAME_PHASES], *FRAME_COUNTERS)
+FRAME_PERCENTILES = (50, 95, 99)
+
+
+class FrameMetrics:
+    """Cpu time of the frame phases and render counters of the last frames, frame time tails as percentiles"""
+    def __init__(self, app, window=FRAME_METRICS_WINDOW):
+        self.app = app
+        # ring buffer of the last frames, one row of FRAME_COLUMNS per frame
+        self.frames = np.zeros((window, len(FRAME_COLUMNS)), dtype='float64')
+        self.count = 0  # frames recorded
+
+        # seconds of the frame being recorded, nested phases are left out of the phases they run in
+        self.phase_times = dict.fromkeys(FRAME_PHASES, 0.0)
+        self.nested = []
+        self.last_frame_end = None
+        self.last_remeshes = 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self.nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phase_times[name] += elapsed - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    def end_frame(self):
+        # records the frame since the end of the previous one, the first frame only starts the clock
+        now = time.perf_counter()
+        world = self.app.scene.world
+        remeshes = world.remesh_scheduler.uploaded
+        if self.last_frame_end is not None:
+            row = self.frames[self.count % len(self.frames)]
+            row[:] = (
+                (now - self.last_frame_end) * 1000,
+                *[self.phase_times[phase] * 1000 for phase in FRAME_PHASES],
+                len(world.visible_chunks), world.culled_chunks,
+                render_stats.draw_calls, render_stats.triangles, render_stats.vbo_bytes,
+                remeshes - self.last_remeshes,
+            )
+            self.count += 1
+
+        self.last_frame_end = now
+        self.last_remeshes = remeshes
+        self.phase_times = dict.fromkeys(FRAME_PHASES, 0.0)
+        render_stats.draw_calls = render_stats.triangles = 0
+
+    def restart_clock(self):
+        # the time since the end of the last frame is left out of the next one, for work between frames
+        self.last_frame_end = time.perf_counter()
+
+    def reset(self, window=FRAME_METRICS_WINDOW):
+        # drops the recorded frames, a window as long as a run keeps all of its frames
+        self.frames = np.zeros((window, len(FRAME_COLUMNS)), dtype='float64')
+        self.count = 0
+        self.phase_times = dict.fromkeys(FRAME_PHASES, 0.0)
+        self.restart_clock()
+
+    def get_frames(self):
+        # rows of the recorded frames in the window, oldest first
+        if self.count <= len(self.frames):
+            return self.frames[:self.count]
+        i = self.count % len(self.frames)
+        return np.concatenate([self.frames[i:], self.frames[:i]])
+
+    def get_metrics(self):
+        # frame time percentiles, mean phase times and the counters of the last frame
+        frames = self.get_frames()
+        if not len(frames):
+            return {'frames': 0}
+        metrics = {'frames': len(frames)}
+        for percentile, value in zip(FRAME_PERCENTILES, np.percentile(frames[:, 0], FRAME_PERCENTILES)):
+            metrics[f'frame_ms_p{percentile}'] = float(value)
+        for i, column in enumerate(FRAME_COLUMNS):
+            if column.endswith('_ms'):
+                metrics[f'{column}_mean'] = float(frames[:, i].mean())
+            else:
+                metrics[column] = int(frames[-1, i])
+        return metrics
+
+    def export(self, path=None):
+        # the frames of the window as csv and json with a summary, returns both paths
+        if path is None:
+            os.makedirs(FRAME_METRICS_DIR, exist_ok=True)
+            path = os.path.join(FRAME_METRICS_DIR, time.strftime('frames_%Y%m%d_%H%M%S'))
+        frames = self.get_frames()
+
+        np.savetxt(path + '.csv', frames, fmt='%.6g', delimiter=',', header=','.join(FRAME_COLUMNS), comments='')
+        with open(path + '.json', 'w') as file:
+            json.dump({
+                'summary': self.get_metrics(),
+                'columns': FRAME_COLUMNS,
+                'frames': frames.tolist(),
+            }, file)
+        return path + '.csv', path + '.json'
+
+
+class MetricsOverlay:
+    """Frame time percentiles and counters drawn over the top left corner of the screen"""
+    def __init__(self, app, is_visible=FRAME_METRICS_OVERLAY):
+        self.app = app
+        self.metrics = app.frame_metrics
+        self.is_visible = is_visible
+        # created when first shown
+        self.font = None
+        self.texture = None
+        self.mesh = None
+        self.lines = 4
+        self.last_update = 0.0
+
+    def create(self):
+        self.font = pg.font.Font(None, OVERLAY_FONT_SIZE)
+        size = self.font.size('0' * 60)[0], self.font.get_linesize() * self.lines + 8
+        self.texture = self.app.ctx.texture(size, components=4)
+        self.texture.filter = (mgl.NEAREST, mgl.NEAREST)
+        self.mesh = OverlayMesh(self.app, size)
+
+    def get_text(self):
+        metrics = self.metrics.get_metrics()
+        if not metrics['frames']:
+            return ['no frames yet']
+        return [
+            f'frame p50 {metrics["frame_ms_p50"]:6.2f}  p95 {metrics["frame_ms_p95"]:6.2f}'
+            f'  p99 {metrics["frame_ms_p99"]:6.2f} ms',
+            '  '.join(f'{phase} {metrics[f"{phase}_ms_mean"]:.2f}' for phase in FRAME_PHASES) + ' ms',
+            f'chunks {metrics["visible_chunks"]} visible {metrics["culled_chunks"]} culled'
+            f'  draws {metrics["draw_calls"]}  triangles {metrics["triangles"] / 1e6:.2f}M',
+            f'vbo {metrics["vbo_bytes"] / 2 ** 20:.1f} MB  remeshes {metrics["remeshes"]}',
+        ]
+
+    def update_texture(self):
+        surface = pg.Surface(self.texture.size, pg.SRCALPHA)
+        surface.fill((0, 0, 0, 160))
+        for i, line in enumerate(self.get_text()):
+            surface.blit(self.font.render(line, True, (255, 255, 255)), (4, 4 + i * self.font.get_linesize()))
+        self.texture.write(pg.image.tostring(surface, 'RGBA', True))
+
+    def render(self):
+        if not self.is_visible:
+            return
+        if self.texture is None:
+            self.create()
+
+        now = time.perf_counter()
+        if (now - self.last_update) * 1000 >= OVERLAY_UPDATE_MS:
+            self.update_texture()
+            self.last_update = now
+
+        self.texture.use(location=3)
+        self.app.ctx.disable(mgl.DEPTH_TEST)
+        self.mesh.render()
+        self.app.ctx.enable(mgl.DEPTH_TEST)
@@ -12,23 +12,26 @@ class Frustum:
         self.tan_x = math.tan(half_x)
 
     def is_on_frustum(self, chunk):
+        return self.is_sphere_on_frustum(chunk.center, CHUNK_SPHERE_RADIUS)
+
+    def is_sphere_on_frustum(self, center, radius):
         # vector to sphere center
-        sphere_vec = chunk.center - self.cam.location
+        sphere_vec = center - self.cam.location
 
         # outside the NEAR and FAR planes?
         sz = glm.dot(sphere_vec, self.cam.forward)
-        if not (NEAR - CHUNK_SPHERE_RADIUS <= sz <= FAR + CHUNK_SPHERE_RADIUS):
+        if not (NEAR - radius <= sz <= FAR + radius):
             return False
 
         # outside the TOP and BOTTOM planes?
         sy = glm.dot(sphere_vec, self.cam.up)
-        dist = self.factor_y * CHUNK_SPHERE_RADIUS + sz * self.tan_y
+        dist = self.factor_y * radius + sz * self.tan_y
         if not (-dist <= sy <= dist):
             return False
 
         # outside the LEFT and RIGHT planes?
         sx = glm.dot(sphere_vec, self.cam.right)
-        dist = self.factor_x * CHUNK_SPHERE_RADIUS + sz * self.tan_x
+        dist = self.factor_x * radius + sz * self.tan_x
         if not (-dist <= sx <= dist):
             return False
 
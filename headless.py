@@ -0,0 +1,48 @@
+from settings import *
+from player import Player
+from world import World
+from frame_metrics import FrameMetrics
+
+
+class HeadlessScene:
+    """The world of the headless app, nothing to draw"""
+    def __init__(self, world):
+        self.world = world
+
+    def update(self):
+        # the world is built in full and never meshed, nothing to stream nor remesh
+        with self.world.app.frame_metrics.phase('raycast'):
+            self.world.voxel_handler.update()
+
+
+class HeadlessApp:
+    """The player and world of the engine without a window nor gl context, chunks hold voxels but no meshes"""
+    def __init__(self, save_dir=WORLD_SAVE_DIR):
+        self.delta_time = 0
+        self.time = 0
+        self.frame_metrics = FrameMetrics(self)
+
+        self.player = Player(self)
+        self.player.look(PLAYER_POS, glm.radians(-90), 0)
+
+        # nothing is meshed, the mesh cache is left off
+        self.world = World(self, save_dir, None)
+        self.world.build()
+        self.scene = HeadlessScene(self.world)
+
+    def load_world(self):
+        # the world is built in full on creation, nothing is left to load
+        pass
+
+    def step(self, frame_input):
+        # a frame of the engine loop with the given input, as VoxelEngine.step
+        with self.frame_metrics.phase('player'):
+            self.player.update(frame_input)
+        self.scene.update()
+
+    def render(self):
+        # nothing to draw, the frame ends
+        self.frame_metrics.end_frame()
+
+    def shutdown(self):
+        self.world.shutdown()
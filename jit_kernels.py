@@ -0,0 +1,90 @@
+import importlib
+import threading
+import time
+
+from numba import types, get_num_threads
+
+import settings
+from settings import *
+from tracer import tracer
+
+# argument types the entry kernels are called with
+u1_1d = types.Array(types.uint8, 1, 'C')
+u1_2d = types.Array(types.uint8, 2, 'C')
+u1_3d = types.Array(types.uint8, 3, 'C')
+u4_2d = types.Array(types.uint32, 2, 'C')
+i8_2d = types.Array(types.int64, 2, 'C')
+i8 = types.int64
+
+# kernels called from python, by the module they are called from, with the argument types of every signature,
+# the kernels a saved world is loaded with come first, world generation last
+KERNELS = {
+    'chunk_storage.count_voxel_ids': [(u1_1d,)],
+    'chunk_storage.pack_indices': [(u1_1d, u1_1d, i8)],
+    'chunk_storage.unpack_indices': [(u1_1d, u1_1d, i8)],
+    'chunk_storage.unpack_box': [(u1_1d, u1_1d, i8, i8, i8, i8, i8, i8, i8)],
+    'chunk_storage.get_padded_segment': [(i8,)],
+    'terrain_gen.generate_chunks': [(u1_2d, i8_2d, types.Omitted(CAVE_NOISE_STEP))],
+}
+# padded voxels, format size, section position, block flags, vertex scratch
+MESH_BUILDER_SIGNATURES = [(u1_3d, i8, types.UniTuple(i8, 3), u1_1d, u4_2d)]
+
+
+def get_kernels():
+    # (module, name, dispatcher, signatures) of the entry kernels, the configured mesh builder only
+    kernels = []
+    for path, signatures in KERNELS.items():
+        module_name, name = path.rsplit('.', 1)
+        module = importlib.import_module(module_name)
+        kernels.append((module, name, getattr(module, name), signatures))
+
+    from meshes import chunk_mesh_builder
+    builder = chunk_mesh_builder.MESH_BUILDERS[settings.MESH_BUILDER]
+    kernels.insert(-1, (chunk_mesh_builder, builder.__name__, builder, MESH_BUILDER_SIGNATURES))
+    return kernels
+
+
+def compile_kernel(dispatcher, signature):
+    # seconds taken and whether the signature was 'compiled', 'loaded' from the disk cache or 'ready' already
+    if signature in dispatcher.overloads:
+        return 0.0, 'ready'
+    start = time.perf_counter()
+    dispatcher.compile(signature)
+    seconds = time.perf_counter() - start
+    return seconds, 'loaded' if dispatcher.stats.cache_hits.get(signature) else 'compiled'
+
+
+class KernelWarmup:
+    """Compiles the entry kernels on a thread or loads them from the disk cache, a call made meanwhile waits for it"""
+    def __init__(self):
+        self.thread = threading.Thread(target=self.run, name='jit warmup', daemon=True)
+        # {kernel name: [(signature, seconds, how)]}
+        self.timings: dict[str, list] = {}
+        self.start_time = None
+        self.end_time = None
+
+    def start(self):
+        # the threading layer of the parallel kernels is started here, tbb hangs at exit once the thread
+        # that started it is gone
+        get_num_threads()
+        self.start_time = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def run(self):
+        for module, name, dispatcher, signatures in get_kernels():
+            with tracer.span(f'jit {name}', 'jit'):
+                self.timings[name] = [(signature, *compile_kernel(dispatcher, signature))
+                                      for signature in signatures]
+        self.end_time = time.perf_counter()
+
+    def join(self):
+        self.thread.join()
+
+    def get_metrics(self):
+        return {
+            'warmup_s': self.end_time and self.end_time - self.start_time,
+            'compiled': sum(how == 'compiled' for timings in self.timings.values() for _, _, how in timings),
+            'loaded': sum(how == 'loaded' for timings in self.timings.values() for _, _, how in timings),
+        }
+
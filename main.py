@@ -2,22 +2,29 @@ from settings import *
 import moderngl as mgl
 import pygame as pg
 import sys
+import time
 from shader_program import ShaderProgram
 from scene import Scene
 from player import Player
 from textures import Textures
+from jit_kernels import KernelWarmup
+from tracer import tracer
+from frame_metrics import FrameMetrics, MetricsOverlay
+from session_replay import SessionRecorder
 
 
 class VoxelEngine:
-    def __init__(self):
-        pg.init()
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
-        pg.display.gl_set_attribute(pg.GL_DEPTH_SIZE, 24)
+    def __init__(self, save_dir=WORLD_SAVE_DIR, mesh_cache_dir=MESH_CACHE_DIR):
+        self.save_dir = save_dir
+        self.mesh_cache_dir = mesh_cache_dir
+        # startup metrics, perf_counter at start and at the first frame
+        self.start_time = time.perf_counter()
+        self.first_frame_time = None
+        # the entry kernels compile or load from the disk cache while the window opens
+        self.jit_warmup = KernelWarmup().start() if JIT_WARMUP else None
 
-        pg.display.set_mode(WIN_RES, flags=pg.OPENGL | pg.DOUBLEBUF)
-        self.ctx = mgl.create_context()
+        with tracer.span('window'):
+            self.ctx = self.create_context()
 
         self.ctx.enable(flags=mgl.DEPTH_TEST | mgl.CULL_FACE | mgl.BLEND)
         self.ctx.gc_mode = 'auto'
@@ -26,45 +33,119 @@ class VoxelEngine:
         self.delta_time = 0
         self.time = 0
 
-        pg.event.set_grab(True)
-        pg.mouse.set_visible(False)
-
         self.is_running = True
         self.on_init()
 
+    def create_context(self):
+        pg.init()
+        pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
+        pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
+        pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
+        pg.display.gl_set_attribute(pg.GL_DEPTH_SIZE, 24)
+
+        pg.display.set_mode(WIN_RES, flags=pg.OPENGL | pg.DOUBLEBUF)
+        pg.event.set_grab(True)
+        pg.mouse.set_visible(False)
+        return mgl.create_context()
+
     def on_init(self):
-        self.textures = Textures(self)
-        self.player = Player(self)
-        self.shader_program = ShaderProgram(self)
-        self.scene = Scene(self)
+        self.frame_metrics = FrameMetrics(self)
+        with tracer.span('textures'):
+            self.textures = Textures(self)
+        with tracer.span('player'):
+            self.player = Player(self)
+        with tracer.span('shaders'):
+            self.shader_program = ShaderProgram(self)
+        with tracer.span('scene'):
+            self.scene = Scene(self)
+        self.metrics_overlay = MetricsOverlay(self)
+        self.recorder = SessionRecorder(self).start() if SESSION_RECORDING else None
 
-    def update(self):
-        self.player.update()
+    def step(self, frame_input):
+        # a frame of the player and the scene with the given input, recorded or replayed
+        with self.frame_metrics.phase('player'):
+            self.player.update(frame_input)
         self.shader_program.update()
         self.scene.update()
 
+    def update(self):
+        frame_input = self.player.read_input()
+        if self.recorder is not None:
+            self.recorder.record_frame(self.delta_time, frame_input)
+        self.step(frame_input)
+
         self.delta_time = self.clock.tick()
         self.time = pg.time.get_ticks() * 0.001
         pg.display.set_caption(f'{self.clock.get_fps():5.0f} FPS '
                                f' yaw={self.player.position.yaw:7.5f}'
-                               f' right={self.player.position.right}')
+                               f' right={self.player.position.right}'
+                               f' remesh queue={self.scene.world.remesh_scheduler.queue_depth}'
+                               f' {self.get_startup_caption()}')
+
+    def get_startup_metrics(self):
+        # seconds from start to the first frame, to every wanted chunk column drawn and
+        # taken by the kernel warmup, None until then
+        full_world_time = self.scene.world.streamer.full_world_time
+        return {
+            'time_to_first_frame_s': self.first_frame_time and self.first_frame_time - self.start_time,
+            'time_to_full_world_s': full_world_time and full_world_time - self.start_time,
+            'jit_warmup_s': self.jit_warmup and self.jit_warmup.get_metrics()['warmup_s'],
+        }
+
+    def get_startup_caption(self):
+        streamer = self.scene.world.streamer
+        if streamer.full_world_time is None:
+            return f'loading {len(streamer.meshed)}/{len(streamer.wanted)} columns'
+        startup = self.get_startup_metrics()
+        return (f'first frame={startup["time_to_first_frame_s"]:.2f}s'
+                f' full world={startup["time_to_full_world_s"]:.2f}s')
 
     def render(self):
-        self.ctx.clear(color=BG_COLOR)
-        self.scene.render()
+        with self.frame_metrics.phase('draw'):
+            self.ctx.clear(color=BG_COLOR)
+            self.scene.render()
+            self.metrics_overlay.render()
+        with self.frame_metrics.phase('flip'):
+            self.flip()
+        self.frame_metrics.end_frame()
+        if self.first_frame_time is None:
+            self.first_frame_time = time.perf_counter()
+            tracer.instant('first frame')
+
+    def flip(self):
         pg.display.flip()
 
     def handle_events(self):
         for event in pg.event.get():
             if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
                 self.is_running = False
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.metrics_overlay.is_visible = not self.metrics_overlay.is_visible
+            if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+                print('frame metrics exported to', *self.frame_metrics.export())
+            if event.type == pg.KEYDOWN and event.key == pg.K_F5:
+                self.toggle_recording()
+            if event.type == pg.MOUSEBUTTONDOWN and self.recorder is not None:
+                self.recorder.record_click(event.button)
             self.player.handle_event(event=event)
 
+    def toggle_recording(self):
+        if self.recorder is None:
+            self.recorder = SessionRecorder(self).start()
+            print('recording the session')
+        else:
+            print('session recorded to', self.recorder.stop())
+            self.recorder = None
+
     def run(self):
         while self.is_running:
             self.handle_events()
             self.update()
             self.render()
+        if self.recorder is not None:
+            print('session recorded to', self.recorder.stop())
+        self.scene.world.shutdown()
+        self.scene.world.save()
         pg.quit()
         sys.exit()
 
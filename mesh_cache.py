@@ -0,0 +1,229 @@
+import glob
+import hashlib
+import threading
+import time
+
+import settings
+from settings import *
+
+
+class MeshCache:
+    """Section meshes of whole chunks saved to disk, keyed by a hash of the padded chunk voxels and the mesher"""
+    def __init__(self, path, max_bytes=MESH_CACHE_MAX_BYTES, flush_bytes=MESH_CACHE_FLUSH_BYTES):
+        self.path = path
+        self.index_path = os.path.join(path, 'index.npz')
+        self.max_bytes = max_bytes
+        self.flush_bytes = flush_bytes
+
+        # entries live in one data file of uint32 vertex data, the generation is bumped when it is compacted
+        self.generation = 0
+        self.data = np.zeros(0, dtype='uint32')
+        # {key: (offset, lengths)} of the saved entries, the section lengths are solid, see through pairs
+        self.entries: dict[bytes, tuple[int, np.ndarray]] = {}
+        # {key: sections} built since the last save, appended to the data file past flush_bytes and on exit
+        self.added: dict[bytes, list] = {}
+        self.added_nbytes = 0
+        # {key: time} of the last hit, the oldest entries are evicted first
+        self.last_used: dict[bytes, float] = {}
+        # mesh workers look up and add entries while the main thread saves
+        self.lock = threading.Lock()
+
+        # metrics
+        self.hits = 0
+        self.misses = 0
+
+        self.load()
+
+    def get_data_path(self, generation):
+        return os.path.join(self.path, f'meshes.{generation}.bin')
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return
+        index = np.load(self.index_path)
+        generation = int(index['generation'])
+        data_path = self.get_data_path(generation)
+        if index['lengths'].shape[1:] != (SECTIONS_PER_CHUNK * 2,) or not os.path.exists(data_path):
+            return
+
+        self.generation = generation
+        self.data = self.load_data(generation)
+        for key, offset, lengths, last_used in zip(
+                index['keys'], index['offsets'], index['lengths'], index['last_used']):
+            key = key.tobytes()
+            self.entries[key] = int(offset), lengths
+            self.last_used[key] = float(last_used)
+
+    def load_data(self, generation):
+        # pages are only read when an entry is uploaded, the cached arrays are views of the map
+        data_path = self.get_data_path(generation)
+        if os.path.getsize(data_path) < 4:
+            return np.zeros(0, dtype='uint32')
+        return np.memmap(data_path, dtype='uint32', mode='r').view(np.ndarray)
+
+    @staticmethod
+    def get_key(padded_voxels):
+        # the mesher and everything its output depends on is part of the key,
+        # sha256 as it runs on the cpu sha extensions, the fastest hash of the standard library
+        key = hashlib.sha256(f'{MESH_CACHE_VERSION} {settings.MESH_BUILDER} {CHUNK_SIZE} {SECTION_SIZE}'.encode())
+        key.update(settings.BLOCK_FLAGS)
+        key.update(np.ascontiguousarray(padded_voxels))
+        return key.digest()[:16]
+
+    def read(self, key):
+        # (solid, see through) of every section, None if the key is not cached
+        if key in self.added:
+            return self.added[key]
+        return self.read_saved(key)
+
+    def read_saved(self, key):
+        if key not in self.entries:
+            return None
+        offset, lengths = self.entries[key]
+        bounds = offset + np.concatenate([[0], np.cumsum(lengths, dtype='int64')])
+        vertex_data = [self.data[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        return list(zip(vertex_data[0::2], vertex_data[1::2]))
+
+    def get(self, key):
+        with self.lock:
+            sections = self.read(key)
+            if sections is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.last_used[key] = time.time()
+            return sections
+
+    def put(self, key, sections):
+        # workers missing on the same key both build it, the first one is kept so it is saved once
+        with self.lock:
+            if key in self.added or key in self.entries:
+                return
+            self.added[key] = sections
+            self.added_nbytes += get_sections_nbytes(sections)
+            self.last_used[key] = time.time()
+
+    def update(self):
+        # on the main thread every frame, memory stays bounded by flush_bytes, the flush evicts past max_bytes
+        if self.added_nbytes > self.flush_bytes:
+            self.save()
+
+    @property
+    def nbytes(self):
+        saved = sum(int(lengths.sum()) for _, lengths in self.entries.values()) * 4
+        return saved + self.added_nbytes
+
+    def save(self):
+        # appends the entries built since the last save, the data file is rewritten with the most recently used
+        # entries only once it outgrows max_bytes, returns the number of saved entries,
+        # only the main thread writes the disk and the saved entries, workers keep looking up and adding meanwhile
+        with self.lock:
+            if not self.added and not self.hits:
+                return 0
+            added = dict(self.added)
+            is_full = self.nbytes > self.max_bytes
+            last_used = dict(self.last_used)
+        os.makedirs(self.path, exist_ok=True)
+
+        if is_full:
+            generation, entries = self.generation + 1, self.compact(added, last_used)
+        else:
+            generation, entries = self.generation, self.append(added)
+        data = self.load_data(generation)
+
+        with self.lock:
+            self.generation, self.entries, self.data = generation, entries, data
+            for key in added:
+                del self.added[key]
+            self.added_nbytes = sum(get_sections_nbytes(sections) for sections in self.added.values())
+            if is_full:
+                self.last_used = {key: self.last_used[key] for key in self.last_used
+                                  if key in entries or key in self.added}
+            last_used = {key: self.last_used[key] for key in entries}
+
+        self.save_index(entries, last_used)
+        return len(entries)
+
+    def append(self, added):
+        entries = dict(self.entries)
+        with open(self.get_data_path(self.generation), 'ab') as file:
+            # a write cut short by a crash is skipped, entries stay aligned to the vertex data
+            file.seek(0, os.SEEK_END)
+            file.write(b'\0' * (-file.tell() % 4))
+            offset = file.tell() // 4
+            for key, sections in added.items():
+                lengths = get_section_lengths(sections)
+                for solid, see_through in sections:
+                    file.write(solid.tobytes())
+                    file.write(see_through.tobytes())
+                entries[key] = offset, lengths
+                offset += int(lengths.sum())
+        return entries
+
+    def compact(self, added, last_used):
+        # the most recently used entries within max_bytes written to the data file of the next generation
+        def read(key):
+            return added[key] if key in added else self.read_saved(key)
+
+        kept, size = [], 0
+        for key in sorted(last_used, key=last_used.get, reverse=True):
+            sections = read(key)
+            if sections is None:
+                # added after the copy of the entries, saved next time
+                continue
+            nbytes = get_sections_nbytes(sections)
+            if size + nbytes > self.max_bytes:
+                continue
+            kept.append(key)
+            size += nbytes
+
+        entries, offset = {}, 0
+        with open(self.get_data_path(self.generation + 1), 'wb') as file:
+            for key in kept:
+                sections = read(key)
+                lengths = get_section_lengths(sections)
+                for solid, see_through in sections:
+                    file.write(solid.tobytes())
+                    file.write(see_through.tobytes())
+                entries[key] = offset, lengths
+                offset += int(lengths.sum())
+        return entries
+
+    def save_index(self, entries, last_used):
+        keys = list(entries)
+        tmp_path = self.index_path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            generation=self.generation,
+            keys=np.frombuffer(b''.join(keys), dtype='uint8').reshape(-1, 16),
+            offsets=np.array([entries[key][0] for key in keys], dtype='int64'),
+            lengths=np.array([entries[key][1] for key in keys], dtype='uint32').reshape(
+                -1, SECTIONS_PER_CHUNK * 2),
+            last_used=np.array([last_used[key] for key in keys], dtype='float64'),
+        )
+        # the index names its data file, a crash before the swap keeps the old pair
+        os.replace(tmp_path, self.index_path)
+
+        for data_path in glob.glob(os.path.join(self.path, 'meshes.*.bin')):
+            if data_path != self.get_data_path(self.generation):
+                try:
+                    os.remove(data_path)
+                except OSError:
+                    # still mapped on windows, removed by a later save
+                    pass
+
+    def get_metrics(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries) + len(self.added),
+            'nbytes': self.nbytes,
+        }
+
+
+def get_section_lengths(sections):
+    return np.array([len(vertex_data) for pair in sections for vertex_data in pair], dtype='uint32')
+
+
+def get_sections_nbytes(sections):
+    return sum(solid.nbytes + see_through.nbytes for solid, see_through in sections)
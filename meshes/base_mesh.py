@@ -1,6 +1,17 @@
 import numpy as np
 
 
+class RenderStats:
+    """Totals of every mesh, the draw counts are reset every frame by the frame metrics"""
+    def __init__(self):
+        self.vbo_bytes = 0  # vertex buffers resident on the gpu
+        self.draw_calls = 0
+        self.triangles = 0
+
+
+render_stats = RenderStats()
+
+
 class BaseMesh:
     class DontRender(Exception):
         """Skips mesh rendering"""
@@ -14,8 +25,10 @@ class BaseMesh:
         self.vbo_format = None
         # attribute names according to the format: ("in_position", "in_color")
         self.attrs: tuple[str, ...] = None
-        # vertex array object
+        # vertex buffer and vertex array object
+        self.vbo = None
         self.vao = None
+        self.vertex_count = 0
 
     def get_vertex_data(self) -> np.array: ...
 
@@ -23,12 +36,30 @@ class BaseMesh:
         vertex_data = self.get_vertex_data()
         if vertex_data is None:
             return
-        vbo = self.ctx.buffer(vertex_data)
+        # the replaced buffers are freed now
+        self.release()
+        if not len(vertex_data):
+            # nothing to draw, moderngl refuses empty buffers
+            return
+        self.vbo = self.ctx.buffer(vertex_data)
+        self.vertex_count = len(vertex_data)
+        render_stats.vbo_bytes += self.vbo.size
         self.vao = self.ctx.vertex_array(
-            self.program, [(vbo, self.vbo_format, *self.attrs)], skip_errors=True
+            self.program, [(self.vbo, self.vbo_format, *self.attrs)], skip_errors=True
         )
         return self.vao
 
+    def release(self):
+        # frees the gpu buffers now instead of on garbage collection
+        if self.vao:
+            render_stats.vbo_bytes -= self.vbo.size
+            self.vao.release()
+            self.vbo.release()
+        self.vbo = self.vao = None
+        self.vertex_count = 0
+
     def render(self):
         if self.vao:
             self.vao.render()
+            render_stats.draw_calls += 1
+            render_stats.triangles += self.vertex_count // 3
@@ -1,6 +1,39 @@
 import settings
 from meshes.base_mesh import BaseMesh
-from meshes.chunk_mesh_builder import build_chunk_mesh
+from meshes.chunk_mesh_builder import MESH_BUILDERS, get_vertex_scratch
+
+VBO_FORMAT = '1u4'
+FORMAT_SIZE = sum(int(fmt[:1]) for fmt in VBO_FORMAT.split())
+
+
+def get_section_positions():
+    # same order as get_section_index
+    n = settings.SECTIONS_PER_AXIS
+    return [(x, y, z) for y in range(n) for z in range(n) for x in range(n)]
+
+
+def build_section(padded_voxels, section_pos):
+    # solid and see through vertex data of the section, safe to call from worker threads
+    return MESH_BUILDERS[settings.MESH_BUILDER](
+        padded_voxels=padded_voxels,
+        format_size=FORMAT_SIZE,
+        section_pos=section_pos,
+        block_flags=settings.BLOCK_FLAGS,
+        vertex_scratch=get_vertex_scratch(FORMAT_SIZE)
+    )
+
+
+def build_sections(padded_voxels, mesh_cache=None):
+    # vertex data of every section of the chunk, from the mesh cache if given and added to it on a miss
+    if mesh_cache is None:
+        return [build_section(padded_voxels, section_pos) for section_pos in get_section_positions()]
+
+    key = mesh_cache.get_key(padded_voxels)
+    sections = mesh_cache.get(key)
+    if sections is None:
+        sections = [build_section(padded_voxels, section_pos) for section_pos in get_section_positions()]
+        mesh_cache.put(key, sections)
+    return sections
 
 
 class FixedChunkMesh(BaseMesh):
@@ -9,8 +42,8 @@ class FixedChunkMesh(BaseMesh):
         self.ctx = ctx
         self.program = program
 
-        self.vbo_format = '1u4'
-        self.format_size = sum(int(fmt[:1]) for fmt in self.vbo_format.split())
+        self.vbo_format = VBO_FORMAT
+        self.format_size = FORMAT_SIZE
         self.attrs = ('packed_data',)
 
         self.vertex_data = vertex_data
@@ -19,45 +52,69 @@ class FixedChunkMesh(BaseMesh):
         return self.vertex_data
 
 
-class ChunkMesh(BaseMesh):
-    def __init__(self, chunk):
+class ChunkSectionMesh(BaseMesh):
+    def __init__(self, chunk_mesh, section_pos):
         super().__init__()
-        self.app = chunk.app
-        self.chunk = chunk
-        self.ctx = self.app.ctx
-        self.program = self.app.shader_program.chunk
+        self.chunk_mesh = chunk_mesh
+        self.section_pos = section_pos
+        self.ctx = chunk_mesh.ctx
+        self.program = chunk_mesh.program
 
-        self.vbo_format = '1u4'
-        self.format_size = sum(int(fmt[:1]) for fmt in self.vbo_format.split())
-        self.attrs = ('packed_data',)
+        self.vbo_format = chunk_mesh.vbo_format
+        self.format_size = chunk_mesh.format_size
+        self.attrs = chunk_mesh.attrs
 
         self.solid_mesh = FixedChunkMesh(self.ctx, self.program, None)
         self.see_through_mesh = FixedChunkMesh(self.ctx, self.program, None)
 
-        self.update_vao()
+    def build(self, padded_voxels):
+        # safe to call from worker threads
+        return build_section(padded_voxels, self.section_pos)
 
-    def update_vao(self):
-        super().update_vao()
+    def upload(self, solid, see_through):
+        self.solid_mesh.vertex_data = solid
+        self.see_through_mesh.vertex_data = see_through
         self.solid_mesh.update_vao()
         self.see_through_mesh.update_vao()
 
-    def rebuild(self):
-        self.update_vao()
-
-    def get_vertex_data(self):
-        solid, see_through = build_chunk_mesh(
-            chunk_voxels=self.chunk.voxels,
-            format_size=self.format_size,
-            chunk_pos=self.chunk.position,
-            world_voxels=self.chunk.world.voxels,
-            see_through_blocks=settings.SEE_THROUGH_BLOCKS
-        )
-        self.solid_mesh.vertex_data = solid
-        self.see_through_mesh.vertex_data = see_through
-        return None
+    def release(self):
+        self.solid_mesh.release()
+        self.see_through_mesh.release()
 
     def render(self):
         self.solid_mesh.render()
 
     def render_see_through(self):
         self.see_through_mesh.render()
+
+
+class ChunkMesh(BaseMesh):
+    def __init__(self, chunk, sections):
+        super().__init__()
+        self.app = chunk.app
+        self.chunk = chunk
+        self.ctx = self.app.ctx
+        self.program = self.app.shader_program.chunk
+
+        self.vbo_format = VBO_FORMAT
+        self.format_size = FORMAT_SIZE
+        self.attrs = ('packed_data',)
+
+        self.sections = [ChunkSectionMesh(self, section_pos) for section_pos in get_section_positions()]
+        self.upload(sections)
+
+    def upload(self, sections):
+        for section, (solid, see_through) in zip(self.sections, sections):
+            section.upload(solid, see_through)
+
+    def release(self):
+        for section in self.sections:
+            section.release()
+
+    def render(self):
+        for section in self.sections:
+            section.render()
+
+    def render_see_through(self):
+        for section in self.sections:
+            section.render_see_through()
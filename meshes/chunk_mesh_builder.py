@@ -1,40 +1,55 @@
+import threading
+
 from settings import *
 
 
-@njit
-def get_ao(local_pos, world_pos, world_voxels, plane):
-    x, y, z = local_pos
-    wx, wy, wz = world_pos
-
-    if plane == 'Y':
-        a = is_void((x    , y, z - 1), (wx    , wy, wz - 1), world_voxels)
-        b = is_void((x - 1, y, z - 1), (wx - 1, wy, wz - 1), world_voxels)
-        c = is_void((x - 1, y, z    ), (wx - 1, wy, wz    ), world_voxels)
-        d = is_void((x - 1, y, z + 1), (wx - 1, wy, wz + 1), world_voxels)
-        e = is_void((x    , y, z + 1), (wx    , wy, wz + 1), world_voxels)
-        f = is_void((x + 1, y, z + 1), (wx + 1, wy, wz + 1), world_voxels)
-        g = is_void((x + 1, y, z    ), (wx + 1, wy, wz    ), world_voxels)
-        h = is_void((x + 1, y, z - 1), (wx + 1, wy, wz - 1), world_voxels)
-
-    elif plane == 'X':
-        a = is_void((x, y    , z - 1), (wx, wy    , wz - 1), world_voxels)
-        b = is_void((x, y - 1, z - 1), (wx, wy - 1, wz - 1), world_voxels)
-        c = is_void((x, y - 1, z    ), (wx, wy - 1, wz    ), world_voxels)
-        d = is_void((x, y - 1, z + 1), (wx, wy - 1, wz + 1), world_voxels)
-        e = is_void((x, y    , z + 1), (wx, wy    , wz + 1), world_voxels)
-        f = is_void((x, y + 1, z + 1), (wx, wy + 1, wz + 1), world_voxels)
-        g = is_void((x, y + 1, z    ), (wx, wy + 1, wz    ), world_voxels)
-        h = is_void((x, y + 1, z - 1), (wx, wy + 1, wz - 1), world_voxels)
+_thread_scratch = threading.local()
 
-    else:
-        a = is_void((x - 1, y    , z), (wx - 1, wy    , wz), world_voxels)
-        b = is_void((x - 1, y - 1, z), (wx - 1, wy - 1, wz), world_voxels)
-        c = is_void((x    , y - 1, z), (wx    , wy - 1, wz), world_voxels)
-        d = is_void((x + 1, y - 1, z), (wx + 1, wy - 1, wz), world_voxels)
-        e = is_void((x + 1, y    , z), (wx + 1, wy    , wz), world_voxels)
-        f = is_void((x + 1, y + 1, z), (wx + 1, wy + 1, wz), world_voxels)
-        g = is_void((x    , y + 1, z), (wx    , wy + 1, wz), world_voxels)
-        h = is_void((x - 1, y + 1, z), (wx - 1, wy + 1, wz), world_voxels)
+
+def get_vertex_scratch(format_size):
+    # per thread buffers the builders write into, rows: solid, see through, sized for the worst section:
+    # see through voxels keep all 6 faces against each other, 36 vertices per voxel
+    size = SECTION_SIZE ** 3 * 36 * format_size
+    scratch = getattr(_thread_scratch, 'vertex_data', None)
+    if scratch is None or scratch.shape[1] < size:
+        scratch = _thread_scratch.vertex_data = np.empty((2, size), dtype='uint32')
+    return scratch
+
+
+@njit
+def get_ao(padded_voxels, x, y, z, plane):
+    # x, y, z: padded position of the voxel in front of the face
+    v = padded_voxels
+
+    if plane == 0:  # Y plane
+        a = v[y, z - 1, x    ] == 0
+        b = v[y, z - 1, x - 1] == 0
+        c = v[y, z    , x - 1] == 0
+        d = v[y, z + 1, x - 1] == 0
+        e = v[y, z + 1, x    ] == 0
+        f = v[y, z + 1, x + 1] == 0
+        g = v[y, z    , x + 1] == 0
+        h = v[y, z - 1, x + 1] == 0
+
+    elif plane == 1:  # X plane
+        a = v[y    , z - 1, x] == 0
+        b = v[y - 1, z - 1, x] == 0
+        c = v[y - 1, z    , x] == 0
+        d = v[y - 1, z + 1, x] == 0
+        e = v[y    , z + 1, x] == 0
+        f = v[y + 1, z + 1, x] == 0
+        g = v[y + 1, z    , x] == 0
+        h = v[y + 1, z - 1, x] == 0
+
+    else:  # Z plane
+        a = v[y    , z, x - 1] == 0
+        b = v[y - 1, z, x - 1] == 0
+        c = v[y - 1, z, x    ] == 0
+        d = v[y - 1, z, x + 1] == 0
+        e = v[y    , z, x + 1] == 0
+        f = v[y + 1, z, x + 1] == 0
+        g = v[y + 1, z, x    ] == 0
+        h = v[y + 1, z, x - 1] == 0
 
     ao = (a + b + c), (g + h + a), (e + f + g), (c + d + e)
     return ao
@@ -63,170 +78,347 @@ def pack_data(x, y, z, voxel_id, face_id, ao_id, flip_id):
 
 
 @njit
-def get_chunk_index(world_voxel_pos):
-    wx, wy, wz = world_voxel_pos
-    cx = wx // CHUNK_SIZE
-    cy = wy // CHUNK_SIZE
-    cz = wz // CHUNK_SIZE
-    if not (0 <= cx < WORLD_W and 0 <= cy < WORLD_H and 0 <= cz < WORLD_D):
-        return -1
-
-    index = cx + WORLD_W * cz + WORLD_AREA * cy
+def get_padded_segment(offset):
+    # padded range and source chunk range along an axis for a neighbour chunk offset
+    if offset < 0:
+        return 0, 1, CHUNK_SIZE - 1
+    elif offset == 0:
+        return 1, CHUNK_SIZE + 1, 0
+    return CHUNK_SIZE + 1, CHUNK_SIZE + 2, 0
+
+
+@njit
+def add_data(vertex_data, index, *vertices):
+    for n, vertex in enumerate(vertices):
+        vertex_data[index] = pack_data(*vertex)
+        index += 1
     return index
 
 
 @njit
-def get_voxel_id(local_voxel_pos, world_voxel_pos, world_voxels):
-    chunk_index = get_chunk_index(world_voxel_pos)
-    if chunk_index == -1:
-        return -1
-    chunk_voxels = world_voxels[chunk_index]
+def add_face(vertex_data, index, face_id, x, y, z, du, dv, voxel_id, ao, flip_id):
+    # face corners: v1 is displaced du along the first plane axis of the face,
+    # v3 is displaced dv along the second one (Y faces: x, z  X faces: y, z  Z faces: y, x)
+    if face_id == 0:
+        v0 = (x, y + 1, z, voxel_id, 0, ao[0], flip_id)
+        v1 = (x + du, y + 1, z, voxel_id, 0, ao[1], flip_id)
+        v2 = (x + du, y + 1, z + dv, voxel_id, 0, ao[2], flip_id)
+        v3 = (x, y + 1, z + dv, voxel_id, 0, ao[3], flip_id)
+    elif face_id == 1:
+        v0 = (x, y, z, voxel_id, 1, ao[0], flip_id)
+        v1 = (x + du, y, z, voxel_id, 1, ao[1], flip_id)
+        v2 = (x + du, y, z + dv, voxel_id, 1, ao[2], flip_id)
+        v3 = (x, y, z + dv, voxel_id, 1, ao[3], flip_id)
+    elif face_id == 2:
+        v0 = (x + 1, y, z, voxel_id, 2, ao[0], flip_id)
+        v1 = (x + 1, y + du, z, voxel_id, 2, ao[1], flip_id)
+        v2 = (x + 1, y + du, z + dv, voxel_id, 2, ao[2], flip_id)
+        v3 = (x + 1, y, z + dv, voxel_id, 2, ao[3], flip_id)
+    elif face_id == 3:
+        v0 = (x, y, z, voxel_id, 3, ao[0], flip_id)
+        v1 = (x, y + du, z, voxel_id, 3, ao[1], flip_id)
+        v2 = (x, y + du, z + dv, voxel_id, 3, ao[2], flip_id)
+        v3 = (x, y, z + dv, voxel_id, 3, ao[3], flip_id)
+    elif face_id == 4:
+        v0 = (x, y, z, voxel_id, 4, ao[0], flip_id)
+        v1 = (x, y + du, z, voxel_id, 4, ao[1], flip_id)
+        v2 = (x + dv, y + du, z, voxel_id, 4, ao[2], flip_id)
+        v3 = (x + dv, y, z, voxel_id, 4, ao[3], flip_id)
+    else:
+        v0 = (x, y, z + 1, voxel_id, 5, ao[0], flip_id)
+        v1 = (x, y + du, z + 1, voxel_id, 5, ao[1], flip_id)
+        v2 = (x + dv, y + du, z + 1, voxel_id, 5, ao[2], flip_id)
+        v3 = (x + dv, y, z + 1, voxel_id, 5, ao[3], flip_id)
+
+    if face_id == 0:
+        if flip_id:
+            return add_data(vertex_data, index, v1, v0, v3, v1, v3, v2)
+        return add_data(vertex_data, index, v0, v3, v2, v0, v2, v1)
+    elif face_id == 1:
+        if flip_id:
+            return add_data(vertex_data, index, v1, v3, v0, v1, v2, v3)
+        return add_data(vertex_data, index, v0, v2, v3, v0, v1, v2)
+    elif face_id == 2 or face_id == 4:
+        if flip_id:
+            return add_data(vertex_data, index, v3, v0, v1, v3, v1, v2)
+        return add_data(vertex_data, index, v0, v1, v2, v0, v2, v3)
+    else:
+        if flip_id:
+            return add_data(vertex_data, index, v3, v1, v0, v3, v2, v1)
+        return add_data(vertex_data, index, v0, v2, v1, v0, v3, v2)
 
-    x, y, z = local_voxel_pos
-    voxel_index = x % CHUNK_SIZE + z % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE * CHUNK_AREA
 
-    return chunk_voxels[voxel_index]
+@njit
+def get_face_neighbour(face_id, x, y, z):
+    if face_id == 0:
+        return x, y + 1, z
+    elif face_id == 1:
+        return x, y - 1, z
+    elif face_id == 2:
+        return x + 1, y, z
+    elif face_id == 3:
+        return x - 1, y, z
+    elif face_id == 4:
+        return x, y, z - 1
+    return x, y, z + 1
 
 
 @njit
-def is_void(local_voxel_pos, world_voxel_pos, world_voxels):
-    voxel_id = get_voxel_id(local_voxel_pos, world_voxel_pos, world_voxels)
-    return voxel_id < 1
+def get_face_plane(face_id):
+    # 0: Y plane  1: X plane  2: Z plane
+    return face_id // 2
 
 
 @njit
-def add_data(vertex_data, index, *vertices):
-    for n, vertex in enumerate(vertices):
-        vertex_data[index] = pack_data(*vertex)
-        index += 1
-    return index
+def get_plane_voxel(face_id, s, p, q):
+    # (slice, first plane axis, second plane axis) to (x, y, z) for a face
+    if face_id < 2:
+        return p, s, q
+    elif face_id < 4:
+        return s, p, q
+    return q, p, s
 
 
 @njit
-def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels, see_through_blocks):
-    solid_vertex_data = np.empty(CHUNK_VOL * 18 * format_size, dtype='uint32')
-    see_through_vertex_data = np.empty((CHUNK_VOL * 18 * format_size), dtype='uint32')
+def get_section_origin(section_pos):
+    sx, sy, sz = section_pos
+    return sx * SECTION_SIZE, sy * SECTION_SIZE, sz * SECTION_SIZE
+
+
+@njit(nogil=True)
+def build_chunk_mesh(padded_voxels, format_size, section_pos, block_flags, vertex_scratch):
+    # vertices of a chunk section in chunk local coords, padded_voxels from ChunkStorage.get_padded_voxels
+    solid_vertex_data, see_through_vertex_data = vertex_scratch[0], vertex_scratch[1]
     solid_index, see_through_index = 0, 0
 
-    for x in range(CHUNK_SIZE):
-        for y in range(CHUNK_SIZE):
-            for z in range(CHUNK_SIZE):
-                voxel_id = chunk_voxels[x + CHUNK_SIZE * z + CHUNK_AREA * y]
+    x0, y0, z0 = get_section_origin(section_pos)
+    for x in range(x0, x0 + SECTION_SIZE):
+        for y in range(y0, y0 + SECTION_SIZE):
+            for z in range(z0, z0 + SECTION_SIZE):
+                voxel_id = padded_voxels[y + 1, z + 1, x + 1]
                 if not voxel_id:
                     continue
-                elif voxel_id in see_through_blocks:
+                elif block_flags[voxel_id] & BLOCK_SEE_THROUGH:
                     index = see_through_index
                     vertex_data = see_through_vertex_data
                 else:
                     index = solid_index
                     vertex_data = solid_vertex_data
 
-                # voxel world position
-                cx, cy, cz = chunk_pos
-                wx = x + cx * CHUNK_SIZE
-                wy = y + cy * CHUNK_SIZE
-                wz = z + cz * CHUNK_SIZE
-
-                # top face
-                neigh_id = get_voxel_id((x, y + 1, z), (wx, wy + 1, wz), world_voxels)
-                if neigh_id < 1 or neigh_id in see_through_blocks:
-                    # get ao values
-                    ao = get_ao((x, y + 1, z), (wx, wy + 1, wz), world_voxels, plane='Y')
-                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+                # top, bottom, right, left, back and front faces
+                for face_id in range(6):
+                    nx, ny, nz = get_face_neighbour(face_id, x + 1, y + 1, z + 1)
+                    neigh_id = padded_voxels[ny, nz, nx]
+                    neigh_flags = block_flags[neigh_id]
+                    if not neigh_flags & BLOCK_SOLID or neigh_flags & BLOCK_SEE_THROUGH:
+                        # get ao values
+                        ao = get_ao(padded_voxels, nx, ny, nz, plane=get_face_plane(face_id))
+                        flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
-                    # format: x, y, z, voxel_id, face_id
-                    v0 = (x, y + 1, z, voxel_id, 0, ao[0], flip_id)
-                    v1 = (x + 1, y + 1, z, voxel_id, 0, ao[1], flip_id)
-                    v2 = (x + 1, y + 1, z + 1, voxel_id, 0, ao[2], flip_id)
-                    v3 = (x, y + 1, z + 1, voxel_id, 0, ao[3], flip_id)
+                        index = add_face(vertex_data, index, face_id, x, y, z, 1, 1, voxel_id, ao, flip_id)
 
-                    if flip_id:
-                        index = add_data(vertex_data, index, v1, v0, v3, v1, v3, v2)
-                    else:
-                        index = add_data(vertex_data, index, v0, v3, v2, v0, v2, v1)
+                if block_flags[voxel_id] & BLOCK_SEE_THROUGH:
+                    see_through_index = index
+                else:
+                    solid_index = index
+    # copies own exactly the used memory, the scratch is reused by the next call
+    return solid_vertex_data[:solid_index].copy(), see_through_vertex_data[:see_through_index].copy()
 
-                # bottom face
-                neigh_id = get_voxel_id((x, y - 1, z), (wx, wy - 1, wz), world_voxels)
-                if neigh_id < 1 or neigh_id in see_through_blocks:
-                    ao = get_ao((x, y - 1, z), (wx, wy - 1, wz), world_voxels, plane='Y')
-                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
-                    v0 = (x, y, z, voxel_id, 1, ao[0], flip_id)
-                    v1 = (x + 1, y, z, voxel_id, 1, ao[1], flip_id)
-                    v2 = (x + 1, y, z + 1, voxel_id, 1, ao[2], flip_id)
-                    v3 = (x, y, z + 1, voxel_id, 1, ao[3], flip_id)
+@njit
+def get_column_masks(padded_voxels, block_flags, section_pos):
+    # one bit per padded z of every (y, x) column around a section:
+    # voxels of the section to mesh and voxels hiding the faces behind them
+    present = np.zeros((PADDED_CHUNK_SIZE, PADDED_CHUNK_SIZE), dtype=np.uint64)
+    opaque = np.zeros((PADDED_CHUNK_SIZE, PADDED_CHUNK_SIZE), dtype=np.uint64)
+    one = np.uint64(1)
+
+    x0, y0, z0 = get_section_origin(section_pos)
+    for y in range(y0, y0 + SECTION_SIZE + 2):
+        for x in range(x0, x0 + SECTION_SIZE + 2):
+            present_bits, opaque_bits = np.uint64(0), np.uint64(0)
+            for z in range(z0, z0 + SECTION_SIZE + 2):
+                voxel_id = padded_voxels[y, z, x]
+                if not voxel_id:
+                    continue
+                bit = one << np.uint64(z)
+                present_bits |= bit
+                flags = block_flags[voxel_id]
+                if flags & BLOCK_SOLID and not flags & BLOCK_SEE_THROUGH:
+                    opaque_bits |= bit
+            present[y, x] = present_bits
+            opaque[y, x] = opaque_bits
+
+    # only the section itself is meshed, not its border
+    interior = ((one << np.uint64(SECTION_SIZE)) - one) << np.uint64(z0 + 1)
+    for y in range(y0, y0 + SECTION_SIZE + 2):
+        for x in range(x0, x0 + SECTION_SIZE + 2):
+            if y0 < y <= y0 + SECTION_SIZE and x0 < x <= x0 + SECTION_SIZE:
+                present[y, x] &= interior
+            else:
+                present[y, x] = 0
+    return present, opaque
+
+
+@njit(nogil=True)
+def build_chunk_mesh_binary(padded_voxels, format_size, section_pos, block_flags, vertex_scratch):
+    # same output as build_chunk_mesh, visible faces are found a whole z column at a time:
+    # the x and y neighbours of a column are the same bits of the adjacent columns
+    solid_vertex_data, see_through_vertex_data = vertex_scratch[0], vertex_scratch[1]
+    solid_index, see_through_index = 0, 0
 
-                    if flip_id:
-                        index = add_data(vertex_data, index, v1, v3, v0, v1, v2, v3)
+    present, opaque = get_column_masks(padded_voxels, block_flags, section_pos)
+    one = np.uint64(1)
+
+    x0, y0, z0 = get_section_origin(section_pos)
+    for x in range(x0 + 1, x0 + SECTION_SIZE + 1):
+        for y in range(y0 + 1, y0 + SECTION_SIZE + 1):
+            column = present[y, x]
+            if not column:
+                continue
+
+            # top, bottom, right, left, back and front faces
+            face_masks = (
+                column & ~opaque[y + 1, x],
+                column & ~opaque[y - 1, x],
+                column & ~opaque[y, x + 1],
+                column & ~opaque[y, x - 1],
+                column & ~(opaque[y, x] << one),
+                column & ~(opaque[y, x] >> one),
+            )
+            visible = face_masks[0] | face_masks[1] | face_masks[2] | face_masks[3] | face_masks[4] | face_masks[5]
+
+            z = z0 + 1
+            visible >>= np.uint64(z)
+            while visible:
+                if visible & one:
+                    voxel_id = padded_voxels[y, z, x]
+                    if block_flags[voxel_id] & BLOCK_SEE_THROUGH:
+                        index = see_through_index
+                        vertex_data = see_through_vertex_data
                     else:
-                        index = add_data(vertex_data, index, v0, v2, v3, v0, v1, v2)
+                        index = solid_index
+                        vertex_data = solid_vertex_data
 
-                # right face
-                neigh_id = get_voxel_id((x + 1, y, z), (wx + 1, wy, wz), world_voxels)
-                if neigh_id < 1 or neigh_id in see_through_blocks:
-                    ao = get_ao((x + 1, y, z), (wx + 1, wy, wz), world_voxels, plane='X')
-                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+                    bit = one << np.uint64(z)
+                    for face_id in range(6):
+                        if face_masks[face_id] & bit:
+                            nx, ny, nz = get_face_neighbour(face_id, x, y, z)
+                            ao = get_ao(padded_voxels, nx, ny, nz, plane=get_face_plane(face_id))
+                            flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
-                    v0 = (x + 1, y, z, voxel_id, 2, ao[0], flip_id)
-                    v1 = (x + 1, y + 1, z, voxel_id, 2, ao[1], flip_id)
-                    v2 = (x + 1, y + 1, z + 1, voxel_id, 2, ao[2], flip_id)
-                    v3 = (x + 1, y, z + 1, voxel_id, 2, ao[3], flip_id)
+                            index = add_face(vertex_data, index, face_id, x - 1, y - 1, z - 1, 1, 1,
+                                             voxel_id, ao, flip_id)
 
-                    if flip_id:
-                        index = add_data(vertex_data, index, v3, v0, v1, v3, v1, v2)
+                    if block_flags[voxel_id] & BLOCK_SEE_THROUGH:
+                        see_through_index = index
                     else:
-                        index = add_data(vertex_data, index, v0, v1, v2, v0, v2, v3)
+                        solid_index = index
+                visible >>= one
+                z += 1
 
-                # left face
-                neigh_id = get_voxel_id((x - 1, y, z), (wx - 1, wy, wz), world_voxels)
-                if neigh_id < 1 or neigh_id in see_through_blocks:
-                    ao = get_ao((x - 1, y, z), (wx - 1, wy, wz), world_voxels, plane='X')
-                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+    return solid_vertex_data[:solid_index].copy(), see_through_vertex_data[:see_through_index].copy()
 
-                    v0 = (x, y, z, voxel_id, 3, ao[0], flip_id)
-                    v1 = (x, y + 1, z, voxel_id, 3, ao[1], flip_id)
-                    v2 = (x, y + 1, z + 1, voxel_id, 3, ao[2], flip_id)
-                    v3 = (x, y, z + 1, voxel_id, 3, ao[3], flip_id)
 
-                    if flip_id:
-                        index = add_data(vertex_data, index, v3, v1, v0, v3, v2, v1)
-                    else:
-                        index = add_data(vertex_data, index, v0, v2, v1, v0, v3, v2)
+@njit
+def pack_face_key(voxel_id, ao):
+    # key 0 means no visible face
+    return 1 + (voxel_id | ao[0] << 8 | ao[1] << 10 | ao[2] << 12 | ao[3] << 14)
 
-                # back face
-                neigh_id = get_voxel_id((x, y, z - 1), (wx, wy, wz - 1), world_voxels)
-                if neigh_id < 1 or neigh_id in see_through_blocks:
-                    ao = get_ao((x, y, z - 1), (wx, wy, wz - 1), world_voxels, plane='Z')
-                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
-                    v0 = (x, y, z, voxel_id, 4, ao[0], flip_id)
-                    v1 = (x, y + 1, z, voxel_id, 4, ao[1], flip_id)
-                    v2 = (x + 1, y + 1, z, voxel_id, 4, ao[2], flip_id)
-                    v3 = (x + 1, y, z, voxel_id, 4, ao[3], flip_id)
+@njit
+def unpack_face_key(key):
+    key -= 1
+    voxel_id = key & 255
+    ao = (key >> 8) & 3, (key >> 10) & 3, (key >> 12) & 3, (key >> 14) & 3
+    return voxel_id, ao
 
-                    if flip_id:
-                        index = add_data(vertex_data, index, v3, v0, v1, v3, v1, v2)
-                    else:
-                        index = add_data(vertex_data, index, v0, v1, v2, v0, v2, v3)
 
-                # front face
-                neigh_id = get_voxel_id((x, y, z + 1), (wx, wy, wz + 1), world_voxels)
-                if neigh_id < 1 or neigh_id in see_through_blocks:
-                    ao = get_ao((x, y, z + 1), (wx, wy, wz + 1), world_voxels, plane='Z')
-                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+@njit(nogil=True)
+def build_chunk_mesh_greedy(padded_voxels, format_size, section_pos, block_flags, vertex_scratch):
+    solid_vertex_data, see_through_vertex_data = vertex_scratch[0], vertex_scratch[1]
+    solid_index, see_through_index = 0, 0
+
+    # visible faces of every section voxel, indexed as [face_id, slice, first plane axis, second plane axis]
+    face_keys = np.zeros((6, SECTION_SIZE, SECTION_SIZE, SECTION_SIZE), dtype='int32')
 
-                    v0 = (x, y, z + 1, voxel_id, 5, ao[0], flip_id)
-                    v1 = (x, y + 1, z + 1, voxel_id, 5, ao[1], flip_id)
-                    v2 = (x + 1, y + 1, z + 1, voxel_id, 5, ao[2], flip_id)
-                    v3 = (x + 1, y, z + 1, voxel_id, 5, ao[3], flip_id)
+    x0, y0, z0 = get_section_origin(section_pos)
+    for x in range(SECTION_SIZE):
+        for y in range(SECTION_SIZE):
+            for z in range(SECTION_SIZE):
+                voxel_id = padded_voxels[y0 + y + 1, z0 + z + 1, x0 + x + 1]
+                if not voxel_id:
+                    continue
 
-                    if flip_id:
-                        index = add_data(vertex_data, index, v3, v1, v0, v3, v2, v1)
+                for face_id in range(6):
+                    nx, ny, nz = get_face_neighbour(face_id, x0 + x + 1, y0 + y + 1, z0 + z + 1)
+                    neigh_id = padded_voxels[ny, nz, nx]
+                    neigh_flags = block_flags[neigh_id]
+                    if not neigh_flags & BLOCK_SOLID or neigh_flags & BLOCK_SEE_THROUGH:
+                        ao = get_ao(padded_voxels, nx, ny, nz, plane=get_face_plane(face_id))
+                        key = pack_face_key(voxel_id, ao)
+                        if face_id < 2:
+                            face_keys[face_id, y, x, z] = key
+                        elif face_id < 4:
+                            face_keys[face_id, x, y, z] = key
+                        else:
+                            face_keys[face_id, z, y, x] = key
+
+    # merge coplanar faces with the same voxel_id and ao into quads
+    for face_id in range(6):
+        for s in range(SECTION_SIZE):
+            keys = face_keys[face_id, s]
+            for p in range(SECTION_SIZE):
+                for q in range(SECTION_SIZE):
+                    key = keys[p, q]
+                    if not key:
+                        continue
+                    voxel_id, ao = unpack_face_key(key)
+
+                    # merging keeps ao interpolation exact only along edges with equal ao
+                    can_grow_p = ao[0] == ao[1] and ao[3] == ao[2]
+                    can_grow_q = ao[0] == ao[3] and ao[1] == ao[2]
+
+                    dv = 1
+                    if can_grow_q:
+                        while q + dv < SECTION_SIZE and keys[p, q + dv] == key:
+                            dv += 1
+
+                    du = 1
+                    if can_grow_p:
+                        while p + du < SECTION_SIZE:
+                            row_matches = True
+                            for k in range(dv):
+                                if keys[p + du, q + k] != key:
+                                    row_matches = False
+                                    break
+                            if not row_matches:
+                                break
+                            du += 1
+
+                    keys[p:p + du, q:q + dv] = 0
+
+                    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+                    x, y, z = get_plane_voxel(face_id, s, p, q)
+                    x, y, z = x0 + x, y0 + y, z0 + z
+                    if block_flags[voxel_id] & BLOCK_SEE_THROUGH:
+                        see_through_index = add_face(see_through_vertex_data, see_through_index, face_id,
+                                                     x, y, z, du, dv, voxel_id, ao, flip_id)
                     else:
-                        index = add_data(vertex_data, index, v0, v2, v1, v0, v3, v2)
+                        solid_index = add_face(solid_vertex_data, solid_index, face_id,
+                                               x, y, z, du, dv, voxel_id, ao, flip_id)
 
-                if voxel_id in see_through_blocks:
-                    see_through_index = index
-                else:
-                    solid_index = index
-    return solid_vertex_data[:solid_index + 1], see_through_vertex_data[:see_through_index + 1]
+    return solid_vertex_data[:solid_index].copy(), see_through_vertex_data[:see_through_index].copy()
+
+
+MESH_BUILDERS = {
+    'faces': build_chunk_mesh,
+    'binary': build_chunk_mesh_binary,
+    'greedy': build_chunk_mesh_greedy,
+}
+
+
+def get_section_index(local_voxel_pos):
+    lx, ly, lz = local_voxel_pos
+    sx, sy, sz = lx // SECTION_SIZE, ly // SECTION_SIZE, lz // SECTION_SIZE
+    return sx + SECTIONS_PER_AXIS * sz + SECTIONS_PER_AXIS * SECTIONS_PER_AXIS * sy
@@ -0,0 +1,29 @@
+from settings import *
+from meshes.base_mesh import BaseMesh
+
+
+class OverlayMesh(BaseMesh):
+    def __init__(self, app, size):
+        super().__init__()
+        self.app = app
+        self.ctx = app.ctx
+        self.program = app.shader_program.overlay
+        # width and height in pixels, one texel per pixel
+        self.size = size
+
+        self.vbo_format = '2f 2f'
+        self.attrs = ('in_position', 'in_tex_coord_0')
+        self.update_vao()
+
+    def get_vertex_data(self) -> np.array:
+        # top left corner of the screen in clip space
+        w, h = 2 * self.size[0] / WIN_RES.x, 2 * self.size[1] / WIN_RES.y
+        x0, y0, x1, y1 = -1.0, 1.0 - h, -1.0 + w, 1.0
+        vertex_data = np.array(
+            [
+                (x0, y0, 0, 0), (x1, y0, 1, 0), (x1, y1, 1, 1),
+                (x0, y0, 0, 0), (x1, y1, 1, 1), (x0, y1, 0, 1),
+            ],
+            dtype='float32'
+        )
+        return vertex_data
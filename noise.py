@@ -1,5 +1,5 @@
-from settings import SEED
-from numba import njit
+from settings import SEED, njit
+import numpy as np
 from opensimplex.internals import _noise2, _noise3, _init
 
 perm, perm_grad_index3 = _init(seed=SEED)
@@ -12,3 +12,24 @@ def noise2(x, y):
 @njit
 def noise3(x, y, z):
     return _noise3(x, y, z, perm, perm_grad_index3)
+
+
+@njit
+def noise2_grid(xs, ys):
+    # noise2 of every (xs[i], ys[j]) pair, indexed [i, j]
+    out = np.empty((len(xs), len(ys)))
+    for i in range(len(xs)):
+        for j in range(len(ys)):
+            out[i, j] = _noise2(xs[i], ys[j], perm)
+    return out
+
+
+@njit
+def noise3_block(xs, ys, zs):
+    # noise3 of every (xs[i], ys[j], zs[k]) triple, indexed [i, j, k]
+    out = np.empty((len(xs), len(ys), len(zs)))
+    for i in range(len(xs)):
+        for j in range(len(ys)):
+            for k in range(len(zs)):
+                out[i, j, k] = _noise3(xs[i], ys[j], zs[k], perm, perm_grad_index3)
+    return out
@@ -0,0 +1,192 @@
+import argparse
+import json
+import sys
+import tempfile
+
+import moderngl as mgl
+import pygame as pg
+
+from settings import *
+from main import VoxelEngine
+from frame_metrics import FRAME_COLUMNS
+
+
+def look_at(location, target):
+    # yaw and pitch of a player at location facing target
+    direction = glm.vec3(target) - glm.vec3(location)
+    return math.atan2(direction.z, direction.x), math.atan2(direction.y, glm.length(direction.xz))
+
+
+def get_spin_path(frames):
+    # a full turn on the spot from the start position, looking slightly down
+    return [(PLAYER_POS, glm.radians(-90) + 2 * math.pi * i / frames, glm.radians(-20)) for i in range(frames)]
+
+
+def get_orbit_path(frames):
+    # a circle around the island, facing its center
+    center = glm.vec3(CENTER_XZ, WATER_LINE, CENTER_XZ)
+    radius, height = CENTER_XZ * 0.8, WORLD_H * CHUNK_SIZE
+    path = []
+    for i in range(frames):
+        angle = 2 * math.pi * i / frames
+        location = glm.vec3(center.x + radius * math.cos(angle), height, center.z + radius * math.sin(angle))
+        path.append((location, *look_at(location, center)))
+    return path
+
+
+def get_flyover_path(frames):
+    # a straight line over the island from one edge of the world to the other, looking ahead and down
+    start = glm.vec3(CHUNK_SIZE, WORLD_H * CHUNK_SIZE, CENTER_XZ)
+    end = glm.vec3(WORLD_W * CHUNK_SIZE - CHUNK_SIZE, WORLD_H * CHUNK_SIZE, CENTER_XZ)
+    return [(glm.mix(start, end, i / max(frames - 1, 1)), 0.0, glm.radians(-30)) for i in range(frames)]
+
+
+CAMERA_PATHS = {
+    'spin': get_spin_path,
+    'orbit': get_orbit_path,
+    'flyover': get_flyover_path,
+}
+
+
+def load_path(path, frames):
+    # keyframes of a json file, [x, y, z, yaw, pitch] with the angles in degrees, spread evenly over the frames
+    with open(path) as file:
+        keyframes = np.array(json.load(file), dtype='float64')
+    if len(keyframes) == 1:
+        keyframes = np.repeat(keyframes, 2, axis=0)
+    times = np.linspace(0, len(keyframes) - 1, frames)
+    samples = np.stack([np.interp(times, np.arange(len(keyframes)), keyframes[:, i]) for i in range(5)], axis=1)
+    return [(glm.vec3(*sample[:3]), glm.radians(sample[3]), glm.radians(sample[4])) for sample in samples]
+
+
+def get_path(name, frames=OFFSCREEN_FRAMES):
+    if name in CAMERA_PATHS:
+        return CAMERA_PATHS[name](frames)
+    return load_path(name, frames)
+
+
+def save_frame(frame, path):
+    height, width, _ = frame.shape
+    pg.image.save(pg.image.frombuffer(np.ascontiguousarray(frame).tobytes(), (width, height), 'RGB'), path)
+
+
+def load_frame(path):
+    # [y, x, rgb] from the top row down, as read by OffscreenEngine.read_frame
+    return pg.surfarray.array3d(pg.image.load(path)).transpose(1, 0, 2)
+
+
+def diff_frame(frame, reference, tolerance=OFFSCREEN_DIFF_TOLERANCE):
+    # share of the pixels with a channel further than tolerance from the reference, 1 when the sizes differ
+    if frame.shape != reference.shape:
+        return 1.0
+    difference = np.abs(frame.astype('int16') - reference.astype('int16')).max(axis=2)
+    return float(np.count_nonzero(difference > tolerance) / difference.size)
+
+
+class OffscreenEngine(VoxelEngine):
+    """The engine drawing into a framebuffer of a standalone gl context instead of a window, for machines
+    without a display, driven by scripted camera paths at a fixed step"""
+    def __init__(self, size=OFFSCREEN_RES, backend=OFFSCREEN_BACKEND, save_dir=None):
+        self.size = tuple(size)
+        self.backend = backend
+        self.fbo = None
+        # the world of the saves is left alone, frames depend on the generated terrain only, the directory
+        # is removed on shutdown, the mesh cache is off so every column is meshed and no cache is written
+        self.temp_dir = tempfile.TemporaryDirectory() if save_dir is None else None
+        super().__init__(save_dir or self.temp_dir.name, None)
+        self.delta_time = OFFSCREEN_DELTA_MS
+
+    def create_context(self):
+        # the framebuffer stays bound, every draw goes there
+        ctx = mgl.create_standalone_context(require=330, **({'backend': self.backend} if self.backend else {}))
+        self.fbo = ctx.simple_framebuffer(self.size)
+        self.fbo.use()
+        return ctx
+
+    def flip(self):
+        # waits for the gpu, the frame time includes drawing as it does with a window
+        self.ctx.finish()
+
+    def load_world(self):
+        # every wanted column is meshed and the kernels compiled before the path starts,
+        # frames do not depend on loading speed and their times leave jit compilation out
+        self.scene.world.streamer.finish()
+        if self.jit_warmup is not None:
+            self.jit_warmup.join()
+
+    def read_frame(self):
+        # [y, x, rgb] from the top row down
+        width, height = self.size
+        frame = np.frombuffer(self.fbo.read(components=3), dtype='uint8').reshape(height, width, 3)
+        return frame[::-1]
+
+    def run_path(self, path, dump_dir=None, reference_dir=None):
+        # draws a frame at every (location, yaw, pitch) of the path, returns {frame index: differing pixel share}
+        # of the frames compared to the reference frames, a missing reference counts as fully different
+        differences = {}
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+
+        self.frame_metrics.end_frame()
+        for i, (location, yaw, pitch) in enumerate(path):
+            with self.frame_metrics.phase('player'):
+                self.player.look(location, yaw, pitch)
+            self.shader_program.update()
+            self.scene.update()
+            self.render()
+            self.time += self.delta_time * 0.001
+
+            if dump_dir or reference_dir:
+                frame = self.read_frame()
+                name = f'frame_{i:05d}.png'
+                if dump_dir:
+                    save_frame(frame, os.path.join(dump_dir, name))
+                if reference_dir:
+                    reference_path = os.path.join(reference_dir, name)
+                    differences[i] = (diff_frame(frame, load_frame(reference_path))
+                                      if os.path.exists(reference_path) else 1.0)
+                # reading and writing frames is not part of the next one
+                self.frame_metrics.restart_clock()
+        return differences
+
+    def shutdown(self):
+        self.scene.world.shutdown()
+        self.scene.world.journal.close()
+        if self.temp_dir is not None:
+            self.temp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='renders scripted camera paths without a window')
+    parser.add_argument('--path', default='orbit',
+                        help=f'camera path, one of {", ".join(CAMERA_PATHS)} or a json file of keyframes')
+    parser.add_argument('--frames', type=int, default=OFFSCREEN_FRAMES)
+    parser.add_argument('--res', default='x'.join(map(str, OFFSCREEN_RES)), help='width x height')
+    parser.add_argument('--backend', default=OFFSCREEN_BACKEND, help='standalone context backend, empty for default')
+    parser.add_argument('--dump', help='directory the frames are saved to as png')
+    parser.add_argument('--reference', help='directory of the frames of a previous dump to compare to')
+    parser.add_argument('--export', help='path the frame metrics are exported to as csv and json, no extension')
+    parser.add_argument('--save-dir', help='world save directory to load, a fresh temporary one by default')
+    args = parser.parse_args()
+
+    app = OffscreenEngine(tuple(int(n) for n in args.res.split('x')), args.backend or None, args.save_dir)
+    app.load_world()
+    differences = app.run_path(get_path(args.path, args.frames), args.dump, args.reference)
+    app.shutdown()
+
+    metrics = app.frame_metrics.get_metrics()
+    print(f'{metrics["frames"]} frames  p50 {metrics["frame_ms_p50"]:.2f} ms  p95 {metrics["frame_ms_p95"]:.2f} ms'
+          f'  p99 {metrics["frame_ms_p99"]:.2f} ms')
+    frames = app.frame_metrics.get_frames()
+    draw_calls, triangles = frames[:, FRAME_COLUMNS.index('draw_calls')], frames[:, FRAME_COLUMNS.index('triangles')]
+    print(f'draw calls mean {draw_calls.mean():.0f} max {draw_calls.max():.0f}'
+          f'  triangles mean {triangles.mean() / 1e6:.2f}M max {triangles.max() / 1e6:.2f}M')
+    if args.export:
+        print('frame metrics exported to', *app.frame_metrics.export(args.export))
+
+    failed = {i: share for i, share in differences.items() if share > OFFSCREEN_DIFF_MAX_PIXELS}
+    if args.reference:
+        print(f'{len(differences) - len(failed)}/{len(differences)} frames match {args.reference}')
+        for i, share in failed.items():
+            print(f'frame {i:5d}: {share * 100:6.2f}% of the pixels differ')
+    sys.exit(1 if failed else 0)
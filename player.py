@@ -3,6 +3,9 @@ from camera import Camera
 from mobile import Movable, Mobile
 from settings import *
 
+# keys moving the player forward, back, right, left, up and down, bit i of the pressed keys mask is MOVE_KEYS[i]
+MOVE_KEYS = (pg.K_w, pg.K_s, pg.K_d, pg.K_a, pg.K_q, pg.K_e)
+
 
 class Player(Movable):
     def __init__(self, app, position=PLAYER_POS, yaw=-90, pitch=0):
@@ -13,41 +16,51 @@ class Player(Movable):
         )
         self.camera = Camera(self.position)
 
-    def update(self):
+    def update(self, frame_input=None):
+        # frame_input is (mouse dx, mouse dy, pressed keys mask), read from pygame when None
+        mouse_dx, mouse_dy, keys = self.read_input() if frame_input is None else frame_input
         self.set_tick(self.app.delta_time)
-        self.keyboard_control()
-        self.mouse_control()
+        self.keyboard_control(keys)
+        self.mouse_control(mouse_dx, mouse_dy)
         super().update()
         self.camera.update()
 
+    def look(self, location, yaw, pitch):
+        # places the player without input, its camera and frustum follow
+        self.position.location = glm.vec3(location)
+        self.position.yaw, self.position.pitch = yaw, pitch
+        self.position.update()
+        self.camera.update()
+
     def handle_event(self, event):
         # adding and removing voxels with clicks
         if event.type == pg.MOUSEBUTTONDOWN:
-            voxel_handler = self.app.scene.world.voxel_handler
-            if event.button == 1:
-                voxel_handler.set_voxel()
-            if event.button == 3:
-                voxel_handler.switch_mode()
+            self.click(event.button)
+
+    def click(self, button):
+        voxel_handler = self.app.scene.world.voxel_handler
+        if button == 1:
+            voxel_handler.set_voxel()
+        if button == 3:
+            voxel_handler.switch_mode()
 
-    def mouse_control(self):
+    @staticmethod
+    def read_input():
         mouse_dx, mouse_dy = pg.mouse.get_rel()
+        key_state = pg.key.get_pressed()
+        keys = sum(1 << i for i, key in enumerate(MOVE_KEYS) if key_state[key])
+        return mouse_dx, mouse_dy, keys
+
+    def mouse_control(self, mouse_dx, mouse_dy):
         if mouse_dx:
             self.position.rotate_yaw(delta_x=mouse_dx * MOUSE_SENSITIVITY)
         if mouse_dy:
             self.position.rotate_pitch(delta_y=mouse_dy * MOUSE_SENSITIVITY)
 
-    def keyboard_control(self):
-        key_state = pg.key.get_pressed()
+    def keyboard_control(self, keys):
         vel = PLAYER_SPEED * self.app.delta_time
-        if key_state[pg.K_w]:
-            self.position.move_forward(vel)
-        if key_state[pg.K_s]:
-            self.position.move_back(vel)
-        if key_state[pg.K_d]:
-            self.position.move_right(vel)
-        if key_state[pg.K_a]:
-            self.position.move_left(vel)
-        if key_state[pg.K_q]:
-            self.position.move_up(vel)
-        if key_state[pg.K_e]:
-            self.position.move_down(vel)
+        moves = (self.position.move_forward, self.position.move_back, self.position.move_right,
+                 self.position.move_left, self.position.move_up, self.position.move_down)
+        for i, move in enumerate(moves):
+            if keys >> i & 1:
+                move(vel)
@@ -0,0 +1,183 @@
+import os
+import zlib
+
+from settings import *
+from chunk_storage import SingleVoxels, PaletteVoxels, DenseVoxels
+
+# file header, the offset table of every chunk of the region follows it, then the chunk payloads
+REGION_MAGIC = b'VXRG'
+REGION_HEADER = np.dtype([
+    ('magic', 'S4'), ('version', '<u2'), ('compressed', '<u2'), ('seed', '<i8'),
+    ('region_size', '<u2'), ('world_w', '<u2'), ('world_h', '<u2'), ('world_d', '<u2'), ('chunk_size', '<u2'),
+])
+REGION_TABLE = np.dtype([
+    # payload offset in the file and byte length, kind 0 missing 1 single 2 palette 3 dense,
+    # palette index bits, voxel_id of single value chunks or the palette length
+    ('offset', '<u8'), ('length', '<u4'), ('kind', 'u1'), ('bits', 'u1'), ('value', '<u2'),
+])
+REGION_CHUNKS = REGION_SIZE * REGION_SIZE * WORLD_H
+MISSING, SINGLE, PALETTE, DENSE = range(4)
+
+
+class RegionStore:
+    """Chunk storage saved as region files of REGION_SIZE x REGION_SIZE chunk columns"""
+    def __init__(self, path=WORLD_SAVE_DIR, compressed=REGION_COMPRESSED):
+        self.path = path
+        self.compressed = compressed
+        # storage versions of the chunks as last loaded or saved
+        self.saved_versions = np.zeros(WORLD_VOL, dtype='uint64')
+        # {path: memory map} of the uncompressed region files chunks may still read from
+        self.maps = {}
+
+    def get_region_path(self, rx, rz):
+        return os.path.join(self.path, f'r.{rx}.{rz}.bin')
+
+    @staticmethod
+    def get_regions():
+        nx, nz = -(-WORLD_W // REGION_SIZE), -(-WORLD_D // REGION_SIZE)
+        return [(rx, rz) for rx in range(nx) for rz in range(nz)]
+
+    @staticmethod
+    def get_chunk_indices(rx, rz):
+        # chunk index of every slot of the region table, -1 outside the world
+        indices = np.full(REGION_CHUNKS, -1, dtype='int64')
+        for y in range(WORLD_H):
+            for lz in range(REGION_SIZE):
+                for lx in range(REGION_SIZE):
+                    x, z = rx * REGION_SIZE + lx, rz * REGION_SIZE + lz
+                    if x < WORLD_W and z < WORLD_D:
+                        slot = lx + REGION_SIZE * lz + REGION_SIZE * REGION_SIZE * y
+                        indices[slot] = x + WORLD_W * z + WORLD_AREA * y
+        return indices
+
+    def load(self, storage):
+        # puts every saved chunk into the storage, returns the set of loaded chunk indices
+        loaded = set()
+        for rx, rz in self.get_regions():
+            path = self.get_region_path(rx, rz)
+            if os.path.exists(path):
+                loaded.update(self.load_region(storage, path, self.get_chunk_indices(rx, rz)))
+        self.saved_versions[:] = storage.versions
+        return loaded
+
+    @staticmethod
+    def read_header(path):
+        header = np.fromfile(path, dtype=REGION_HEADER, count=1)
+        if not len(header):
+            return None
+        header = header[0]
+        if (header['magic'] != REGION_MAGIC or header['version'] != REGION_FORMAT_VERSION or
+                header['seed'] != SEED or header['region_size'] != REGION_SIZE or header['world_w'] != WORLD_W or
+                header['world_h'] != WORLD_H or header['world_d'] != WORLD_D or header['chunk_size'] != CHUNK_SIZE):
+            # another world or format, regenerated and overwritten on save
+            return None
+        return header
+
+    def load_region(self, storage, path, chunk_indices):
+        header = self.read_header(path)
+        if header is None:
+            return []
+        table = np.fromfile(path, dtype=REGION_TABLE, count=REGION_CHUNKS, offset=REGION_HEADER.itemsize)
+
+        if header['compressed']:
+            with open(path, 'rb') as file:
+                data = file.read()
+        else:
+            # pages are only read when a chunk is decoded, edits stay private to the process
+            self.maps[path] = np.memmap(path, dtype='uint8', mode='c')
+            data = self.maps[path].view(np.ndarray)
+
+        loaded = []
+        for slot, chunk_index in enumerate(chunk_indices):
+            entry = table[slot]
+            if chunk_index == -1 or entry['kind'] == MISSING:
+                continue
+
+            payload = data[entry['offset']:entry['offset'] + entry['length']]
+            if header['compressed'] and entry['kind'] != SINGLE:
+                # a writable buffer, dense chunks are edited in place
+                payload = np.frombuffer(bytearray(zlib.decompress(payload)), dtype='uint8')
+            storage.set_chunk(chunk_index, self.decode_chunk(entry, payload))
+            loaded.append(chunk_index)
+        return loaded
+
+    @staticmethod
+    def decode_chunk(entry, payload):
+        if entry['kind'] == SINGLE:
+            return SingleVoxels(int(entry['value']))
+        if entry['kind'] == PALETTE:
+            n = int(entry['value'])
+            return PaletteVoxels(np.array(payload[:n]), int(entry['bits']), payload[n:])
+        return DenseVoxels(payload)
+
+    @staticmethod
+    def copy_chunk(chunk):
+        if isinstance(chunk, PaletteVoxels):
+            return PaletteVoxels(chunk.palette.copy(), chunk.bits, chunk.packed.copy())
+        if isinstance(chunk, DenseVoxels):
+            return DenseVoxels(chunk.voxels.copy())
+        return chunk
+
+    def release_region(self, storage, path, chunk_indices):
+        # chunks reading the memory map of the region file get their own copy and the map is dropped,
+        # a mapped file can not be replaced on windows
+        if self.maps.pop(path, None) is None:
+            return
+        with storage.lock:
+            for chunk_index in chunk_indices[chunk_indices != -1]:
+                storage.chunks[chunk_index] = self.copy_chunk(storage.chunks[chunk_index])
+                storage.snapshots.pop(chunk_index, None)
+
+    @staticmethod
+    def encode_chunk(chunk):
+        # table kind, bits, value and the payload bytes
+        if isinstance(chunk, SingleVoxels):
+            return SINGLE, 0, chunk.voxel_id, b''
+        if isinstance(chunk, PaletteVoxels):
+            return PALETTE, chunk.bits, len(chunk.palette), chunk.palette.tobytes() + chunk.packed.tobytes()
+        return DENSE, 0, 0, chunk.voxels.tobytes()
+
+    def save(self, storage, saved=None):
+        # writes the regions with chunks changed since the last load or save, returns the number of written regions,
+        # chunks not in the saved set of chunk indices are left missing, every chunk is saved by default
+        os.makedirs(self.path, exist_ok=True)
+        written = 0
+        for rx, rz in self.get_regions():
+            path = self.get_region_path(rx, rz)
+            chunk_indices = self.get_chunk_indices(rx, rz)
+            in_world = chunk_indices[chunk_indices != -1]
+            if os.path.exists(path) and np.array_equal(storage.versions[in_world], self.saved_versions[in_world]):
+                continue
+
+            self.save_region(storage, path, chunk_indices, saved)
+            self.saved_versions[in_world] = storage.versions[in_world]
+            written += 1
+        return written
+
+    def save_region(self, storage, path, chunk_indices, saved=None):
+        header = np.zeros(1, dtype=REGION_HEADER)
+        header[0] = (REGION_MAGIC, REGION_FORMAT_VERSION, self.compressed, SEED,
+                     REGION_SIZE, WORLD_W, WORLD_H, WORLD_D, CHUNK_SIZE)
+        table = np.zeros(REGION_CHUNKS, dtype=REGION_TABLE)
+
+        payloads = []
+        offset = REGION_HEADER.itemsize + REGION_TABLE.itemsize * REGION_CHUNKS
+        for slot, chunk_index in enumerate(chunk_indices):
+            if chunk_index == -1 or (saved is not None and chunk_index not in saved):
+                continue
+            kind, bits, value, payload = self.encode_chunk(storage.chunks[chunk_index])
+            if self.compressed and payload:
+                payload = zlib.compress(payload, REGION_COMPRESSION_LEVEL)
+            table[slot] = (offset, len(payload), kind, bits, value)
+            payloads.append(payload)
+            offset += len(payload)
+
+        # written next to the old file and swapped in, a crash never leaves half a region
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(header.tobytes())
+            file.write(table.tobytes())
+            for payload in payloads:
+                file.write(payload)
+        self.release_region(storage, path, chunk_indices)
+        os.replace(tmp_path, path)
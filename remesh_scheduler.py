@@ -0,0 +1,137 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from settings import *
+
+
+class RemeshScheduler:
+    """Meshes dirty chunk sections on worker threads, uploads them within a per frame budget"""
+    def __init__(self, world):
+        self.world = world
+        self.chunks = world.chunks
+        self.executor = ThreadPoolExecutor(max_workers=MESH_WORKERS, thread_name_prefix='mesher')
+
+        # {chunk index: section indices} waiting for a worker, several edits of a section mesh it once
+        self.dirty: dict[int, set[int]] = {}
+        # (chunk index, section index): time the section was first marked dirty
+        self.dirty_since: dict[tuple[int, int], float] = {}
+        # (chunk index, section index): newest dispatched version, older results are dropped
+        self.versions: dict[tuple[int, int], int] = {}
+
+        self.in_flight = deque()  # futures of the worker jobs
+        self.in_flight_sections = 0
+        self.ready = deque()  # built sections waiting for upload
+
+        # metrics
+        self.latencies = deque(maxlen=MESH_LATENCY_WINDOW)
+        self.uploaded = 0
+        self.dropped = 0
+        self.frame_upload_bytes = 0
+
+    def mark_dirty(self, chunk_index, section_indices):
+        now = time.perf_counter()
+        self.dirty.setdefault(chunk_index, set()).update(section_indices)
+        for section_index in section_indices:
+            self.dirty_since.setdefault((chunk_index, section_index), now)
+
+    def update(self):
+        self.dispatch()
+        self.collect()
+        self.upload()
+
+    def dispatch(self):
+        for chunk_index, section_indices in self.dirty.items():
+            chunk = self.chunks[chunk_index]
+            # workers mesh a copy, edits made meanwhile mark the sections dirty again
+            padded_voxels = self.world.storage.get_padded_voxels(chunk.position)
+
+            jobs = []
+            for section_index in section_indices:
+                key = chunk_index, section_index
+                version = self.versions[key] = self.versions.get(key, 0) + 1
+                jobs.append((chunk.mesh.sections[section_index], key, version, self.dirty_since.pop(key)))
+
+            self.in_flight.append(self.executor.submit(self.build_sections, padded_voxels, jobs))
+            self.in_flight_sections += len(jobs)
+        self.dirty.clear()
+
+    @staticmethod
+    def build_sections(padded_voxels, jobs):
+        # runs on a worker thread, the mesh builders release the gil
+        return [(key, version, requested, section.build(padded_voxels))
+                for section, key, version, requested in jobs]
+
+    def collect(self):
+        for _ in range(len(self.in_flight)):
+            future = self.in_flight.popleft()
+            if future.done():
+                sections = future.result()
+                self.in_flight_sections -= len(sections)
+                self.ready.extend(sections)
+            else:
+                self.in_flight.append(future)
+
+    def upload(self):
+        start = time.perf_counter()
+        self.frame_upload_bytes = 0
+
+        # at least one section per frame so the queue always drains
+        while self.ready:
+            key, version, requested, (solid, see_through) = self.ready.popleft()
+            if version != self.versions[key]:
+                self.dropped += 1
+                continue
+
+            chunk_index, section_index = key
+            chunk = self.chunks.get(chunk_index)
+            if chunk is None or chunk.mesh is None:
+                # evicted by the streamer meanwhile
+                self.dropped += 1
+                continue
+            chunk.mesh.sections[section_index].upload(solid, see_through)
+
+            now = time.perf_counter()
+            self.latencies.append(now - requested)
+            self.uploaded += 1
+            self.frame_upload_bytes += solid.nbytes + see_through.nbytes
+
+            if ((now - start) * 1000 > MESH_UPLOAD_BUDGET_MS or
+                    self.frame_upload_bytes > MESH_UPLOAD_BUDGET_BYTES):
+                break
+
+    def forget(self, chunk_index):
+        # drops the pending sections of an evicted chunk, results still in flight are dropped on upload
+        for section_index in self.dirty.pop(chunk_index, ()):
+            self.dirty_since.pop((chunk_index, section_index), None)
+        for section_index in range(SECTIONS_PER_CHUNK):
+            key = chunk_index, section_index
+            if key in self.versions:
+                self.versions[key] += 1
+
+    @property
+    def dirty_sections(self):
+        return sum(len(sections) for sections in self.dirty.values())
+
+    @property
+    def queue_depth(self):
+        # sections waiting for a worker, being meshed or waiting for upload
+        return self.dirty_sections + self.in_flight_sections + len(self.ready)
+
+    def get_metrics(self):
+        latencies = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            'dirty_sections': self.dirty_sections,
+            'in_flight_sections': self.in_flight_sections,
+            'ready_sections': len(self.ready),
+            'queue_depth': self.queue_depth,
+            'uploaded': self.uploaded,
+            'dropped': self.dropped,
+            'frame_upload_bytes': self.frame_upload_bytes,
+            'latency_ms_mean': float(latencies.mean()),
+            'latency_ms_p95': float(np.percentile(latencies, 95)),
+            'latency_ms_max': float(latencies.max()),
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -9,7 +9,7 @@ from world_objects.water import Water
 class Scene:
     def __init__(self, app):
         self.app = app
-        self.world = World(self.app)
+        self.world = World(self.app, app.save_dir, app.mesh_cache_dir)
         self.voxel_marker = VoxelMarker(self.world.voxel_handler)
 
         self.bedrock = Bedrock(self)
@@ -20,6 +20,9 @@ class Scene:
         self.voxel_marker.update()
 
     def render(self):
+        with self.app.frame_metrics.phase('culling'):
+            self.world.cull()
+
         self.bedrock.render()
         self.world.render()
         self.world.render_see_through()
@@ -0,0 +1,218 @@
+import argparse
+import sys
+import tempfile
+import time
+
+from settings import *
+from edit_journal import EditJournal, JOURNAL_RECORD
+from frame_metrics import FRAME_COLUMNS
+
+# file header, the frames, clicks, edits and starting deltas follow it in that order, their counts are in the header
+SESSION_MAGIC = b'VXSN'
+SESSION_HEADER = np.dtype([
+    ('magic', 'S4'), ('version', '<u2'), ('interaction_mode', 'u1'), ('new_voxel_id', 'u1'), ('seed', '<i8'),
+    ('world_w', '<u2'), ('world_h', '<u2'), ('world_d', '<u2'), ('chunk_size', '<u2'),
+    # player at the start
+    ('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('yaw', '<f8'), ('pitch', '<f8'),
+    ('frames', '<u4'), ('clicks', '<u4'), ('edits', '<u4'), ('deltas', '<u4'),
+])
+# input of a frame, delta time in ms, relative mouse motion and the pressed keys mask of Player.read_input
+SESSION_FRAME = np.dtype([('delta_ms', '<f4'), ('mouse_dx', '<i2'), ('mouse_dy', '<i2'), ('keys', 'u1')])
+# mouse clicks and the voxel edits they made, with the frame they happened in
+SESSION_CLICK = np.dtype([('frame', '<u4'), ('button', 'u1')])
+SESSION_EDIT = np.dtype([('frame', '<u4'), *JOURNAL_RECORD.descr])
+# edits of the world against the generated one when the recording started, as compacted by EditJournal
+SESSION_DELTA = np.dtype([('key', '<i8'), ('old', 'u1'), ('new', 'u1')])
+SESSION_FORMAT_VERSION = 1
+
+
+def get_edits(records, frame):
+    # journal records as session edits of the frame
+    edits = np.zeros(len(records), dtype=SESSION_EDIT)
+    edits['frame'] = frame
+    for name in JOURNAL_RECORD.names:
+        edits[name] = records[name]
+    return edits
+
+
+class SessionRecorder:
+    """Input, delta time, clicks and voxel edits of every frame of a running engine, saved as a session file"""
+    def __init__(self, app):
+        self.app = app
+        self.journal = app.scene.world.journal
+        self.header = np.zeros(1, dtype=SESSION_HEADER)
+        self.frames = []
+        self.clicks = []
+        self.edits = []
+        self.deltas = np.zeros(0, dtype=SESSION_DELTA)
+
+    def start(self):
+        # the replay starts from the edits and the player as they are now, the deltas in memory hold every edit
+        self.deltas = np.zeros(len(self.journal.keys), dtype=SESSION_DELTA)
+        self.deltas['key'], self.deltas['old'], self.deltas['new'] = \
+            self.journal.keys, self.journal.old_ids, self.journal.new_ids
+
+        position, voxel_handler = self.app.player.position, self.app.scene.world.voxel_handler
+        self.header[0] = (SESSION_MAGIC, SESSION_FORMAT_VERSION, voxel_handler.interaction_mode,
+                          voxel_handler.new_voxel_id, SEED, WORLD_W, WORLD_H, WORLD_D, CHUNK_SIZE,
+                          *position.location, position.yaw, position.pitch, 0, 0, 0, 0)
+        self.journal.listeners.append(self.record_edits)
+        return self
+
+    def record_frame(self, delta_time, frame_input):
+        self.frames.append((delta_time, *frame_input))
+
+    def record_click(self, button):
+        # clicks are handled before the frame update, they belong to the frame about to be recorded
+        self.clicks.append((len(self.frames), button))
+
+    def record_edits(self, records):
+        self.edits.append(get_edits(records, len(self.frames)))
+
+    def stop(self, path=None):
+        # saves the session, to SESSION_DIR by default, returns its path
+        self.journal.listeners.remove(self.record_edits)
+        if path is None:
+            os.makedirs(SESSION_DIR, exist_ok=True)
+            path = os.path.join(SESSION_DIR, time.strftime('session_%Y%m%d_%H%M%S.bin'))
+
+        frames = np.array(self.frames, dtype=SESSION_FRAME)
+        clicks = np.array(self.clicks, dtype=SESSION_CLICK)
+        edits = np.concatenate(self.edits) if self.edits else np.zeros(0, dtype=SESSION_EDIT)
+        for name, array in (('frames', frames), ('clicks', clicks), ('edits', edits), ('deltas', self.deltas)):
+            self.header[name] = len(array)
+        with open(path, 'wb') as file:
+            for array in (self.header, frames, clicks, edits, self.deltas):
+                file.write(array.tobytes())
+        return path
+
+
+def load_session(path):
+    # {header, frames, clicks, edits, deltas} of a session file, a session of another world can not be replayed
+    header = np.fromfile(path, dtype=SESSION_HEADER, count=1)
+    if not len(header) or header[0]['magic'] != SESSION_MAGIC:
+        raise ValueError(f'{path} is not a session file')
+    header = header[0]
+    world_size = [int(header[name]) for name in ('world_w', 'world_h', 'world_d', 'chunk_size')]
+    if header['seed'] != SEED or world_size != [WORLD_W, WORLD_H, WORLD_D, CHUNK_SIZE]:
+        raise ValueError(f'{path} was recorded in a world of seed {header["seed"]} and size {world_size}')
+
+    session, offset = {'header': header}, SESSION_HEADER.itemsize
+    for name, dtype in (('frames', SESSION_FRAME), ('clicks', SESSION_CLICK), ('edits', SESSION_EDIT),
+                        ('deltas', SESSION_DELTA)):
+        session[name] = np.fromfile(path, dtype=dtype, count=int(header[name]), offset=offset)
+        offset += dtype.itemsize * int(header[name])
+    return session
+
+
+def save_start_deltas(session, save_dir):
+    # a save dir holding only the edits of the world when the session started, regions are generated again
+    journal = EditJournal(save_dir)
+    deltas = session['deltas']
+    journal.keys, journal.old_ids, journal.new_ids = deltas['key'], deltas['old'], deltas['new']
+    journal.save_deltas()
+
+
+class SessionReplay:
+    """A recorded session driving the player and the voxel handler of an app frame by frame, the app is a
+    HeadlessApp to replay without rendering or an OffscreenEngine to draw every frame"""
+    def __init__(self, app, session):
+        self.app = app
+        self.session = session
+        # voxel edits of the replay, as the recorded ones
+        self.edits = []
+        self.frame = 0
+
+    def record_edits(self, records):
+        self.edits.append(get_edits(records, self.frame))
+
+    def start(self):
+        # the player and the voxel handler as the recording started, the world is loaded around the player
+        header, app = self.session['header'], self.app
+        voxel_handler = app.scene.world.voxel_handler
+        location = glm.vec3(*[float(header[name]) for name in ('x', 'y', 'z')])
+        app.player.look(location, float(header['yaw']), float(header['pitch']))
+        voxel_handler.interaction_mode = int(header['interaction_mode'])
+        voxel_handler.new_voxel_id = int(header['new_voxel_id'])
+        app.load_world()
+
+    def run(self):
+        # replays every frame at its recorded delta time, the frame metrics keep all of them,
+        # returns the frames whose voxel edits differ from the recorded ones
+        app, frames, clicks = self.app, self.session['frames'], self.session['clicks']
+        click_ends = np.searchsorted(clicks['frame'], np.arange(len(frames)), side='right')
+        journal = app.scene.world.journal
+        journal.listeners.append(self.record_edits)
+
+        app.frame_metrics.reset(max(len(frames), 1))
+        click = 0
+        for i, frame in enumerate(frames):
+            self.frame = i
+            for button in clicks['button'][click:click_ends[i]]:
+                app.player.click(int(button))
+            click = click_ends[i]
+
+            app.delta_time = float(frame['delta_ms'])
+            app.step((int(frame['mouse_dx']), int(frame['mouse_dy']), int(frame['keys'])))
+            app.render()
+            app.time += app.delta_time * 0.001
+
+        journal.listeners.remove(self.record_edits)
+        return self.get_diverged_frames()
+
+    def get_diverged_frames(self):
+        edits = np.concatenate(self.edits) if self.edits else np.zeros(0, dtype=SESSION_EDIT)
+        recorded = self.session['edits']
+        frames = np.union1d(edits['frame'], recorded['frame'])
+        return [int(frame) for frame in frames
+                if not np.array_equal(edits[edits['frame'] == frame], recorded[recorded['frame'] == frame])]
+
+
+def create_app(args, save_dir):
+    if not args.render:
+        from headless import HeadlessApp
+        return HeadlessApp(save_dir)
+    # the offscreen engine imports this module through main
+    from offscreen import OffscreenEngine
+    return OffscreenEngine(tuple(int(n) for n in args.res.split('x')), args.backend or None, save_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='replays a recorded session at its recorded delta times')
+    parser.add_argument('session', help='session file recorded with F5 or SESSION_RECORDING')
+    parser.add_argument('--render', action='store_true', help='draw every frame into an offscreen framebuffer')
+    parser.add_argument('--res', default='x'.join(map(str, OFFSCREEN_RES)), help='width x height')
+    parser.add_argument('--backend', default=OFFSCREEN_BACKEND, help='standalone context backend, empty for default')
+    parser.add_argument('--export', help='path the frame metrics are exported to as csv and json, no extension')
+    args = parser.parse_args()
+
+    session = load_session(args.session)
+    header = session['header']
+    print(f'{header["frames"]} frames  {header["clicks"]} clicks  {header["edits"]} edits'
+          f'  {header["deltas"]} voxels edited before the recording')
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        save_start_deltas(session, save_dir)
+        start = time.perf_counter()
+        app = create_app(args, save_dir)
+        replay = SessionReplay(app, session)
+        replay.start()
+        print(f'world loaded in {time.perf_counter() - start:.2f} s')
+
+        diverged = replay.run()
+        app.scene.world.journal.close()
+        app.shutdown()
+
+    metrics = app.frame_metrics.get_metrics()
+    if metrics['frames']:
+        print(f'{metrics["frames"]} frames  p50 {metrics["frame_ms_p50"]:.2f} ms'
+              f'  p95 {metrics["frame_ms_p95"]:.2f} ms  p99 {metrics["frame_ms_p99"]:.2f} ms')
+        print('  '.join(f'{column} {metrics[f"{column}_mean"]:.2f}' for column in FRAME_COLUMNS
+                        if column.endswith('_ms')) + ' ms mean')
+    if args.export:
+        print('frame metrics exported to', *app.frame_metrics.export(args.export))
+
+    if diverged:
+        # chunks missing from the recorded world, still loading or streamed out, make rays hit elsewhere
+        print(f'voxel edits differ from the recording in {len(diverged)} frames, first at frame {diverged[0]}')
+    sys.exit(1 if diverged else 0)
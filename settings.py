@@ -1,7 +1,9 @@
-from numba import njit
+import numba
 import numpy as np
 import glm
 import math
+import os
+import hashlib
 
 # resolution
 WIN_RES = glm.vec2(1600, 900)
@@ -24,12 +26,108 @@ H_CHUNK_SIZE = CHUNK_SIZE // 2
 CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
 CHUNK_VOL = CHUNK_AREA * CHUNK_SIZE
 CHUNK_SPHERE_RADIUS = H_CHUNK_SIZE * math.sqrt(3)
+PADDED_CHUNK_SIZE = CHUNK_SIZE + 2  # chunk plus a one voxel border of its neighbours
+
+# chunk storage, chunks of one voxel id take a byte, chunks of up to 2 ** bits ids are stored as
+# bit packed palette indices, the rest a byte per voxel
+CHUNK_PALETTE_BITS = (1, 2, 4)
+
+# chunk sections, meshed and drawn independently so an edit only remeshes a small region
+SECTION_SIZE = 20
+SECTIONS_PER_AXIS = CHUNK_SIZE // SECTION_SIZE
+SECTIONS_PER_CHUNK = SECTIONS_PER_AXIS ** 3
+
+# remeshing after edits
+MESH_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # threads running the mesh builders
+MESH_UPLOAD_BUDGET_MS = 2.0  # per frame time uploading finished meshes to the gpu
+MESH_UPLOAD_BUDGET_BYTES = 4 * 2 ** 20  # per frame vertex data uploaded to the gpu
+MESH_LATENCY_WINDOW = 256  # recent uploads the latency metrics are computed over
+
+# meshing
+# faces: one quad per visible face  binary: same output, faces culled with column bitmasks
+# greedy: coplanar faces with the same voxel_id and ao merged into larger quads, about a quarter fewer vertices
+# on generated terrain as voxel ids and ao change from voxel to voxel, far fewer on flat ground
+MESH_BUILDER = 'binary'
+
+# mesh cache, section meshes of whole chunks saved to disk and keyed by a hash of the padded chunk voxels,
+# the least recently used chunks are evicted past MESH_CACHE_MAX_BYTES
+MESH_CACHE = True
+MESH_CACHE_DIR = 'mesh_cache'  # directory of the cache within the world save dir
+MESH_CACHE_MAX_BYTES = 256 * 2 ** 20
+MESH_CACHE_FLUSH_BYTES = 16 * 2 ** 20  # meshes built this run are appended to disk once they add up to this
+MESH_CACHE_VERSION = 1  # bumped with every change to the output of the mesh builders
+
+# compiled kernels, cached on disk in a directory keyed by a hash of the sources they are compiled from,
+# numba only checks the file a kernel is defined in while the settings and the noise are compiled in as constants
+JIT_CACHE = True
+JIT_SOURCES = ('settings.py', 'noise.py', 'terrain_gen.py', 'chunk_storage.py', 'meshes/chunk_mesh_builder.py')
+JIT_WARMUP = True  # entry kernels compiled or loaded from the cache on a thread while the window opens
+
+
+def get_jit_cache_dir():
+    # under NUMBA_CACHE_DIR when it is set
+    source_hash = hashlib.sha256()
+    for source in JIT_SOURCES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), source), 'rb') as file:
+            source_hash.update(file.read())
+    cache_dir = os.environ.get('NUMBA_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'saves', 'numba_cache')
+    return os.path.join(cache_dir, source_hash.hexdigest()[:16])
+
+
+JIT_CACHE_DIR = get_jit_cache_dir()
+numba.config.CACHE_DIR = JIT_CACHE_DIR
+
+
+def njit(*args, **kwargs):
+    # numba njit with the kernels cached in JIT_CACHE_DIR
+    kwargs.setdefault('cache', JIT_CACHE)
+    return numba.njit(*args, **kwargs)
+
+
+# span tracing, with VOXEL_TRACE set to a file path the spans of the startup phases and of every chunk are saved
+# there as chrome trace events on exit, for chrome://tracing or perfetto, and summed up on the console
+TRACE_PATH = os.environ.get('VOXEL_TRACE')
+
+# frame metrics, cpu time of the frame phases and render counters of the last FRAME_METRICS_WINDOW frames,
+# F3 shows the overlay, F4 exports the frames to FRAME_METRICS_DIR as csv and json
+FRAME_METRICS_WINDOW = 1024
+FRAME_METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'saves', 'metrics')
+FRAME_METRICS_OVERLAY = False
+OVERLAY_FONT_SIZE = 22
+OVERLAY_UPDATE_MS = 250  # the overlay text is redrawn at most this often
+
+# offscreen rendering into a framebuffer of a standalone gl context, no window needed, scripted camera paths
+# run at a fixed step, frames are drawn with the aspect ratio of WIN_RES whatever the resolution
+OFFSCREEN_RES = (800, 450)
+OFFSCREEN_BACKEND = 'egl'  # None for the default backend of the platform
+OFFSCREEN_DELTA_MS = 16
+OFFSCREEN_FRAMES = 120  # frames of the built in camera paths
+OFFSCREEN_DIFF_TOLERANCE = 8  # channel difference of a pixel from its reference frame
+OFFSCREEN_DIFF_MAX_PIXELS = 0.001  # share of differing pixels a frame may have
+
+# session recording, the input, delta time and voxel edits of every frame saved to SESSION_DIR and replayed by
+# session_replay.py, F5 starts and stops a recording, SESSION_RECORDING records from the start
+SESSION_RECORDING = False
+SESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'saves', 'sessions')
 
 # world
 WORLD_W, WORLD_H = 20, 3
 WORLD_D = WORLD_W
 WORLD_AREA = WORLD_W * WORLD_D
 WORLD_VOL = WORLD_AREA * WORLD_H
+WORLD_VOXEL_SIZE = np.array((WORLD_W, WORLD_H, WORLD_D)) * CHUNK_SIZE  # x, y, z
+
+# world streaming, only the chunk columns within STREAM_RADIUS columns of the player are meshed and their
+# neighbours generated, columns further than STREAM_UNLOAD_MARGIN beyond are evicted
+WORLD_STREAMING = False
+STREAM_RADIUS = 6
+STREAM_UNLOAD_MARGIN = 1
+
+# columns are generated and meshed on worker threads, nearest and visible first, whether streamed or not
+STREAM_GENERATE_COLUMNS = 8  # chunk columns generated per batch on the generator thread
+STREAM_MESH_JOBS = 2 * MESH_WORKERS  # columns meshed at once, few so new priorities are picked up soon
+STREAM_BUDGET_MS = 4.0  # per frame time uploading finished columns, at least one column per frame
 
 # world center
 CENTER_XZ = WORLD_W * H_CHUNK_SIZE
@@ -56,7 +154,27 @@ SNOW = 5
 LEAVES = 6
 WOOD = 7
 
-SEE_THROUGH_BLOCKS = (LEAVES,)
+# block properties
+BLOCK_SOLID = 1 << 0  # occupies its voxel and hides the faces behind it
+BLOCK_SEE_THROUGH = 1 << 1  # solid but faces behind it stay visible
+BLOCK_FLUID = 1 << 2
+BLOCK_LIGHT_EMITTING = 1 << 3
+BLOCK_COLLIDABLE = 1 << 4  # stops rays and mobiles
+
+BLOCK_REGISTRY = {
+    SAND: BLOCK_SOLID | BLOCK_COLLIDABLE,
+    GRASS: BLOCK_SOLID | BLOCK_COLLIDABLE,
+    DIRT: BLOCK_SOLID | BLOCK_COLLIDABLE,
+    STONE: BLOCK_SOLID | BLOCK_COLLIDABLE,
+    SNOW: BLOCK_SOLID | BLOCK_COLLIDABLE,
+    LEAVES: BLOCK_SOLID | BLOCK_SEE_THROUGH | BLOCK_COLLIDABLE,
+    WOOD: BLOCK_SOLID | BLOCK_COLLIDABLE,
+}
+
+# flags of every voxel_id, read by the hot loops, id 0 is air
+BLOCK_FLAGS = np.zeros(256, dtype='uint8')
+for _voxel_id, _flags in BLOCK_REGISTRY.items():
+    BLOCK_FLAGS[_voxel_id] = _flags
 
 # terrain levels
 SNOW_LVL = 54 + CHUNK_SIZE
@@ -65,6 +183,26 @@ DIRT_LVL = 40 + CHUNK_SIZE
 GRASS_LVL = 8 + CHUNK_SIZE
 SAND_LVL = 7 + CHUNK_SIZE
 
+# saved world, regions of REGION_SIZE x REGION_SIZE chunk columns, chunk payloads are zlib compressed
+# or left raw and memory mapped on load
+WORLD_SAVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'saves', f'world_{SEED}')
+REGION_SIZE = 4
+REGION_FORMAT_VERSION = 1
+REGION_COMPRESSED = True
+REGION_COMPRESSION_LEVEL = 1
+JOURNAL_COMPACT_RECORDS = 4096  # edits appended to the journal before it is compacted into the deltas
+
+# chunk columns generated per batch, bounds the dense scratch memory of world generation
+TERRAIN_BATCH_COLUMNS = 64
+# bumped whenever the generator makes other voxels, saved edits are deltas against the terrain of a version
+# and cave step, those of another terrain are dropped
+TERRAIN_VERSION = 1
+
+# caves
+# cave density sampled every n voxels and interpolated, 1 samples every voxel, other steps change the terrain
+CAVE_NOISE_STEP = 1
+CAVE_NOISE_MAX_ERROR = 0.025  # fraction of voxels a step of 4 may change, checked by bench.py caves and the tests
+
 # tree settings
 TREE_PROBABILITY = 0.02
 TREE_WIDTH, TREE_HEIGHT = 4, 8
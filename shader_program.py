@@ -2,6 +2,7 @@ from typing import Callable
 from moderngl import Program
 
 from settings import *
+from tracer import tracer
 
 
 class ShaderProgram:
@@ -14,6 +15,7 @@ class ShaderProgram:
         self.water = self.get_program(shader_name='water')
         self.bedrock = self.get_program(shader_name='bedrock')
         self.voxel_marker = self.get_program(shader_name='voxel_marker')
+        self.overlay = self.get_program(shader_name='overlay')
         self.meshes = {}
         # ----------------------- #
         self.set_uniforms_on_init()
@@ -41,6 +43,7 @@ class ShaderProgram:
         self.chunk['m_model'].write(glm.mat4())
         self.chunk['bg_color'].write(BG_COLOR)
         self.chunk['water_line'] = WATER_LINE
+        self.chunk['greedy_mesh'] = MESH_BUILDER == 'greedy'
         self.chunk['u_texture_array_0'] = 1
 
         # bedrock
@@ -58,6 +61,9 @@ class ShaderProgram:
         self.water['u_texture_2'] = 2
         self.water['bg_color'].write(BG_COLOR)
 
+        # metrics overlay
+        self.overlay['u_texture_3'] = 3
+
     def update(self):
         self.chunk['m_view'].write(self.camera.m_view)
         self.voxel_marker['m_view'].write(self.camera.m_view)
@@ -73,5 +79,6 @@ class ShaderProgram:
         with open(f'shaders/{shader_name}.frag') as file:
             fragment_shader = file.read()
 
-        program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        with tracer.span('compile shader', shader=shader_name):
+            program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
         return program
@@ -8,6 +8,7 @@ const vec3 inv_gamma = 1 / gamma;
 uniform sampler2DArray u_texture_array_0;
 uniform vec3 bg_color;
 uniform float water_line;
+uniform bool greedy_mesh;
 
 in vec3 voxel_color;
 in vec2 uv;
@@ -18,8 +19,8 @@ flat in int voxel_id;
 flat in int face_id;
 
 void main() {
-    vec2 face_uv = uv;
-    face_uv.x = uv.x / 3.0 - min(face_id, 2) / 3.0;
+    vec2 face_uv = greedy_mesh ? fract(uv) : uv;
+    face_uv.x = face_uv.x / 3.0 - min(face_id, 2) / 3.0;
 
     vec4 uv_texture = texture(u_texture_array_0, vec3(face_uv, voxel_id));
     vec3 tex_col = uv_texture.rgb;
@@ -9,6 +9,7 @@ int flip_id;
 uniform mat4 m_proj;
 uniform mat4 m_view;
 uniform mat4 m_model;
+uniform bool greedy_mesh;
 
 flat out int voxel_id;
 flat out int face_id;
@@ -65,6 +66,14 @@ void unpack(uint packed_data) {
     flip_id = int(packed_data & g_mask);
 }
 
+vec2 get_tiled_uv(vec3 position) {
+    // face aligned coords in voxel units, the texture repeats once per voxel across merged quads
+    float side = (face_id & 1) == 1 ? -1.0 : 1.0;
+    if (face_id < 2) return vec2(side * position.x, -position.z);  // top bottom
+    if (face_id < 4) return vec2(side * position.z, -position.y);  // right left
+    return vec2(side * position.x, -position.y);                   // front back
+}
+
 void main() {
     unpack(packed_data);
 
@@ -73,7 +82,7 @@ void main() {
 
     frag_world_pos = (m_model * vec4(in_position, 1.0)).xyz;
 
-    uv = uv_coords[uv_indices[uv_index]];
+    uv = greedy_mesh ? get_tiled_uv(in_position) : uv_coords[uv_indices[uv_index]];
     voxel_color = hash31(voxel_id);
     shading = face_shading[face_id] * ao_values[ao_id];
     gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
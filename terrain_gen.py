@@ -1,14 +1,48 @@
-from noise import noise2, noise3
-from random import random
+from numba import prange
+from noise import noise2_grid, noise3, noise3_block
 from settings import *
 
 
 @njit
-def get_height(x, z):
-    # island mask
-    island = 1 / (pow(0.0025 * math.hypot(x - CENTER_XZ, z - CENTER_XZ), 20) + 0.0001)
-    island = min(island, 1)
+def hash32(h):
+    # integer hash with good avalanche (lowbias32)
+    h &= 0xFFFFFFFF
+    h ^= h >> 16
+    h = (h * 0x7FEB352D) & 0xFFFFFFFF
+    h ^= h >> 15
+    h = (h * 0x846CA68B) & 0xFFFFFFFF
+    h ^= h >> 16
+    return h
 
+
+@njit
+def get_random(wx, wy, wz, salt):
+    # counter based random in [0, 1) from the seed and world coords,
+    # the same for a voxel on any thread and in any generation order
+    h = hash32(SEED ^ hash32(salt))
+    h = hash32(h ^ (wx & 0xFFFFFFFF))
+    h = hash32(h ^ (wy & 0xFFFFFFFF))
+    h = hash32(h ^ (wz & 0xFFFFFFFF))
+    return h / 4294967296.0
+
+
+# upper bound of the surface height before the island mask
+MAX_NOISE_HEIGHT = 2 * CENTER_Y * 1.1 * (1 + 0.5 + 0.25 + 0.125)
+
+
+@njit
+def get_island(xs, zs):
+    # island mask of the [x, z] grid
+    island = np.empty((len(xs), len(zs)))
+    for i in range(len(xs)):
+        for j in range(len(zs)):
+            island[i, j] = 1 / (pow(0.0025 * math.hypot(xs[i] - CENTER_XZ, zs[j] - CENTER_XZ), 20) + 0.0001)
+    return np.minimum(island, 1)
+
+
+@njit
+def get_heights(xs, zs, island, detail):
+    # surface heights of the [x, z] grid, every noise octave is evaluated as one grid
     # amplitude
     a1 = CENTER_Y * 1.1
     a2, a4, a8 = a1 * 0.5, a1 * 0.25, a1 * 0.125
@@ -17,19 +51,18 @@ def get_height(x, z):
     f1 = 0.005
     f2, f4, f8 = f1 * 2, f1 * 4, f1 * 8
 
-    if noise2(0.1 * x, 0.1 * z) < 0:
-        a1 /= 1.07
+    a1 = np.where(detail < 0, a1 / 1.07, a1)
 
-    height = 0
-    height += noise2(x * f1, z * f1) * a1 + a1
-    height += noise2(x * f2, z * f2) * a2 - a2
-    height += noise2(x * f4, z * f4) * a4 + a4
-    height += noise2(x * f8, z * f8) * a8 - a8
+    height = np.zeros((len(xs), len(zs)))
+    height += noise2_grid(xs * f1, zs * f1) * a1 + a1
+    height += noise2_grid(xs * f2, zs * f2) * a2 - a2
+    height += noise2_grid(xs * f4, zs * f4) * a4 + a4
+    height += noise2_grid(xs * f8, zs * f8) * a8 - a8
 
-    height = max(height, 1)
+    height = np.maximum(height, 1)
     height *= island
 
-    return int(height)
+    return height.astype(np.int64)
 
 
 @njit
@@ -38,17 +71,55 @@ def get_index(x, y, z):
 
 
 @njit
-def set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height):
+def get_cave_lattice(cx, cy, cz, cave_step):
+    # cave density at every cave_step voxels of the chunk, both faces included, [x, y, z],
+    # a step not dividing the chunk size gets a last point past the far face
+    if cave_step == 1:
+        return np.empty((0, 0, 0))
+    n = -(-CHUNK_SIZE // cave_step) + 1
+    xs = (cx + np.arange(n) * cave_step) * 0.09
+    ys = (cy + np.arange(n) * cave_step) * 0.09
+    zs = (cz + np.arange(n) * cave_step) * 0.09
+    return noise3_block(xs, ys, zs)
+
+
+@njit
+def interpolate_lattice(lattice, x, y, z, cave_step):
+    # trilinear interpolation at the local voxel position
+    i, j, k = x // cave_step, y // cave_step, z // cave_step
+    u, v, w = (x % cave_step) / cave_step, (y % cave_step) / cave_step, (z % cave_step) / cave_step
+
+    c00 = lattice[i, j, k] + (lattice[i + 1, j, k] - lattice[i, j, k]) * u
+    c01 = lattice[i, j, k + 1] + (lattice[i + 1, j, k + 1] - lattice[i, j, k + 1]) * u
+    c10 = lattice[i, j + 1, k] + (lattice[i + 1, j + 1, k] - lattice[i, j + 1, k]) * u
+    c11 = lattice[i, j + 1, k + 1] + (lattice[i + 1, j + 1, k + 1] - lattice[i, j + 1, k + 1]) * u
+
+    c0 = c00 + (c10 - c00) * v
+    c1 = c01 + (c11 - c01) * v
+    return c0 + (c1 - c0) * w
+
+
+@njit
+def is_cave(x, y, z, wx, wy, wz, world_height, cave_floor, cave_lattice, cave_step):
+    # bounds first, the density is the expensive part
+    if not cave_floor < wy < world_height - 10:
+        return False
+    if cave_step == 1:
+        return noise3(wx * 0.09, wy * 0.09, wz * 0.09) > 0
+    return interpolate_lattice(cave_lattice, x, y, z, cave_step) > 0
+
+
+@njit
+def set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height, cave_floor, cave_lattice, cave_step):
     voxel_id = 0
 
     if wy < world_height - 1:
-        if (noise3(wx * 0.09, wy * 0.09, wz * 0.09) > 0 and
-                noise2(wx * 0.1, wz * 0.1) * 3 + 3 < wy < world_height - 10):
+        if is_cave(x, y, z, wx, wy, wz, world_height, cave_floor, cave_lattice, cave_step):
             voxel_id = 0
         else:
             voxel_id = STONE
     else:
-        rng = int(7 * random())
+        rng = int(7 * get_random(wx, wy, wz, 0))
         ry = wy - rng
         if SNOW_LVL <= ry < world_height:
             voxel_id = SNOW
@@ -66,12 +137,12 @@ def set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height):
 
     # place tree
     if wy < DIRT_LVL:
-        place_tree(voxels, x, y, z, voxel_id)
+        place_tree(voxels, x, y, z, wx, wy, wz, voxel_id)
 
 
 @njit
-def place_tree(voxels, x, y, z, voxel_id):
-    rnd = random()
+def place_tree(voxels, x, y, z, wx, wy, wz, voxel_id):
+    rnd = get_random(wx, wy, wz, 1)
     if voxel_id != GRASS or rnd > TREE_PROBABILITY:
         return None
     if y + TREE_HEIGHT >= CHUNK_SIZE:
@@ -88,7 +159,7 @@ def place_tree(voxels, x, y, z, voxel_id):
     m = 0
     for n, iy in enumerate(range(TREE_H_HEIGHT, TREE_HEIGHT - 1)):
         k = iy % 2
-        rng = int(random() * 2)
+        rng = int(get_random(wx, wy + iy, wz, 2) * 2)
         for ix in range(-TREE_H_WIDTH + m, TREE_H_WIDTH - m * rng):
             for iz in range(-TREE_H_WIDTH + m * rng, TREE_H_WIDTH - m):
                 if (ix + iz) % 4:
@@ -101,3 +172,84 @@ def place_tree(voxels, x, y, z, voxel_id):
 
     # top
     voxels[get_index(x, y + TREE_HEIGHT - 2, z)] = LEAVES
+
+
+@njit
+def get_column_cache(cx, cz):
+    # heights and cave floors of the chunk column, [x, z], shared by every chunk of the vertical stack
+    xs = np.arange(cx, cx + CHUNK_SIZE)
+    zs = np.arange(cz, cz + CHUNK_SIZE)
+
+    # open sea, |noise| <= 1 so no column can rise above 0
+    island = get_island(xs, zs)
+    if island.max() * MAX_NOISE_HEIGHT < 1:
+        return np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.int64), np.zeros((CHUNK_SIZE, CHUNK_SIZE))
+
+    # shared by the height amplitude and the cave floors, caves are only carved above the floor
+    detail = noise2_grid(xs * 0.1, zs * 0.1)
+    return get_heights(xs, zs, island, detail), detail * 3 + 3
+
+
+@njit
+def generate_terrain(voxels, heights, cave_floors, cave_lattice, cave_step, cx, cy, cz):
+    for x in range(CHUNK_SIZE):
+        for z in range(CHUNK_SIZE):
+            wx = x + cx
+            wz = z + cz
+            world_height = heights[x, z]
+            local_height = min(world_height - cy, CHUNK_SIZE)
+
+            for y in range(local_height):
+                wy = y + cy
+                set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height, cave_floors[x, z], cave_lattice, cave_step)
+
+
+@njit
+def fill_solid(voxels, heights, cave_floors, cave_lattice, cave_step, cx, cy, cz):
+    # chunk below every surface, stone apart from the caves
+    voxels[:] = STONE
+    for x in range(CHUNK_SIZE):
+        for z in range(CHUNK_SIZE):
+            world_height = heights[x, z]
+            y0 = max(int(math.floor(cave_floors[x, z])) + 1 - cy, 0)
+            y1 = min(world_height - 10 - cy, CHUNK_SIZE)
+            for y in range(y0, y1):
+                if is_cave(x, y, z, x + cx, y + cy, z + cz, world_height, cave_floors[x, z], cave_lattice, cave_step):
+                    voxels[get_index(x, y, z)] = 0
+
+
+@njit(parallel=True, nogil=True)
+def generate_chunks(chunk_voxels, chunk_columns, cave_step=CAVE_NOISE_STEP):
+    # rows of chunk_columns are (x, z), chunk (x, y, z) of column i is generated straight into
+    # chunk_voxels[i * WORLD_H + y], one column per thread at a time, returns is_empty of the rows
+    is_empty = np.ones(len(chunk_columns) * WORLD_H, dtype=np.bool_)
+    for i in prange(len(chunk_columns)):
+        x, z = chunk_columns[i]
+        cx, cz = x * CHUNK_SIZE, z * CHUNK_SIZE
+        heights, cave_floors = get_column_cache(cx, cz)
+        min_height, max_height = heights.min(), heights.max()
+
+        for y in range(WORLD_H):
+            cy = y * CHUNK_SIZE
+            row = i * WORLD_H + y
+            voxels = chunk_voxels[row]
+
+            if cy >= max_height:
+                # above every surface
+                voxels[:] = 0
+                continue
+
+            # caves end 10 voxels under the surface
+            if cy < max_height - 10:
+                cave_lattice = get_cave_lattice(cx, cy, cz, cave_step)
+            else:
+                cave_lattice = np.empty((0, 0, 0))
+
+            if cy + CHUNK_SIZE < min_height:
+                fill_solid(voxels, heights, cave_floors, cave_lattice, cave_step, cx, cy, cz)
+                is_empty[row] = not voxels.any()
+            else:
+                voxels[:] = 0
+                generate_terrain(voxels, heights, cave_floors, cave_lattice, cave_step, cx, cy, cz)
+                is_empty[row] = not voxels.any()
+    return is_empty
@@ -0,0 +1,255 @@
+from collections import Counter
+
+import pytest
+from numba import parallel_chunksize
+
+from settings import *
+from terrain_gen import generate_chunks
+from chunk_storage import ChunkStorage
+from meshes.chunk_mesh import get_section_positions
+from meshes.chunk_mesh_builder import (
+    MESH_BUILDERS, get_vertex_scratch, get_face_neighbour, get_face_plane, add_face
+)
+
+CENTER = WORLD_W // 2
+# the center column of the world and a chunk on its edge, where lookups leave the world
+GENERATED_POSITIONS = [(CENTER, y, CENTER) for y in range(WORLD_H)] + [(0, 1, 0)]
+
+
+@pytest.fixture(scope='module')
+def world():
+    # dense voxels of the generated chunks and their neighbours by chunk index, the rest of the world empty,
+    # and the same chunks in a storage
+    chunk_columns = np.array(sorted({(x + dx, z + dz) for x, _, z in GENERATED_POSITIONS
+                                     for dx in range(-1, 2) for dz in range(-1, 2)
+                                     if 0 <= x + dx < WORLD_W and 0 <= z + dz < WORLD_D}), dtype='int64')
+    chunk_voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+    with parallel_chunksize(1):
+        generate_chunks(chunk_voxels, chunk_columns)
+
+    world_voxels = np.zeros([WORLD_VOL, CHUNK_VOL], dtype='uint8')
+    storage = ChunkStorage()
+    for i, (x, z) in enumerate(chunk_columns):
+        for y in range(WORLD_H):
+            chunk_index = x + WORLD_W * z + WORLD_AREA * y
+            world_voxels[chunk_index] = chunk_voxels[i * WORLD_H + y]
+            storage.set_voxels(chunk_index, chunk_voxels[i * WORLD_H + y])
+    return world_voxels, storage
+
+
+@njit
+def get_world_voxel_id(world_voxels, wx, wy, wz):
+    # the world lookup the mesher made before padded voxels, -1 outside the world
+    cx, cy, cz = wx // CHUNK_SIZE, wy // CHUNK_SIZE, wz // CHUNK_SIZE
+    if not (0 <= cx < WORLD_W and 0 <= cy < WORLD_H and 0 <= cz < WORLD_D):
+        return -1
+    voxel_index = wx % CHUNK_SIZE + wz % CHUNK_SIZE * CHUNK_SIZE + wy % CHUNK_SIZE * CHUNK_AREA
+    return world_voxels[cx + WORLD_W * cz + WORLD_AREA * cy, voxel_index]
+
+
+@njit
+def is_void(world_voxels, wx, wy, wz):
+    return get_world_voxel_id(world_voxels, wx, wy, wz) < 1
+
+
+@njit
+def get_world_ao(world_voxels, x, y, z, plane):
+    v = world_voxels
+    if plane == 0:  # Y plane
+        a = is_void(v, x    , y, z - 1)
+        b = is_void(v, x - 1, y, z - 1)
+        c = is_void(v, x - 1, y, z    )
+        d = is_void(v, x - 1, y, z + 1)
+        e = is_void(v, x    , y, z + 1)
+        f = is_void(v, x + 1, y, z + 1)
+        g = is_void(v, x + 1, y, z    )
+        h = is_void(v, x + 1, y, z - 1)
+    elif plane == 1:  # X plane
+        a = is_void(v, x, y    , z - 1)
+        b = is_void(v, x, y - 1, z - 1)
+        c = is_void(v, x, y - 1, z    )
+        d = is_void(v, x, y - 1, z + 1)
+        e = is_void(v, x, y    , z + 1)
+        f = is_void(v, x, y + 1, z + 1)
+        g = is_void(v, x, y + 1, z    )
+        h = is_void(v, x, y + 1, z - 1)
+    else:  # Z plane
+        a = is_void(v, x - 1, y    , z)
+        b = is_void(v, x - 1, y - 1, z)
+        c = is_void(v, x    , y - 1, z)
+        d = is_void(v, x + 1, y - 1, z)
+        e = is_void(v, x + 1, y    , z)
+        f = is_void(v, x + 1, y + 1, z)
+        g = is_void(v, x    , y + 1, z)
+        h = is_void(v, x - 1, y + 1, z)
+    return (a + b + c), (g + h + a), (e + f + g), (c + d + e)
+
+
+@njit
+def build_chunk_mesh_world(world_voxels, chunk_pos, block_flags):
+    # the whole chunk meshed through world lookups, faces and ao as build_chunk_mesh
+    vertex_data = np.empty((2, CHUNK_VOL * 36), dtype='uint32')
+    solid_index, see_through_index = 0, 0
+    cx, cy, cz = chunk_pos
+    for x in range(CHUNK_SIZE):
+        for y in range(CHUNK_SIZE):
+            for z in range(CHUNK_SIZE):
+                wx, wy, wz = x + cx * CHUNK_SIZE, y + cy * CHUNK_SIZE, z + cz * CHUNK_SIZE
+                voxel_id = get_world_voxel_id(world_voxels, wx, wy, wz)
+                if voxel_id < 1:
+                    continue
+                row = 1 if block_flags[voxel_id] & BLOCK_SEE_THROUGH else 0
+                index = see_through_index if row else solid_index
+                for face_id in range(6):
+                    nx, ny, nz = get_face_neighbour(face_id, wx, wy, wz)
+                    neigh_id = get_world_voxel_id(world_voxels, nx, ny, nz)
+                    if neigh_id < 1 or block_flags[neigh_id] & BLOCK_SEE_THROUGH:
+                        ao = get_world_ao(world_voxels, nx, ny, nz, get_face_plane(face_id))
+                        flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+                        index = add_face(vertex_data[row], index, face_id, x, y, z, 1, 1, voxel_id, ao, flip_id)
+                if row:
+                    see_through_index = index
+                else:
+                    solid_index = index
+    return vertex_data[0, :solid_index].copy(), vertex_data[1, :see_through_index].copy()
+
+
+def build_chunk(builder, padded_voxels):
+    # solid and see through vertices of every section of the chunk, in section order
+    sections = [builder(padded_voxels=padded_voxels, format_size=1, section_pos=section_pos,
+                        block_flags=BLOCK_FLAGS, vertex_scratch=get_vertex_scratch(1))
+                for section_pos in get_section_positions()]
+    return [np.concatenate([section[row] for section in sections]) for row in range(2)]
+
+
+@pytest.mark.parametrize('position', GENERATED_POSITIONS)
+def test_padded_voxels_mesh_as_world_lookups(world, position):
+    # the padded neighbourhood gives the vertices the world lookups gave, the order aside
+    world_voxels, storage = world
+    padded = build_chunk(MESH_BUILDERS['faces'], storage.get_padded_voxels(position))
+    reference = build_chunk_mesh_world(world_voxels, position, BLOCK_FLAGS)
+    for vertex_data, reference_data in zip(padded, reference):
+        assert np.array_equal(np.sort(vertex_data), np.sort(reference_data))
+
+
+def get_column_case():
+    # full columns of the chunk height along y and along z through the border, the first and last column bits
+    padded_voxels = np.zeros((PADDED_CHUNK_SIZE,) * 3, dtype='uint8')
+    padded_voxels[1:-1, 30, 30] = STONE
+    padded_voxels[30, :, 10] = DIRT
+    return padded_voxels
+
+
+def get_leaves_case():
+    # leaves on every face of the chunk and in the border around it, stone inside
+    padded_voxels = np.zeros((PADDED_CHUNK_SIZE,) * 3, dtype='uint8')
+    padded_voxels[:, :, :2] = LEAVES
+    padded_voxels[:, :, -2:] = LEAVES
+    padded_voxels[:, :2, :] = LEAVES
+    padded_voxels[:, -2:, :] = LEAVES
+    padded_voxels[:2] = LEAVES
+    padded_voxels[-2:] = LEAVES
+    padded_voxels[2:-2, 2:-2, 2:-2] = STONE
+    padded_voxels[20:40, 2:-2, 20:40] = 0
+    return padded_voxels
+
+
+def get_slab_case():
+    # a flat floor, greedy meshing merges its top into a quad per section
+    padded_voxels = np.zeros((PADDED_CHUNK_SIZE,) * 3, dtype='uint8')
+    padded_voxels[:10] = STONE
+    return padded_voxels
+
+
+HAND_BUILT_CASES = {
+    'empty': lambda: np.zeros((PADDED_CHUNK_SIZE,) * 3, dtype='uint8'),
+    'slab': get_slab_case,
+    'column': get_column_case,
+    'leaves': get_leaves_case,
+}
+
+
+def assert_builders_match(padded_voxels):
+    faces = build_chunk(MESH_BUILDERS['faces'], padded_voxels)
+    binary = build_chunk(MESH_BUILDERS['binary'], padded_voxels)
+    for vertex_data, faces_data in zip(binary, faces):
+        assert np.array_equal(vertex_data, faces_data)
+
+
+@pytest.mark.parametrize('position', GENERATED_POSITIONS)
+def test_binary_builder_matches_faces_on_terrain(world, position):
+    # the same vertices in the same order, not only the same faces
+    _, storage = world
+    assert_builders_match(storage.get_padded_voxels(position))
+
+
+@pytest.mark.parametrize('case', HAND_BUILT_CASES)
+def test_binary_builder_matches_faces_on_edge_cases(case):
+    assert_builders_match(HAND_BUILT_CASES[case]())
+
+
+def get_quads(vertex_data):
+    # face_id, voxel_id and the corners of every quad, x, y, z as rows, from the packed vertices
+    data = vertex_data.astype('int64').reshape(-1, 6)
+    corners = np.stack([data >> 26, (data >> 20) & 63, (data >> 14) & 63], axis=1)
+    return (data[:, 0] >> 3) & 7, (data[:, 0] >> 6) & 255, corners
+
+
+def get_plane_axes(face_id):
+    # x, y, z indices of the axes a face spans, as get_plane_voxel
+    if face_id < 2:
+        return 0, 2
+    if face_id < 4:
+        return 1, 2
+    return 1, 0
+
+
+def get_unit_faces(vertex_data):
+    # the unit voxel faces the quads cover, counted so overlapping quads show
+    unit_faces = Counter()
+    for face_id, voxel_id, corners in zip(*get_quads(vertex_data)):
+        low, high = corners.min(axis=1), corners.max(axis=1)
+        p, q = get_plane_axes(face_id)
+        for i in range(low[p], high[p]):
+            for j in range(low[q], high[q]):
+                position = low.copy()
+                position[p], position[q] = i, j
+                unit_faces[(int(face_id), int(voxel_id), *map(int, position))] += 1
+    return unit_faces
+
+
+def get_tiled_uv(face_id, position):
+    # get_tiled_uv of shaders/chunk.vert
+    x, y, z = position
+    side = -1 if face_id & 1 else 1
+    if face_id < 2:
+        return side * x, -z
+    if face_id < 4:
+        return side * z, -y
+    return side * x, -y
+
+
+def get_padded_cases(world):
+    _, storage = world
+    return ([storage.get_padded_voxels(position) for position in GENERATED_POSITIONS] +
+            [get_case() for get_case in HAND_BUILT_CASES.values()])
+
+
+def test_greedy_builder_covers_the_faces(world):
+    # merged quads cover every visible face once with its voxel_id, and nothing else
+    for padded_voxels in get_padded_cases(world):
+        faces = build_chunk(MESH_BUILDERS['faces'], padded_voxels)
+        greedy = build_chunk(MESH_BUILDERS['greedy'], padded_voxels)
+        for vertex_data, faces_data in zip(greedy, faces):
+            assert get_unit_faces(vertex_data) == get_unit_faces(faces_data)
+
+
+def test_greedy_quads_tile_the_texture_once_per_voxel(world):
+    # the tiled uv of a quad spans its size in voxels along both of its axes
+    for padded_voxels in get_padded_cases(world):
+        for vertex_data in build_chunk(MESH_BUILDERS['greedy'], padded_voxels):
+            for face_id, _, corners in zip(*get_quads(vertex_data)):
+                uv = np.array([get_tiled_uv(face_id, position) for position in corners.T])
+                p, q = get_plane_axes(face_id)
+                size = np.ptp(corners, axis=1)
+                assert sorted(np.ptp(uv, axis=0)) == sorted((size[p], size[q]))
@@ -0,0 +1,43 @@
+import pytest
+from numba import parallel_chunksize
+
+from settings import *
+from noise import noise3
+from terrain_gen import generate_chunks, get_cave_lattice, interpolate_lattice
+
+
+@pytest.mark.parametrize('cave_step', [2, 4, 7, 8, 16, 59, CHUNK_SIZE])
+def test_cave_lattice_covers_the_chunk(cave_step):
+    # the cell of the last voxel needs the lattice point after it, steps not dividing the chunk size included
+    lattice = get_cave_lattice(0, 0, 0, cave_step)
+    last = (CHUNK_SIZE - 1) // cave_step + 1
+    assert lattice.shape == (last + 1,) * 3
+
+
+@pytest.mark.parametrize('cave_step', [4, 7, 8])
+def test_cave_lattice_interpolates_the_exact_density(cave_step):
+    # the interpolation passes through the density at the lattice points
+    cx, cy, cz = CHUNK_SIZE, 0, 2 * CHUNK_SIZE
+    lattice = get_cave_lattice(cx, cy, cz, cave_step)
+    points = range(0, CHUNK_SIZE, cave_step)
+    for x in points:
+        for y in points:
+            for z in points:
+                exact = noise3((cx + x) * 0.09, (cy + y) * 0.09, (cz + z) * 0.09)
+                assert interpolate_lattice(lattice, x, y, z, cave_step) == pytest.approx(exact, abs=1e-6)
+
+
+def generate_columns(chunk_columns, cave_step):
+    voxels = np.empty([len(chunk_columns) * WORLD_H, CHUNK_VOL], dtype='uint8')
+    with parallel_chunksize(1):
+        generate_chunks(voxels, chunk_columns, cave_step)
+    return voxels
+
+
+def test_interpolated_caves_stay_within_the_error_bound():
+    # the bound holds for a step of 4
+    center = WORLD_W // 2
+    chunk_columns = np.array([(center + dx, center + dz) for dx in range(2) for dz in range(2)], dtype='int64')
+    exact = generate_columns(chunk_columns, 1)
+    interpolated = generate_columns(chunk_columns, 4)
+    assert np.count_nonzero(exact != interpolated) / exact.size <= CAVE_NOISE_MAX_ERROR
@@ -0,0 +1,104 @@
+import atexit
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+from settings import *
+
+# returned by every span of a disabled tracer, entering and leaving it does nothing
+NULL_SPAN = nullcontext()
+
+
+class Span:
+    """Times the code run within it on the calling thread"""
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.add(self.name, self.category, self.start, time.perf_counter(), self.args)
+
+
+class Tracer:
+    """Spans and instants of every thread saved as chrome trace events, disabled without a path"""
+    def __init__(self, path=TRACE_PATH):
+        self.path = path
+        self.enabled = path is not None
+        self.start_time = time.perf_counter()
+        # (name, category, start, end, thread id, args), end is None for instants,
+        # appended from any thread as list appends hold the gil
+        self.events = []
+        self.thread_names: dict[int, str] = {}
+
+        if self.enabled:
+            atexit.register(self.save)
+
+    def span(self, name, category='startup', **args):
+        # with tracer.span('name'): ..., costs a call and an attribute check when disabled
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+
+    def instant(self, name, category='startup', **args):
+        if self.enabled:
+            now = time.perf_counter()
+            self.add(name, category, now, None, args)
+
+    def add(self, name, category, start, end, args):
+        thread = threading.current_thread()
+        thread_id = threading.get_native_id()
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = thread.name
+        self.events.append((name, category, start, end, thread_id, args))
+
+    def get_trace_events(self):
+        pid = os.getpid()
+        trace_events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': thread_name}}
+            for thread_id, thread_name in self.thread_names.items()
+        ]
+        for name, category, start, end, thread_id, args in list(self.events):
+            event = {'name': name, 'cat': category, 'pid': pid, 'tid': thread_id,
+                     'ts': (start - self.start_time) * 1e6, 'args': args}
+            if end is None:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=(end - start) * 1e6)
+            trace_events.append(event)
+        return trace_events
+
+    def get_summary(self):
+        # {name: (count, total seconds, max seconds)} of the spans, by total time
+        summary = {}
+        for name, _, start, end, _, _ in list(self.events):
+            if end is None:
+                continue
+            count, total, longest = summary.get(name, (0, 0.0, 0.0))
+            summary[name] = count + 1, total + end - start, max(longest, end - start)
+        return dict(sorted(summary.items(), key=lambda item: item[1][1], reverse=True))
+
+    def save(self):
+        if not self.enabled or not self.events:
+            return
+        with open(self.path, 'w') as file:
+            json.dump({'traceEvents': self.get_trace_events(), 'displayTimeUnit': 'ms'}, file)
+
+        print(f'trace of {len(self.events)} events saved to {self.path}')
+        print(f'{"span":>28} {"count":>7} {"total ms":>10} {"mean ms":>9} {"max ms":>9}')
+        for name, (count, total, longest) in self.get_summary().items():
+            print(f'{name:>28} {count:7} {total * 1000:10.1f} {total / count * 1000:9.2f} {longest * 1000:9.2f}')
+        self.events.clear()
+
+
+# the tracer of the process, shared by every thread
+tracer = Tracer()
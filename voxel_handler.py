@@ -1,10 +1,11 @@
 from settings import *
-from meshes.chunk_mesh_builder import get_chunk_index
+from meshes.chunk_mesh_builder import get_section_index
 
 
 class VoxelHandler:
     def __init__(self, world):
         self.app = world.app
+        self.world = world
         self.chunks = world.chunks
 
         # ray casting result
@@ -21,48 +22,121 @@ class VoxelHandler:
     def add_voxel(self):
         if self.voxel_id:
             # check voxel id along normal
-            result = self.get_voxel_id(self.voxel_world_pos + self.voxel_normal)
-
-            # is the new place empty?
-            if not result[0]:
-                _, voxel_index, _, chunk = result
-                chunk.voxels[voxel_index] = self.new_voxel_id
-                chunk.mesh.rebuild()
-
-                # in case chunk was empty
-                if chunk.is_empty:
-                    chunk.is_empty = False
-
-    def rebuild_adj_chunk(self, adj_voxel_pos):
-        index = get_chunk_index(adj_voxel_pos)
-        if index != -1:
-            self.chunks[index].mesh.rebuild()
-
-    def rebuild_adjacent_chunks(self):
-        lx, ly, lz = self.voxel_local_pos
-        wx, wy, wz = self.voxel_world_pos
-
-        if lx == 0:
-            self.rebuild_adj_chunk((wx - 1, wy, wz))
-        elif lx == CHUNK_SIZE - 1:
-            self.rebuild_adj_chunk((wx + 1, wy, wz))
-
-        if ly == 0:
-            self.rebuild_adj_chunk((wx, wy - 1, wz))
-        elif ly == CHUNK_SIZE - 1:
-            self.rebuild_adj_chunk((wx, wy + 1, wz))
-
-        if lz == 0:
-            self.rebuild_adj_chunk((wx, wy, wz - 1))
-        elif lz == CHUNK_SIZE - 1:
-            self.rebuild_adj_chunk((wx, wy, wz + 1))
+            voxel_world_pos = self.voxel_world_pos + self.voxel_normal
+            result = self.get_voxel_id(voxel_world_pos)
+
+            old_voxel_id, voxel_index, _, chunk = result
+            if not chunk:
+                # outside the world or in a chunk streamed out
+                return
+
+            # is the new place free?
+            if not BLOCK_FLAGS[old_voxel_id] & BLOCK_COLLIDABLE:
+                with self.world.storage.edit(chunk.index) as voxels:
+                    voxels[voxel_index] = self.new_voxel_id
+                self.world.journal.record(*voxel_world_pos, [old_voxel_id], [self.new_voxel_id])
+
+                self.rebuild_sections(voxel_world_pos)
+
+    @staticmethod
+    def get_touched_sections(min_voxel_pos, max_voxel_pos=None):
+        # a voxel takes part in the faces and ao of every voxel around it, returns
+        # {chunk index: section indices} of the sections holding the voxels of the box grown by one
+        if max_voxel_pos is None:
+            max_voxel_pos = min_voxel_pos
+        lo = np.maximum(np.array(min_voxel_pos) - 1, 0) // SECTION_SIZE
+        hi = np.minimum(np.array(max_voxel_pos) + 1, WORLD_VOXEL_SIZE - 1) // SECTION_SIZE
+
+        touched = {}
+        for sx in range(lo[0], hi[0] + 1):
+            for sy in range(lo[1], hi[1] + 1):
+                for sz in range(lo[2], hi[2] + 1):
+                    cx, cy, cz = sx // SECTIONS_PER_AXIS, sy // SECTIONS_PER_AXIS, sz // SECTIONS_PER_AXIS
+                    chunk_index = cx + WORLD_W * cz + WORLD_AREA * cy
+                    local_pos = [(s % SECTIONS_PER_AXIS) * SECTION_SIZE for s in (sx, sy, sz)]
+                    touched.setdefault(chunk_index, set()).add(get_section_index(local_pos))
+        return touched
+
+    def rebuild_sections(self, min_voxel_pos, max_voxel_pos=None):
+        for chunk_index, section_indices in self.get_touched_sections(min_voxel_pos, max_voxel_pos).items():
+            # chunks not meshed yet by the streamer are meshed from their current voxels later
+            chunk = self.chunks.get(chunk_index)
+            if chunk is not None and chunk.mesh is not None:
+                self.world.remesh_scheduler.mark_dirty(chunk_index, section_indices)
+
+    def fill_mask(self, origin, mask, voxel_id):
+        # sets the voxels where the boolean mask, indexed as [x, y, z] from the world position origin, is set,
+        # voxel_id 0 clears them, returns the number of changed voxels
+        mask = np.asarray(mask, dtype=bool)
+        origin = np.array(origin, dtype=int)
+        lo = np.maximum(origin, 0)
+        hi = np.minimum(origin + mask.shape, WORLD_VOXEL_SIZE)
+        if np.any(hi <= lo):
+            return 0
+
+        changed = 0
+        changed_lo, changed_hi = hi, lo
+        chunk_lo, chunk_hi = lo // CHUNK_SIZE, (hi - 1) // CHUNK_SIZE
+        for cx in range(chunk_lo[0], chunk_hi[0] + 1):
+            for cy in range(chunk_lo[1], chunk_hi[1] + 1):
+                for cz in range(chunk_lo[2], chunk_hi[2] + 1):
+                    chunk = self.chunks.get(cx + WORLD_W * cz + WORLD_AREA * cy)
+                    if chunk is None:
+                        # not generated, edits need the voxels they replace
+                        continue
+                    chunk_origin = np.array((cx, cy, cz)) * CHUNK_SIZE
+
+                    # overlap of the mask and the chunk in world coords
+                    o0 = np.maximum(lo, chunk_origin)
+                    o1 = np.minimum(hi, chunk_origin + CHUNK_SIZE)
+                    (mx0, my0, mz0), (mx1, my1, mz1) = o0 - origin, o1 - origin
+                    (lx0, ly0, lz0), (lx1, ly1, lz1) = o0 - chunk_origin, o1 - chunk_origin
+
+                    # chunk voxels are laid out as [y, z, x]
+                    chunk_mask = mask[mx0:mx1, my0:my1, mz0:mz1].transpose(1, 2, 0)
+                    voxels = self.world.storage.read_box(chunk.index, ly0, ly1, lz0, lz1, lx0, lx1)
+                    chunk_mask = chunk_mask & (voxels != voxel_id)
+                    count = np.count_nonzero(chunk_mask)
+                    if not count:
+                        continue
+
+                    with self.world.storage.edit(chunk.index) as chunk_voxels:
+                        box = chunk_voxels.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[ly0:ly1, lz0:lz1, lx0:lx1]
+                        old_ids = box[chunk_mask]
+                        box[chunk_mask] = voxel_id
+
+                    ys, zs, xs = np.nonzero(chunk_mask)
+                    self.world.journal.record(xs + o0[0], ys + o0[1], zs + o0[2], old_ids, voxel_id)
+
+                    changed += count
+                    changed_lo, changed_hi = np.minimum(changed_lo, o0), np.maximum(changed_hi, o1)
+
+        # each touched section is remeshed once
+        if changed:
+            self.rebuild_sections(changed_lo, changed_hi - 1)
+        return changed
+
+    def fill_box(self, min_voxel_pos, max_voxel_pos, voxel_id):
+        # corners are included
+        size = np.array(max_voxel_pos, dtype=int) - np.array(min_voxel_pos, dtype=int) + 1
+        if np.any(size < 1):
+            return 0
+        return self.fill_mask(min_voxel_pos, np.ones(size, dtype=bool), voxel_id)
+
+    def fill_sphere(self, center, radius, voxel_id):
+        # voxels with their position within radius of the center
+        r = int(radius)
+        dx, dy, dz = np.ogrid[-r:r + 1, -r:r + 1, -r:r + 1]
+        mask = dx * dx + dy * dy + dz * dz <= radius * radius
+        return self.fill_mask(np.array(center, dtype=int) - r, mask, voxel_id)
 
     def remove_voxel(self):
-        if self.voxel_id:
-            self.chunk.voxels[self.voxel_index] = 0
+        if self.voxel_id and self.chunk:
+            with self.world.storage.edit(self.chunk.index) as voxels:
+                voxels[self.voxel_index] = 0
+            self.world.journal.record(*self.voxel_world_pos, [self.voxel_id], [0])
 
-            self.chunk.mesh.rebuild()
-            self.rebuild_adjacent_chunks()
+            self.rebuild_sections(self.voxel_world_pos)
 
     def set_voxel(self):
         if self.interaction_mode:
@@ -102,7 +176,7 @@ class VoxelHandler:
         while not (max_x > 1.0 and max_y > 1.0 and max_z > 1.0):
 
             result = self.get_voxel_id(voxel_world_pos=current_voxel_pos)
-            if result[0]:
+            if BLOCK_FLAGS[result[0]] & BLOCK_COLLIDABLE:
                 self.voxel_id, self.voxel_index, self.voxel_local_pos, self.chunk = result
                 self.voxel_world_pos = current_voxel_pos
 
@@ -139,12 +213,14 @@ class VoxelHandler:
 
         if 0 <= cx < WORLD_W and 0 <= cy < WORLD_H and 0 <= cz < WORLD_D:
             chunk_index = cx + WORLD_W * cz + WORLD_AREA * cy
-            chunk = self.chunks[chunk_index]
+            chunk = self.chunks.get(chunk_index)
+            if chunk is None:
+                return 0, 0, 0, 0
 
             lx, ly, lz = voxel_local_pos = voxel_world_pos - chunk_pos * CHUNK_SIZE
 
             voxel_index = lx + CHUNK_SIZE * lz + CHUNK_AREA * ly
-            voxel_id = chunk.voxels[voxel_index]
+            voxel_id = self.world.storage.get_voxel(chunk_index, voxel_index)
 
             return voxel_id, voxel_index, voxel_local_pos, chunk
         return 0, 0, 0, 0
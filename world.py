@@ -1,43 +1,104 @@
+from numba import parallel_chunksize
 from settings import *
 from world_objects.chunk import Chunk
 from voxel_handler import VoxelHandler
+from remesh_scheduler import RemeshScheduler
+from chunk_storage import ChunkStorage
+from region_store import RegionStore
+from edit_journal import EditJournal
+from chunk_streamer import ChunkStreamer
+from mesh_cache import MeshCache
+from terrain_gen import generate_chunks
+from tracer import tracer
 
 
 class World:
-    def __init__(self, app):
+    def __init__(self, app, save_dir=WORLD_SAVE_DIR, mesh_cache_dir=MESH_CACHE_DIR):
         self.app = app
-        self.chunks: list[Chunk | None] = [None for _ in range(WORLD_VOL)]
-        self.voxels = np.empty([WORLD_VOL, CHUNK_VOL], dtype='uint8')
-        self.build_chunks()
-        self.build_chunk_mesh()
+        # {chunk index: chunk} of the generated chunks, every chunk of the world unless it is streamed
+        self.chunks: dict[int, Chunk] = {}
+        self.storage = ChunkStorage()
+        self.store = RegionStore(save_dir)
+        self.journal = EditJournal(save_dir)
+        # kept with the world it caches the meshes of, None turns it off
+        self.mesh_cache = MeshCache(os.path.join(save_dir, mesh_cache_dir)) if MESH_CACHE and mesh_cache_dir else None
+        self.remesh_scheduler = RemeshScheduler(self)
         self.voxel_handler = VoxelHandler(self)
 
-    def build_chunks(self):
-        for x in range(WORLD_W):
-            for y in range(WORLD_H):
-                for z in range(WORLD_D):
-                    chunk = Chunk(self, position=(x, y, z))
+        # chunks in the view frustum with something to draw, culled once per frame
+        self.visible_chunks: list[Chunk] = []
+        self.culled_chunks = 0
 
-                    chunk_index = x + WORLD_W * z + WORLD_AREA * y
-                    self.chunks[chunk_index] = chunk
+        # chunks are generated and meshed in the background and drawn as they arrive
+        self.streamer = ChunkStreamer(self, STREAM_RADIUS if WORLD_STREAMING else None)
+        self.load()
 
-                    # put the chunk voxels in a separate array
-                    self.voxels[chunk_index] = chunk.build_voxels()
+    def load(self):
+        # saved chunks are loaded, columns saved in full are not generated again,
+        # a streamed world only keeps the chunks around the player so its edits are in the journal alone
+        if not WORLD_STREAMING:
+            with tracer.span('load regions'):
+                self.streamer.loaded = self.store.load(self.storage)
+        with tracer.span('load journal'):
+            self.journal.load_deltas()
+            self.streamer.add_columns([
+                (x, z) for x in range(WORLD_W) for z in range(WORLD_D)
+                if all(x + WORLD_W * z + WORLD_AREA * y in self.streamer.loaded for y in range(WORLD_H))
+            ])
 
-                    # get pointer to voxels
-                    chunk.voxels = self.voxels[chunk_index]
+    def build(self):
+        # every column not loaded nor generated yet is generated now and its chunks added without meshes,
+        # builds the voxels of the whole world without a frame loop
+        columns = [(x, z) for x in range(WORLD_W) for z in range(WORLD_D) if (x, z) not in self.streamer.generated]
+        if columns:
+            self.generate_columns(np.array(columns, dtype='int64'), self.streamer.loaded)
+            self.streamer.add_columns(columns)
 
-    def build_chunk_mesh(self):
-        for chunk in self.chunks:
-            chunk.build_mesh()
+    def generate_columns(self, chunk_columns, loaded=()):
+        # batches of chunk columns are generated in parallel into a dense scratch, then encoded into the storage
+        chunk_voxels = np.empty([min(len(chunk_columns), TERRAIN_BATCH_COLUMNS) * WORLD_H, CHUNK_VOL], dtype='uint8')
+        for start in range(0, len(chunk_columns), TERRAIN_BATCH_COLUMNS):
+            batch = chunk_columns[start:start + TERRAIN_BATCH_COLUMNS]
+            with tracer.span('generate columns', 'chunk', columns=len(batch)), parallel_chunksize(1):
+                is_empty = generate_chunks(chunk_voxels, batch)
+
+            for i, (x, z) in enumerate(batch):
+                for y in range(WORLD_H):
+                    row, chunk_index = i * WORLD_H + y, x + WORLD_W * z + WORLD_AREA * y
+                    if chunk_index not in loaded and not is_empty[row]:
+                        with tracer.span('encode chunk', 'chunk', position=(int(x), y, int(z))):
+                            self.storage.set_voxels(chunk_index, chunk_voxels[row])
+
+    def save(self):
+        self.journal.close()
+        if self.mesh_cache is not None:
+            self.mesh_cache.save()
+        if WORLD_STREAMING:
+            # only the chunks around the player are in the storage, the journal holds the edits of a streamed world
+            return 0
+        # chunks not generated yet when the game is closed during loading are left out
+        streamer = self.streamer
+        return self.store.save(self.storage, set(streamer.get_chunk_indices(streamer.generated)) | streamer.loaded)
+
+    def shutdown(self):
+        self.streamer.shutdown()
+        self.remesh_scheduler.shutdown()
 
     def update(self):
-        self.voxel_handler.update()
+        self.streamer.update()
+        with self.app.frame_metrics.phase('raycast'):
+            self.voxel_handler.update()
+        self.remesh_scheduler.update()
+
+    def cull(self):
+        drawn = [chunk for chunk in self.chunks.values() if chunk.is_drawn]
+        self.visible_chunks = [chunk for chunk in drawn if chunk.is_on_frustum(chunk)]
+        self.culled_chunks = len(drawn) - len(self.visible_chunks)
 
     def render(self):
-        for chunk in self.chunks:
+        for chunk in self.visible_chunks:
             chunk.render()
 
     def render_see_through(self):
-        for chunk in self.chunks:
+        for chunk in self.visible_chunks:
             chunk.render_see_through()
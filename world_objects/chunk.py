@@ -1,6 +1,5 @@
 from settings import *
 from meshes.chunk_mesh import ChunkMesh
-from terrain_gen import *
 
 
 class Chunk:
@@ -8,14 +7,17 @@ class Chunk:
         self.app = world.app
         self.world = world
         self.position = position
+        self.index = position[0] + WORLD_W * position[2] + WORLD_AREA * position[1]
         self.m_model = self.get_model_matrix()
-        self.voxels: np.array = None
         self.mesh: ChunkMesh = None
-        self.is_empty = True
 
         self.center = (glm.vec3(self.position) + 0.5) * CHUNK_SIZE
         self.is_on_frustum = self.app.player.camera.frustum.is_on_frustum
 
+    @property
+    def is_empty(self):
+        return self.world.storage.is_empty(self.index)
+
     def get_model_matrix(self):
         m_model = glm.translate(glm.mat4(), glm.vec3(self.position) * CHUNK_SIZE)
         return m_model
@@ -23,43 +25,24 @@ class Chunk:
     def set_uniform(self):
         self.mesh.program['m_model'].write(self.m_model)
 
-    def build_mesh(self):
-        self.mesh = ChunkMesh(self)
-
-    def render(self):
-        if not self.is_empty and self.is_on_frustum(self):
-            self.set_uniform()
-            self.mesh.render()
-
-    def render_see_through(self):
-        if not self.is_empty and self.is_on_frustum(self):
-            self.set_uniform()
-            self.mesh.render_see_through()
-
-    def build_voxels(self):
-        # empty chunk
-        voxels = np.zeros(CHUNK_VOL, dtype='uint8')
-
-        # fill chunk
-        cx, cy, cz = glm.ivec3(self.position) * CHUNK_SIZE
-        self.generate_terrain(voxels, cx, cy, cz)
-
-        if np.any(voxels):
-            self.is_empty = False
+    def build_mesh(self, sections):
+        # sections is the vertex data of every section, meshed on a worker thread
+        self.mesh = ChunkMesh(self, sections)
 
-        return voxels
+    def release_mesh(self):
+        if self.mesh:
+            self.mesh.release()
+            self.mesh = None
 
-    @staticmethod
-    @njit
-    def generate_terrain(voxels, cx, cy, cz):
-        for x in range(CHUNK_SIZE):
-            for z in range(CHUNK_SIZE):
-                wx = x + cx
-                wz = z + cz
-                world_height = get_height(wx, wz)
-                local_height = min(world_height - cy, CHUNK_SIZE)
+    @property
+    def is_drawn(self):
+        return self.mesh is not None and not self.is_empty
 
-                for y in range(local_height):
-                    wy = y + cy
-                    set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height)
+    def render(self):
+        # visible chunks only, culled by the world once per frame
+        self.set_uniform()
+        self.mesh.render()
 
+    def render_see_through(self):
+        self.set_uniform()
+        self.mesh.render_see_through()